@@ -1,18 +1,38 @@
 
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, g, request, jsonify, send_file, stream_with_context
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
+import copy
 import json
 import uuid
 import tempfile
 import os
 import re
+import time
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from typing import Optional
 from google import genai
 from google.genai import types
 from docx import Document
 import io
 from dotenv import load_dotenv
+from attorney_index import AttorneyIndex
+from cache import BlobCache, FirestoreCacheTier, SQLiteCacheTier, TieredCache, backing_tier_from_config, cache_key
+from intake_flow import got_letter_engine
+from jobs import FirestoreJobStore, InMemoryJobStore, JobQueue, SQLiteJobStore
+from intent_classifier import BagOfWordsModel, IntentClassifier
+from history_compaction import HistoryCompactor
+from docx_renderer import render_docx
+from document_sections import is_edit_request, join_document, looks_like_edit, match_sections, split_document
+from document_templates import default_additional_terms, find_template
+from uploads import DOCX_MIME_TYPE, UnsupportedUploadError, UploadRequest, read_upload
+from pdf_preprocessing import pages_as_text, prepare_pdf
+from request_pipeline import HistoryHints, RequestPipeline, same_turns
+from tracing import end_trace, in_context, record_llm_call, render_metrics, set_tag, span, start_trace
+from session_store import (KEEP, CachedSessionStore, FirestoreSessionStore, InMemorySessionStore, RedisSessionVersions,
+                           SegmentedFirestoreSessionStore, WriteBehindSessionStore)
 import firebase_admin
 from firebase_admin import credentials, firestore
 
@@ -32,14 +52,228 @@ except Exception as e:
 
 # Initialize Flask app
 app = Flask(__name__)
+app.request_class = UploadRequest
 CORS(app)
 
 # Configuration
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['UPLOAD_SPOOL_BYTES'] = int(os.getenv('UPLOAD_SPOOL_BYTES', str(16 * 1024 * 1024)))  # uploads up to this size stay in memory
+UploadRequest.upload_spool_bytes = app.config['UPLOAD_SPOOL_BYTES']
+app.config['EXPLANATION_TIMEOUT'] = float(os.getenv('EXPLANATION_TIMEOUT', '8'))  # seconds per explanation call
+app.config['EXPLANATION_MAX_WORKERS'] = int(os.getenv('EXPLANATION_MAX_WORKERS', '8'))
+app.config['EXPLANATION_MODE'] = os.getenv('EXPLANATION_MODE', 'parallel')  # "parallel" or "batched"
+app.config['LLM_CACHE_MAX_ENTRIES'] = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '2048'))
+app.config['LLM_CACHE_DIR'] = os.getenv('LLM_CACHE_DIR')  # optional on-disk tier
+app.config['LLM_CACHE_REDIS_URL'] = os.getenv('LLM_CACHE_REDIS_URL')  # optional Redis-compatible tier
+app.config['INTENT_CONFIDENCE_THRESHOLD'] = float(os.getenv('INTENT_CONFIDENCE_THRESHOLD', '0.8'))
+app.config['INTENT_MODEL_PATH'] = os.getenv('INTENT_MODEL_PATH')  # optional offline-trained bag-of-words model
+app.config['HISTORY_KEEP_TURNS'] = int(os.getenv('HISTORY_KEEP_TURNS', '6'))  # messages replayed verbatim
+app.config['HISTORY_TOKEN_BUDGET'] = int(os.getenv('HISTORY_TOKEN_BUDGET', '2000'))
+app.config['DOCX_CACHE_MEMORY_BYTES'] = int(os.getenv('DOCX_CACHE_MEMORY_BYTES', str(64 * 1024 * 1024)))
+app.config['DOCX_CACHE_DIR'] = os.getenv('DOCX_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'openlaw-docx-cache'))
+app.config['DOCX_CACHE_DIR_BYTES'] = int(os.getenv('DOCX_CACHE_DIR_BYTES', str(512 * 1024 * 1024)))
+app.config['ANALYSIS_CACHE_TTL'] = int(os.getenv('ANALYSIS_CACHE_TTL', str(7 * 24 * 3600)))
+app.config['ANALYSIS_CACHE_MAX_ENTRIES'] = int(os.getenv('ANALYSIS_CACHE_MAX_ENTRIES', '1000'))
+app.config['ANALYSIS_CACHE_BACKEND'] = os.getenv('ANALYSIS_CACHE_BACKEND', '')  # "", "sqlite" or "firestore"
+app.config['ANALYSIS_CACHE_SQLITE_PATH'] = os.getenv('ANALYSIS_CACHE_SQLITE_PATH', 'analysis_cache.sqlite3')
+app.config['PDF_TEXT_MODE'] = os.getenv('PDF_TEXT_MODE', 'auto')  # "auto" sends extracted text for text PDFs, "off" always sends the PDF
+app.config['PDF_PAGE_BUDGET'] = int(os.getenv('PDF_PAGE_BUDGET', '50'))  # pages sent to Gemini per document
+app.config['PDF_MIN_CHARS_PER_PAGE'] = int(os.getenv('PDF_MIN_CHARS_PER_PAGE', '200'))  # below this a PDF is treated as scanned
+app.config['PDF_WORKERS'] = int(os.getenv('PDF_WORKERS', '2'))
+app.config['PDF_PREPROCESS_TIMEOUT'] = float(os.getenv('PDF_PREPROCESS_TIMEOUT', '20'))
+app.config['CHUNKED_ANALYSIS'] = os.getenv('CHUNKED_ANALYSIS', 'on')  # "on" map-reduces documents over PDF_PAGE_BUDGET, "off" truncates them
+app.config['ANALYSIS_MAX_PAGES'] = int(os.getenv('ANALYSIS_MAX_PAGES', '500'))  # pages read at all in chunked mode
+app.config['ANALYSIS_CHUNK_PAGES'] = int(os.getenv('ANALYSIS_CHUNK_PAGES', '25'))
+app.config['ANALYSIS_CHUNK_CHARS'] = int(os.getenv('ANALYSIS_CHUNK_CHARS', '100000'))  # section size for Word and text uploads
+app.config['ANALYSIS_CHUNK_WORKERS'] = int(os.getenv('ANALYSIS_CHUNK_WORKERS', '4'))
+app.config['ANALYSIS_CHUNK_TIMEOUT'] = float(os.getenv('ANALYSIS_CHUNK_TIMEOUT', '90'))  # seconds for all chunks of one document
+app.config['SESSION_STORE'] = os.getenv('SESSION_STORE', 'segmented')  # "segmented", "firestore" (one history array) or "memory"
+app.config['SESSION_SEGMENT_SIZE'] = int(os.getenv('SESSION_SEGMENT_SIZE', '20'))  # turns per history segment document
+app.config['SESSION_HISTORY_TAIL'] = int(os.getenv('SESSION_HISTORY_TAIL', '40'))  # turns loaded per request
+app.config['SESSION_BLOB_THRESHOLD'] = int(os.getenv('SESSION_BLOB_THRESHOLD', '4000'))  # longer turn texts are stored once by hash
+app.config['SESSION_MEMORY_MAX_CHATS'] = int(os.getenv('SESSION_MEMORY_MAX_CHATS', '10000'))  # chats kept by the "memory" store
+app.config['SESSION_MEMORY_TTL'] = int(os.getenv('SESSION_MEMORY_TTL', str(24 * 3600)))  # idle seconds before it forgets a chat
+app.config['SESSION_WRITE_BEHIND'] = os.getenv('SESSION_WRITE_BEHIND', 'off')  # "on" writes chat turns after the response is sent
+# "on" keeps recently active chats in memory; with several instances also set SESSION_CACHE_REDIS_URL
+# (shared version checks) or route each chat to one instance
+app.config['SESSION_CACHE'] = os.getenv('SESSION_CACHE', 'off')
+app.config['SESSION_CACHE_MAX_ENTRIES'] = int(os.getenv('SESSION_CACHE_MAX_ENTRIES', '1000'))
+app.config['SESSION_CACHE_TTL'] = int(os.getenv('SESSION_CACHE_TTL', '900'))
+app.config['SESSION_CACHE_REDIS_URL'] = os.getenv('SESSION_CACHE_REDIS_URL')
+app.config['SEARCH_PIPELINE'] = os.getenv('SEARCH_PIPELINE', 'on')  # "on" overlaps /search's session load with the turn's likely next step
+app.config['SEARCH_PIPELINE_WORKERS'] = int(os.getenv('SEARCH_PIPELINE_WORKERS', '16'))
+app.config['SEARCH_PIPELINE_HINTS'] = int(os.getenv('SEARCH_PIPELINE_HINTS', '256'))  # chats whose last history is kept to speculate from
+app.config['DOCUMENT_TEMPLATES'] = os.getenv('DOCUMENT_TEMPLATES', 'on')  # "on" renders dummy-data drafts of common documents without Gemini
+# Drafting and upload analysis as background jobs: "request" when the request sends background=true,
+# "on" for every such request, "off" never
+app.config['BACKGROUND_JOBS'] = os.getenv('BACKGROUND_JOBS', 'request')
+app.config['JOB_STORE'] = os.getenv('JOB_STORE', 'sqlite')  # "sqlite", "firestore" or "memory"
+app.config['JOB_DB_PATH'] = os.getenv('JOB_DB_PATH', os.path.join(tempfile.gettempdir(), 'openlaw-jobs.sqlite3'))
+app.config['JOB_WORKERS'] = int(os.getenv('JOB_WORKERS', '4'))
+app.config['JOB_STALE_AFTER'] = int(os.getenv('JOB_STALE_AFTER', '900'))  # seconds before an unfinished job reads as failed
+app.config['JOB_TTL'] = int(os.getenv('JOB_TTL', str(24 * 3600)))
+app.config['JOB_EVENTS_TIMEOUT'] = int(os.getenv('JOB_EVENTS_TIMEOUT', '120'))  # longest a /jobs/<id>/events stream stays open
+app.config['DOCUMENT_EDITS'] = os.getenv('DOCUMENT_EDITS', 'on')  # "on" keeps drafted documents as sections and edits them in place
+app.config['EDIT_SECTION_WORKERS'] = int(os.getenv('EDIT_SECTION_WORKERS', '4'))  # concurrent section revisions per process
+app.config['GOT_LETTER_ENGINE'] = os.getenv('GOT_LETTER_ENGINE', 'on')  # "on" answers got-letter steps it can parse without Gemini
+app.config['TRACE_LOGS'] = os.getenv('TRACE_LOGS', 'on')  # "on" prints one JSON line with per-stage timings per request
+# Per-call-site TTLs in seconds; call sites missing here or set to 0 are never cached
+app.config['LLM_CACHE_TTLS'] = {
+    'goodbye': 600,
+    'parse_query': 600,
+    'explain_match': 3600,
+    'explain_matches_batched': 3600,
+    'document_requirements': 600,
+    'generate_title': 3600,
+    **json.loads(os.getenv('LLM_CACHE_TTLS', '{}')),
+}
 
 # Initialize Gemini AI (new SDK)
 client = genai.Client()
 
+# Cache for LLM responses, keyed by call site and normalized prompt
+llm_cache = TieredCache(
+    max_entries=app.config['LLM_CACHE_MAX_ENTRIES'],
+    backing=backing_tier_from_config(app.config['LLM_CACHE_DIR'], app.config['LLM_CACHE_REDIS_URL'], 'openlaw:llm:')
+)
+
+def llm_cache_key(call_site: str, contents, config=None, model: str = 'gemini-2.5-flash'):
+    """(key, ttl) for an LLM call, or (None, 0) when the call site or contents aren't cacheable"""
+    ttl = app.config['LLM_CACHE_TTLS'].get(call_site, 0)
+    if ttl <= 0 or not isinstance(contents, str):
+        return None, 0
+    response_mime_type = getattr(config, 'response_mime_type', None)
+    return cache_key(call_site, model, response_mime_type, " ".join(contents.split())), ttl
+
+def generate_text(call_site: str, contents, config=None, model: str = 'gemini-2.5-flash'):
+    """Call Gemini and return the response text, going through the LLM cache.
+
+    Text prompts from call sites with a positive TTL in LLM_CACHE_TTLS are
+    looked up by their whitespace-normalized form first; a hit skips the
+    network round-trip entirely.
+    """
+    key, ttl = llm_cache_key(call_site, contents, config, model)
+    if key is not None:
+        cached = llm_cache.get(key, namespace=call_site, ttl=ttl)
+        if cached is not None:
+            return cached
+
+    started = time.perf_counter()
+    response = client.models.generate_content(model=model, contents=contents, config=config)
+    record_llm_call(call_site, time.perf_counter() - started, response)
+    text = response.text
+    if key is not None and text:
+        llm_cache.set(key, text, ttl)
+    return text
+
+# Rendered DOCX bytes keyed by a hash of the markdown, also used as the download ETag
+DOCX_RENDER_VERSION = 1  # bump when create_docx output changes
+docx_cache = BlobCache(
+    max_memory_bytes=app.config['DOCX_CACHE_MEMORY_BYTES'],
+    spill_dir=app.config['DOCX_CACHE_DIR'],
+    max_spill_bytes=app.config['DOCX_CACHE_DIR_BYTES']
+)
+
+# Document analyses keyed by SHA-256 of the uploaded bytes and the prompt
+ANALYSIS_PROMPT_VERSION = 4  # bump when the analysis prompts, model or PDF pre-processing change
+analysis_backing = None
+try:
+    if app.config['ANALYSIS_CACHE_BACKEND'] == 'sqlite':
+        analysis_backing = SQLiteCacheTier(app.config['ANALYSIS_CACHE_SQLITE_PATH'], app.config['ANALYSIS_CACHE_MAX_ENTRIES'] * 10)
+    elif app.config['ANALYSIS_CACHE_BACKEND'] == 'firestore' and db:
+        analysis_backing = FirestoreCacheTier(db, 'analysis_cache')
+except Exception as e:
+    print(f"Could not initialize analysis cache backend: {e}")
+analysis_cache = TieredCache(max_entries=app.config['ANALYSIS_CACHE_MAX_ENTRIES'], backing=analysis_backing)
+
+# Local pre-classifier so greetings, goodbyes and flow triggers skip the intent LLM call
+intent_model = None
+if app.config['INTENT_MODEL_PATH']:
+    try:
+        intent_model = BagOfWordsModel.load(app.config['INTENT_MODEL_PATH'])
+    except Exception as e:
+        print(f"Could not load intent model: {e}")
+intent_classifier = IntentClassifier(threshold=app.config['INTENT_CONFIDENCE_THRESHOLD'], model=intent_model)
+
+# Keeps the history replayed into the intent prompt within a token budget
+history_compactor = HistoryCompactor(
+    keep_turns=app.config['HISTORY_KEEP_TURNS'],
+    token_budget=app.config['HISTORY_TOKEN_BUDGET']
+)
+
+def build_session_store(database):
+    """Chat history and flow state per SESSION_* config; process memory when database is None"""
+    if app.config['SESSION_STORE'] == 'segmented' and database:
+        store = SegmentedFirestoreSessionStore(
+            database, 'chats',
+            segment_size=app.config['SESSION_SEGMENT_SIZE'],
+            tail_turns=app.config['SESSION_HISTORY_TAIL'],
+            blob_threshold=app.config['SESSION_BLOB_THRESHOLD']
+        )
+    elif app.config['SESSION_STORE'] == 'firestore' and database:
+        store = FirestoreSessionStore(database, 'chats')
+    else:
+        store = InMemorySessionStore(
+            tail_turns=app.config['SESSION_HISTORY_TAIL'],
+            max_chats=app.config['SESSION_MEMORY_MAX_CHATS'],
+            ttl=app.config['SESSION_MEMORY_TTL']
+        )
+    if app.config['SESSION_WRITE_BEHIND'] == 'on':
+        store = WriteBehindSessionStore(store)
+    if app.config['SESSION_CACHE'] == 'on':
+        session_versions = None
+        try:
+            if app.config['SESSION_CACHE_REDIS_URL']:
+                session_versions = RedisSessionVersions(app.config['SESSION_CACHE_REDIS_URL'])
+        except Exception as e:
+            print(f"Could not initialize shared session versions: {e}")
+        store = CachedSessionStore(
+            store,
+            max_entries=app.config['SESSION_CACHE_MAX_ENTRIES'],
+            ttl=app.config['SESSION_CACHE_TTL'],
+            versions=session_versions
+        )
+    return store
+
+session_store = build_session_store(db)
+
+def build_job_store(database):
+    """Job table per JOB_STORE config; SQLite is shared by one host's workers, Firestore by every instance"""
+    if app.config['JOB_STORE'] == 'firestore' and database:
+        return FirestoreJobStore(database, 'jobs')
+    if app.config['JOB_STORE'] == 'sqlite':
+        return SQLiteJobStore(app.config['JOB_DB_PATH'])
+    return InMemoryJobStore()
+
+# Long drafting and analysis requests, run off the request workers when asked to
+job_queue = JobQueue(
+    build_job_store(db),
+    max_workers=app.config['JOB_WORKERS'],
+    stale_after=app.config['JOB_STALE_AFTER'],
+    ttl=app.config['JOB_TTL'],
+    log=app.config['TRACE_LOGS'] == 'on'
+)
+
+# Concurrent session loads and speculative work for /search, predicted from each chat's last known history
+search_pipeline = RequestPipeline(max_workers=app.config['SEARCH_PIPELINE_WORKERS'])
+history_hints = HistoryHints(
+    max_entries=app.config['SEARCH_PIPELINE_HINTS'],
+    # FirestoreSessionStore loads whole histories, the other stores only the tail
+    tail_turns=None if app.config['SESSION_STORE'] == 'firestore' and db else app.config['SESSION_HISTORY_TAIL']
+)
+
+# Deterministic got-letter steps; Gemini only sees the turns the extractors cannot parse
+got_letter_flow_engine = got_letter_engine()
+
+# Bounded pool for fanning out per-lawyer explanation calls
+explanation_pool = ThreadPoolExecutor(max_workers=app.config['EXPLANATION_MAX_WORKERS'], thread_name_prefix='explain')
+
+# Bounded pool for the per-chunk calls of large document analyses
+analysis_pool = ThreadPoolExecutor(max_workers=app.config['ANALYSIS_CHUNK_WORKERS'], thread_name_prefix='analyze')
+
+# Bounded pool for revising several sections of a drafted document at once
+edit_pool = ThreadPoolExecutor(max_workers=app.config['EDIT_SECTION_WORKERS'], thread_name_prefix='edit')
+
 # Load attorneys data
 try:
     with open('attorneys_data.json', 'r') as f:
@@ -76,6 +310,9 @@ STATE_MAP = {
     "wv": "west virginia", "wi": "wisconsin", "wy": "wyoming"
 }
 
+# Inverted index over the directory, built once at startup
+ATTORNEY_INDEX = AttorneyIndex(USERS_DB, STATE_MAP)
+
 # Specialty fallback mapping
 SPECIALTY_FALLBACK_MAP = {
     "divorce": ["family law"], "child custody": ["family law"], "child support": ["family law"],
@@ -86,8 +323,10 @@ SPECIALTY_FALLBACK_MAP = {
     "contract disputes": ["business law", "civil litigation"]
 }
 
-def generate_goodbye_message(history: list):
-    """Generate a personalized goodbye message using LLM"""
+GOODBYE_FALLBACK = "Thank you for using OpenLaw! If you need any further assistance with legal matters, please don't hesitate to reach out. Take care!"
+
+def goodbye_prompt(history: list):
+    """Prompt for a personalized goodbye message"""
     conversation_context = ""
     if len(history) > 1:
         # Get the last few exchanges for context
@@ -113,15 +352,17 @@ Conversation context:
 
 Generate a natural, conversational goodbye message:
 """
-    
+    return prompt
+
+def generate_goodbye_message(history: list):
+    """Generate a personalized goodbye message using LLM"""
     try:
-        response = client.models.generate_content(model='gemini-2.5-flash', contents=prompt)
-        return response.text.strip()
+        return generate_text('goodbye', goodbye_prompt(history)).strip()
     except Exception as e:
-        return "Thank you for using OpenLaw! If you need any further assistance with legal matters, please don't hesitate to reach out. Take care!"
+        return GOODBYE_FALLBACK
 
-def parse_query_with_gemini(history: list):
-    """Parse user query with Gemini AI to extract intent and filters"""
+def parse_query_prompt(history: list):
+    """Intent and filter extraction prompt for the latest message in history"""
     specialties_list = ", ".join(ALL_SPECIALTIES)
     nl_query = history[-1]['parts'][0]['text']
 
@@ -151,137 +392,43 @@ Return a plain JSON object. Do NOT format as code, markdown, or include backtick
 -- If the user says goodbye, bye, see you, take care, or similar farewell messages: {{"intent": "goodbye"}}
 -- Your name is "Ola", so if user asks your name, give a fun/witty response and them how you can help them.
 
-Here is the full conversation history for context:
-{json.dumps(history, indent=2)}
+Here is the recent conversation history for context (older turns and lawyer match lists are summarized):
+{history_compactor.compact(history, 'parse_query')}
 
 Query: "{nl_query}"
 """
+    return prompt
+
+def parse_intent_reply(response_text: str):
+    """Decode the JSON object returned for parse_query_prompt"""
+    cleaned_text = response_text.strip().strip("`")
+    if cleaned_text.startswith("json"):
+        cleaned_text = cleaned_text[4:].strip()
+    return json.loads(cleaned_text)
+
+def parse_query_with_gemini(history: list):
+    """Parse user query with Gemini AI to extract intent and filters"""
     try:
-        response = client.models.generate_content(model='gemini-2.5-flash', contents=prompt)
-        cleaned_text = response.text.strip().strip("`")
-        if cleaned_text.startswith("json"):
-            cleaned_text = cleaned_text[4:].strip()
-        return json.loads(cleaned_text)
+        response_text = generate_text('parse_query', parse_query_prompt(history))
+        return parse_intent_reply(response_text)
     except (json.JSONDecodeError, Exception) as e:
-        return {"error": str(e), "raw_response": response.text if 'response' in locals() else "No response"}
+        return {"error": str(e), "raw_response": response_text if 'response_text' in locals() else "No response"}
 
 def find_best_matches(filters):
     """Find the best lawyer matches by applying hard filters, then scoring and ranking"""
-    filtered_users = _apply_hard_filters(filters, USERS_DB)
-    scored_users = [(user, _score_user(user, filters)) for user in filtered_users]
-    if filters.get("location"):
-        scored_users = [(user, score) for user, score in scored_users if score > 0]
-    sorted_users = sorted(scored_users, key=lambda x: (x[1], x[0].get("rating", 0)), reverse=True)
-    return [user for user, score in sorted_users[:3]]
-
-def _apply_hard_filters(filters, db):
-    """Apply non-negotiable filters to the user list"""
-    users = db
-    
-    if filters.get("licenseState"):
-        filter_state = filters["licenseState"].lower()
-        users = [u for u in users if filter_state in [str(s).lower() for s in u.get("licenseState", [])]]
-
-    if filters.get("specialties"):
-        filter_specs = filters["specialties"]
-        if not isinstance(filter_specs, list):
-            filter_specs = [filter_specs]
-        filter_specs = [s.lower() for s in filter_specs if s]
-        if filter_specs:
-            users = [u for u in users if any(spec in [s.lower() for s in u.get("specialties", [])] for spec in filter_specs)]
-
-    if filters.get("hasCalendarConnected"):
-        users = [u for u in users if u.get("hasCalendarConnected")]
-
-    if filters.get("meetingTypes"):
-        filter_meeting_types = filters["meetingTypes"]
-        if not isinstance(filter_meeting_types, list):
-            filter_meeting_types = [filter_meeting_types]
-        filter_meeting_types = [m.lower() for m in filter_meeting_types if m]
-        if filter_meeting_types:
-            users = [u for u in users if any(m_type in [m.lower() for m in u.get("meetingTypes", [])] for m_type in filter_meeting_types)]
-
-    if filters.get("firm"):
-        filter_firm = filters["firm"].lower()
-        users = [u for u in users if filter_firm in u.get("firm", "").lower()]
-
-    if filters.get("languages"):
-        filter_languages = filters["languages"]
-        if not isinstance(filter_languages, list):
-            filter_languages = [filter_languages]
-        filter_languages = [language.lower() for language in filter_languages if language]
-        if filter_languages:
-            users = [u for u in users if any(language in [user_language.lower() for user_language in u.get("languages", [])] for language in filter_languages)]
-
-    return users
-
-def _score_user(user, filters):
-    """Score a single user based on weighted criteria"""
-    score = 0
-    
-    if filters.get("location"):
-        location_input = filters["location"]
-        location_query = str(location_input[0]).lower() if isinstance(location_input, list) and location_input else str(location_input).lower()
-        if location_query:
-            address = user.get("address", "").lower()
-            user_licenses = [str(s).lower() for s in user.get("licenseState", [])]
-            match = re.search(r"(?P<city>[\w\s.-]+?)\s*,\s*(?P<state>[a-z]{2})\b", address, re.IGNORECASE)
-            if match:
-                address_parts = {k: v.strip() for k, v in match.groupdict().items()}
-                addr_city, addr_state_abbr = address_parts.get("city", ""), address_parts.get("state", "")
-                addr_state_full = STATE_MAP.get(addr_state_abbr, "")
-                if location_query in addr_city and addr_state_full in user_licenses:
-                    score += 3
-            if location_query in user_licenses:
-                score += 2
-    
-    if filters.get("name") and user.get("name", "").lower() == filters["name"].lower():
-        score += 10
-    if filters.get("firstName") and user.get("firstName", "").lower() == filters["firstName"].lower():
-        score += 5
-    if filters.get("lastName") and user.get("lastName", "").lower() == filters["lastName"].lower():
-        score += 5
-    
-    if filters.get("rating"):
-        try:
-            if float(filters["rating"]) <= float(user.get("rating", 0)) < float(filters["rating"]) + 1:
-                score += 2
-        except (ValueError, TypeError):
-            pass
+    return ATTORNEY_INDEX.top_matches(filters, limit=3)
 
-    if filters.get("hasCalendarConnected") and user.get("hasCalendarConnected"):
-        score += 2
-    
-    if filters.get("meetingTypes"):
-        filter_types = filters["meetingTypes"]
-        if not isinstance(filter_types, list):
-            filter_types = [filter_types]
-        if any(m.lower() in [t.lower() for t in user.get("meetingTypes", [])] for m in filter_types):
-            score += 1
-    
-    if filters.get("firm") and filters["firm"].lower() in user.get("firm", "").lower():
-        score += 5
-
-    if filters.get("languages"):
-        filter_langs = filters["languages"]
-        if not isinstance(filter_langs, list):
-            filter_langs = [filter_langs]
-        if any(language.lower() in [ul.lower() for ul in user.get("languages", [])] for language in filter_langs):
-            score += 2
-
-    if filters.get("review_keywords"):
-        keywords = filters["review_keywords"]
-        if not isinstance(keywords, list):
-            keywords = [keywords]
-        review_content = user.get("reviewContent", "").lower()
-        for keyword in keywords:
-            if keyword.lower() in review_content:
-                score += 3
-            
-    return score
+EXPLANATION_FALLBACK = "This lawyer is a good match for your needs."
 
-def explain_top_match(user_query: str, top_lawyer: dict, filters: dict):
-    """Explain why a lawyer is a good match"""
+def explanation_config(**kwargs):
+    """Generation config for explanation calls, bounded by EXPLANATION_TIMEOUT"""
+    return types.GenerateContentConfig(
+        http_options=types.HttpOptions(timeout=int(app.config['EXPLANATION_TIMEOUT'] * 1000)),
+        **kwargs
+    )
+
+def explain_match_prompt(user_query: str, top_lawyer: dict, filters: dict):
+    """Prompt explaining why one lawyer is a good match"""
     fallback_applied = filters.get("fallback_applied", False)
     prompt = ""
     if fallback_applied:
@@ -297,13 +444,109 @@ Explain in 1–2 sentences why this lawyer is a good alternative match. Emphasiz
 You matched this lawyer:
 Name: {top_lawyer.get('name', 'N/A')}, State: {top_lawyer.get('licenseState', 'N/A')}, Specialty: {top_lawyer.get('specialties', 'N/A')}, Rating: {top_lawyer.get('rating', 'N/A')}
 Explain in 1 sentence why this lawyer is the best match for the user query. Don't repeat exact attributes. Be helpful and natural. Dont mention "user", talk in 2nd person."""
+    return prompt
+
+def explain_top_match(user_query: str, top_lawyer: dict, filters: dict):
+    """Explain why a lawyer is a good match"""
     try:
-        response = client.models.generate_content(model='gemini-2.5-flash', contents=prompt)
-        return response.text.strip().strip("`")
+        response_text = generate_text('explain_match', explain_match_prompt(user_query, top_lawyer, filters),
+                                      config=explanation_config())
+        return response_text.strip().strip("`")
     except Exception:
-        return "This lawyer is a good match for your needs."
+        return EXPLANATION_FALLBACK
+
+def explain_matches_batched_prompt(user_query: str, lawyers: list, filters: dict):
+    """One prompt asking for every lawyer's explanation as a JSON array"""
+    lawyer_lines = "\n".join(
+        f"- id: {i}, Name: {lawyer.get('name', 'N/A')}, State: {lawyer.get('licenseState', 'N/A')}, "
+        f"Specialty: {lawyer.get('specialties', 'N/A')}, Rating: {lawyer.get('rating', 'N/A')}"
+        for i, lawyer in enumerate(lawyers)
+    )
+    if filters.get("fallback_applied", False):
+        original_specialty = filters.get("original_specialties", ["the requested field"])[0]
+        fallback_specialty = filters.get("specialties", ["a related field"])[0]
+        instructions = f"""No exact matches were found for "{original_specialty}". These lawyers specialize in the related field of "{fallback_specialty}".
+For each lawyer, explain in 1–2 sentences why they are a good alternative match. Emphasize the connection between the original query and the lawyer's actual specialty. Be helpful and natural."""
+    else:
+        instructions = """For each lawyer, explain in 1 sentence why they are a good match for the user query. Don't repeat exact attributes. Be helpful and natural. Dont mention "user", talk in 2nd person."""
+
+    prompt = f"""A user wrote: "{user_query}"
+You matched these lawyers:
+{lawyer_lines}
+{instructions}
+
+Respond with ONLY a JSON array, one object per lawyer, in this exact format:
+[{{"id": 0, "explanation": "..."}}]
+"""
+    return prompt
+
+def parse_batched_explanations(response_text: str, explanations: list):
+    """Fill `explanations` in place from the JSON array reply to explain_matches_batched_prompt"""
+    response_text = response_text.strip()
+    start_idx = response_text.find('[')
+    end_idx = response_text.rfind(']') + 1
+    if start_idx == -1 or end_idx == 0:
+        raise ValueError("No JSON array found in response")
+    for item in json.loads(response_text[start_idx:end_idx]):
+        lawyer_id = int(item.get('id', -1))
+        explanation = str(item.get('explanation', '')).strip()
+        if 0 <= lawyer_id < len(explanations) and explanation:
+            explanations[lawyer_id] = explanation
+
+def explain_matches_batched(user_query: str, lawyers: list, filters: dict):
+    """Explain all matches with a single structured prompt.
+
+    Returns a list aligned with `lawyers`; entries the model did not return
+    (or the whole list, if the reply can't be parsed) are None.
+    """
+    explanations = [None] * len(lawyers)
+    try:
+        response_text = generate_text(
+            'explain_matches_batched',
+            explain_matches_batched_prompt(user_query, lawyers, filters),
+            config=explanation_config(response_mime_type='application/json')
+        )
+        parse_batched_explanations(response_text, explanations)
+    except Exception as e:
+        print(f"Batched explanation failed, falling back to per-lawyer calls: {e!r}")
+    return explanations
+
+def explain_matches(user_query: str, lawyers: list, filters: dict):
+    """Explain all matches, falling back per lawyer on failure or timeout.
+
+    EXPLANATION_MODE "batched" asks for every explanation in one call and only
+    sends per-lawyer prompts for the ones it could not get; "parallel" fans
+    out one prompt per lawyer concurrently.
+    """
+    if app.config['EXPLANATION_MODE'] == 'batched':
+        explanations = explain_matches_batched(user_query, lawyers, filters)
+    else:
+        explanations = [None] * len(lawyers)
+
+    pending = [(i, explanation_pool.submit(in_context(explain_top_match), user_query, lawyers[i], filters))
+               for i, explanation in enumerate(explanations) if explanation is None]
+    deadline = time.monotonic() + app.config['EXPLANATION_TIMEOUT']
+    for i, future in pending:
+        try:
+            explanations[i] = future.result(timeout=max(0, deadline - time.monotonic()))
+        except Exception as e:
+            print(f"Explanation for {lawyers[i].get('name', 'N/A')} failed: {e!r}")
+            future.cancel()
+            explanations[i] = EXPLANATION_FALLBACK
+
+    # The matches are the directory's own dicts, shared by concurrent requests: annotate copies
+    for i, explanation in enumerate(explanations):
+        lawyers[i] = {**lawyers[i], 'explanation': explanation}
 
 def handle_got_letter_flow(user_query: str, flow_context: dict, history: list):
+    """Got-letter flow turn: the step engine when it can parse the answer, otherwise Gemini"""
+    if app.config['GOT_LETTER_ENGINE'] == 'on':
+        result = got_letter_flow_engine.advance(user_query, flow_context)
+        if result is not None:
+            return result
+    return handle_got_letter_flow_llm(user_query, flow_context, history)
+
+def handle_got_letter_flow_llm(user_query: str, flow_context: dict, history: list):
     """Smart Gemini-powered handler for the got-letter flow"""
     step = flow_context.get('step', 1)
     data = flow_context.get('data', {})
@@ -361,8 +604,7 @@ Be smart about extracting information and handling edge cases. Ensure the JSON i
 """
     
     try:
-        response = client.models.generate_content(model='gemini-2.5-flash', contents=prompt)
-        response_text = response.text.strip()
+        response_text = generate_text('got_letter_flow', prompt).strip()
         
         # Try to extract JSON from the response
         try:
@@ -549,7 +791,55 @@ def handle_simple_got_letter_flow(user_query: str, flow_context: dict):
             'flow_context': {'step': 7, 'data': data}
         }
 
-def handle_document_drafting_flow(user_query: str, flow_context: dict, history: list):
+DUMMY_DATA_KEYWORDS = [
+    "dummy data", "placeholder data", "template", "sample", "example",
+    "standard template", "use dummy data", "with dummy data", "basic template"
+]
+
+def wants_dummy_data(user_query: str):
+    user_query_lower = user_query.lower()
+    return any(keyword in user_query_lower for keyword in DUMMY_DATA_KEYWORDS)
+
+def document_template(data: dict, history: list = None):
+    """Template for a dummy-data draft of a known document type, or None"""
+    if app.config['DOCUMENT_TEMPLATES'] != 'on' or not data.get('use_dummy_data'):
+        return None
+    recent_requests = [turn['parts'][0]['text'] for turn in reversed((history or [])[-6:]) if turn.get('role') == 'user']
+    return find_template(data.get('document_type'), *recent_requests)
+
+def render_template_document(template, data: dict):
+    """Fill a template locally; Gemini only drafts clauses for collected details the template has no place for"""
+    extra = template.extra_data(data)
+    additional_terms = None
+    if extra:
+        prompt = f"""
+You are customizing a {template.title} that was built from a standard template. The standard sections are already written.
+
+Draft the additional clauses needed to cover these details, which the standard sections do not:
+{json.dumps(extra, indent=2)}
+
+Write only the clauses, as a numbered markdown list with a blank line between items, in formal legal language. No heading, no introduction.
+"""
+        try:
+            additional_terms = generate_text('customize_template', prompt).strip()
+        except Exception as e:
+            print(f"Error customizing template: {e}")
+        additional_terms = additional_terms or default_additional_terms(extra)
+    return template.render(data, additional_terms)
+
+def draft_document(data: dict, history: list = None, defer_generation: bool = False):
+    """Generate the document now, or hand back what's needed to stream it later"""
+    template = document_template(data, history)
+    if template is not None:
+        # Rendered in a few milliseconds, so there is nothing to defer
+        set_tag('document_template', template.name)
+        with span('template'):
+            return {'document_content': render_template_document(template, data)}
+    if defer_generation:
+        return {'document_content': None, 'document_request': {'data': data, 'history': history}}
+    return {'document_content': generate_legal_document(data, history)}
+
+def handle_document_drafting_flow(user_query: str, flow_context: dict, history: list, defer_generation: bool = False):
     """Intelligent LLM-powered document drafting flow"""
     step = flow_context.get('step', 1)
     data = flow_context.get('data', {})
@@ -563,13 +853,13 @@ def handle_document_drafting_flow(user_query: str, flow_context: dict, history:
         # Check if user requested dummy data in the initial query
         if requirements.get('has_sufficient_info', False):
             # Generate the document immediately
-            document_content = generate_legal_document(data, history)
+            document = draft_document(data, history, defer_generation)
             flow_context['step'] = 3
             
             return {
                 'response': "Perfect! I'll generate your document right away.",
                 'should_end_flow': True,
-                'document_content': document_content,
+                **document,
                 'document_type': data.get('document_type', 'legal_document'),
                 'flow_context': flow_context
             }
@@ -585,23 +875,18 @@ def handle_document_drafting_flow(user_query: str, flow_context: dict, history:
     
     # Step 2: Gather additional information
     elif step == 2:
-        # Quick check for dummy data keywords in user response
-        dummy_keywords = [
-            "dummy data", "placeholder data", "template", "sample", "example", 
-            "standard template", "use dummy data", "with dummy data", "basic template",
-            "yes", "please", "okay", "sure"
-        ]
-        
-        user_query_lower = user_query.lower()
-        if any(keyword in user_query_lower for keyword in dummy_keywords):
+        # Quick check for dummy data keywords (or a plain go-ahead) in user response
+        if wants_dummy_data(user_query):
+            data['use_dummy_data'] = True
+        if data.get('use_dummy_data') or any(keyword in user_query.lower() for keyword in ["yes", "please", "okay", "sure"]):
             # Generate the document immediately with dummy data
-            document_content = generate_legal_document(data, history)
+            document = draft_document(data, history, defer_generation)
             flow_context['step'] = 3
             
             return {
                 'response': "Perfect! I'll generate your document right away.",
                 'should_end_flow': True,
-                'document_content': document_content,
+                **document,
                 'document_type': data.get('document_type', 'legal_document'),
                 'flow_context': flow_context
             }
@@ -641,8 +926,7 @@ Be conversational and professional. If the user provides multiple pieces of info
 """
         
         try:
-            response = client.models.generate_content(model='gemini-2.5-flash', contents=prompt)
-            response_text = response.text.strip()
+            response_text = generate_text('drafting_flow', prompt).strip()
             
             # Extract JSON
             start_idx = response_text.find('{')
@@ -658,13 +942,13 @@ Be conversational and professional. If the user provides multiple pieces of info
             # Check if we have sufficient information
             if result.get('has_sufficient_info', False):
                 # Generate the document
-                document_content = generate_legal_document(data, history)
+                document = draft_document(data, history, defer_generation)
                 flow_context['step'] = 3
                 
                 return {
                     'response': "Perfect! I have enough information to create your document. Let me generate it for you.",
                     'should_end_flow': True,
-                    'document_content': document_content,
+                    **document,
                     'document_type': data.get('document_type', 'legal_document'),
                     'flow_context': flow_context
                 }
@@ -682,20 +966,20 @@ Be conversational and professional. If the user provides multiple pieces of info
         except Exception as e:
             print(f"Error in document flow: {e}")
             # Fallback to simple flow
-            return handle_simple_drafting_flow(user_query, flow_context)
+            return handle_simple_drafting_flow(user_query, flow_context, defer_generation)
     
     # Step 3: Document generation (shouldn't normally reach here)
     else:
-        document_content = generate_legal_document(data, history)
+        document = draft_document(data, history, defer_generation)
         return {
             'response': "Here's your generated document!",
             'should_end_flow': True,
-            'document_content': document_content,
+            **document,
             'document_type': data.get('document_type', 'legal_document'),
             'flow_context': flow_context
         }
 
-def handle_simple_drafting_flow(user_query: str, flow_context: dict):
+def handle_simple_drafting_flow(user_query: str, flow_context: dict, defer_generation: bool = False):
     """Fallback simple document drafting flow handler"""
     step = flow_context.get('step', 1)
     data = flow_context.get('data', {})
@@ -703,11 +987,11 @@ def handle_simple_drafting_flow(user_query: str, flow_context: dict):
     # Check if user wants to proceed with standard terms
     if any(phrase in user_query.lower() for phrase in ['standard', 'no', 'not really', 'use standard', 'default']):
         # User wants to use standard terms, generate document
-        document_content = generate_legal_document(data)
+        document = draft_document(data, defer_generation=defer_generation)
         return {
             'response': "Perfect! I've drafted your document using standard terms and conditions. You can download it below:",
             'should_end_flow': True,
-            'document_content': document_content,
+            **document,
             'document_type': data.get('document_type', 'legal_document'),
             'flow_context': {'step': 4, 'data': data}
         }
@@ -729,17 +1013,17 @@ def handle_simple_drafting_flow(user_query: str, flow_context: dict):
     elif step == 3:
         data['terms'] = user_query
         # Generate the document
-        document_content = generate_legal_document(data)
+        document = draft_document(data, defer_generation=defer_generation)
         return {
             'response': "I've drafted your document! You can download it below:",
             'should_end_flow': True,
-            'document_content': document_content,
+            **document,
             'document_type': data.get('document_type', 'legal_document'),
             'flow_context': {'step': 4, 'data': data}
         }
 
-def generate_legal_document(data: dict, conversation_history: list = None):
-    """Generate a legal document using LLM based on collected data and conversation context"""
+def build_document_prompt(data: dict, conversation_history: list = None):
+    """Build the drafting prompt from collected data and conversation context"""
     
     # Build context from conversation history
     conversation_context = ""
@@ -786,26 +1070,146 @@ Document Requirements:
 
 Generate the complete legal document:
 """
-    
+    return prompt
+
+def generate_legal_document(data: dict, conversation_history: list = None):
+    """Generate a legal document using LLM based on collected data and conversation context"""
+    prompt = build_document_prompt(data, conversation_history)
     try:
-        response = client.models.generate_content(model='gemini-2.5-flash', contents=prompt)
-        return response.text.strip()
+        return generate_text('generate_document', prompt).strip()
     except Exception as e:
         return f"Error generating document: {e}"
 
+def stream_legal_document(data: dict, conversation_history: list = None):
+    """Yield the generated document in chunks as Gemini produces them"""
+    prompt = build_document_prompt(data, conversation_history)
+    started = time.perf_counter()
+    chunk = None
+    for chunk in client.models.generate_content_stream(model='gemini-2.5-flash', contents=prompt):
+        if chunk.text:
+            yield chunk.text
+    # The last chunk carries the usage totals for the whole stream
+    record_llm_call('stream_document', time.perf_counter() - started, chunk)
+
+def document_flow_context(document_type: str, document_content: str):
+    """Flow context that keeps a finished document editable section by section, or None"""
+    if app.config['DOCUMENT_EDITS'] != 'on' or not document_content:
+        return None
+    return {'name': 'edit_document', 'document': {'type': document_type, 'sections': split_document(document_content)}}
+
+def section_label(section: dict):
+    return section['heading'] or section['text'][:60].replace('\n', ' ').strip()
+
+def select_document_sections(document: dict, instruction: str):
+    """Ask Gemini which sections an edit touches, seeing only the outline; (indices, new heading) or None"""
+    outline = "\n".join(f"{i}. {section_label(section)}" for i, section in enumerate(document['sections']))
+    prompt = f"""
+You are routing an edit request for a {document['type']} to the sections it changes.
+
+Document outline (section number. heading or opening words):
+{outline}
+
+User's message: "{instruction}"
+
+Respond with ONLY a JSON object:
+{{
+    "is_edit": true/false (false if the message is not asking to change this document),
+    "sections": [numbers of the existing sections to rewrite],
+    "new_section": "heading of a section to add, or null if the change fits existing sections"
+}}
+"""
+    try:
+        response_text = generate_text('select_sections', prompt).strip()
+        result = json.loads(response_text[response_text.find('{'):response_text.rfind('}') + 1])
+    except Exception as e:
+        print(f"Error selecting document sections: {e}")
+        return None
+    indices = sorted({i for i in result.get('sections') or [] if isinstance(i, int) and 0 <= i < len(document['sections'])})
+    new_heading = result.get('new_section') or None
+    if not result.get('is_edit') or not (indices or new_heading):
+        return None
+    return indices, new_heading
+
+def revise_section(document: dict, index: int, instruction: str):
+    """Regenerate one section from its own text and the document outline; the rest is never sent"""
+    sections = document['sections']
+    section = sections[index]
+    outline = ", ".join(section_label(other) for other in sections if other is not section and other['heading'])
+    new = section['text'].strip() == f"## {section['heading']}"
+    prompt = f"""
+You are revising one section of a {document['type']}. The other sections stay exactly as they are.
+
+Other sections in the document: {outline or 'none'}
+
+{'New section to write (currently empty)' if new else 'Current section'}:
+{section['text']}
+
+Requested change: "{instruction}"
+
+Return ONLY the {'new' if new else 'revised'} section in the same markdown format, starting with its heading line unchanged (if it has one). Change only what the request requires and keep the document's legal style.
+"""
+    text = generate_text('edit_section', prompt).strip().strip('`').strip()
+    if text.startswith('markdown\n'):
+        text = text[len('markdown\n'):]
+    heading_line = section['text'].split('\n', 1)[0]
+    if section['heading'] and not text.startswith(heading_line):
+        text = f"{heading_line}\n\n{text}"
+    return text
+
+def handle_document_edit(user_query: str, flow_context: dict, history: list):
+    """Apply an edit request to the chat's last drafted document; None if the turn isn't one"""
+    document = flow_context.get('document') or {}
+    sections = document.get('sections') or []
+    if not sections or not is_edit_request(user_query, sections):
+        return None
+
+    targets = match_sections(sections, user_query)
+    new_heading = None
+    if not targets:
+        selection = select_document_sections(document, user_query)
+        if selection is None:
+            return None
+        targets, new_heading = selection
+    # Edit a copy, so a failed revision leaves the stored document as it was
+    edited = {**document, 'sections': list(sections)}
+    if new_heading:
+        # New sections go before the last one, which is normally the signature block
+        position = max(len(sections) - 1, 1)
+        edited['sections'].insert(position, {'heading': new_heading, 'text': f"## {new_heading}"})
+        targets = [i + 1 if i >= position else i for i in targets] + [position]
+
+    try:
+        if len(targets) == 1:
+            revisions = [revise_section(edited, targets[0], user_query)]
+        else:
+            futures = [edit_pool.submit(in_context(revise_section), edited, i, user_query) for i in targets]
+            revisions = [future.result() for future in futures]
+    except Exception as e:
+        print(f"Error revising document sections: {e}")
+        return {'response': "Sorry, I couldn't update the document just now. Please try again.",
+                'flow_context': flow_context}
+    sections = edited['sections']
+    for i, text in zip(targets, revisions):
+        sections[i] = {'heading': sections[i]['heading'], 'text': text}
+    document['sections'] = sections
+
+    changed = [section_label(sections[i]) for i in targets]
+    return {
+        'response': f"I've updated {', '.join(changed)}. You can download the revised document below:",
+        'document_content': join_document(sections),
+        'document_type': document.get('type', 'legal_document'),
+        'sections_changed': changed,
+        'flow_context': flow_context
+    }
+
 def determine_document_requirements(user_query: str, conversation_history: list = None):
     """Use LLM to intelligently determine what information is needed for document creation"""
     
     # Quick check for dummy data keywords
-    dummy_keywords = [
-        "dummy data", "placeholder data", "template", "sample", "example", 
-        "standard template", "use dummy data", "with dummy data", "basic template"
-    ]
-    
-    user_query_lower = user_query.lower()
-    if any(keyword in user_query_lower for keyword in dummy_keywords):
+    if wants_dummy_data(user_query):
+        template = find_template(user_query)
         return {
-            "document_type": "legal document",
+            "document_type": template.name if template else "legal document",
             "required_info": [],
             "next_question": "I'll generate your document with dummy data right away.",
             "extracted_data": {"use_dummy_data": True},
@@ -868,8 +1272,7 @@ Be specific about what information is needed for the document type.
 """
     
     try:
-        response = client.models.generate_content(model='gemini-2.5-flash', contents=prompt)
-        response_text = response.text.strip()
+        response_text = generate_text('document_requirements', prompt).strip()
         
         # Extract JSON from response
         start_idx = response_text.find('{')
@@ -890,114 +1293,259 @@ Be specific about what information is needed for the document type.
         }
 
 
-def create_docx(content, filename):
-    """Create a .docx file from content"""
-    import re
-    
+# PDF parsing runs in worker processes so it doesn't hold the GIL on request threads;
+# created on first use so each gunicorn worker gets its own pool after forking
+pdf_pool = None
+pdf_pool_lock = threading.Lock()
+
+def get_pdf_pool():
+    global pdf_pool
+    with pdf_pool_lock:
+        if pdf_pool is None:
+            pdf_pool = ProcessPoolExecutor(max_workers=app.config['PDF_WORKERS'])
+        return pdf_pool
+
+def reset_pdf_pool(pool):
+    """Kill a pool with a stuck or dead worker; the next upload creates a fresh one"""
+    global pdf_pool
+    with pdf_pool_lock:
+        if pdf_pool is pool:
+            pdf_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+    # A worker stuck in a pathological PDF never returns; ProcessPoolExecutor
+    # has no public way to stop it before Python 3.14
+    for process in list((getattr(pool, '_processes', None) or {}).values()):
+        process.terminate()
+
+def preprocess_pdf(upload):
+    """Run prepare_pdf for an upload in the worker pool; None if it fails or times out"""
+    pool = get_pdf_pool()
+    chunked = app.config['CHUNKED_ANALYSIS'] == 'on'
     try:
-        doc = Document()
-        
-        # Clean and process the content
-        if not content or not content.strip():
-            # Add a default message if content is empty
-            doc.add_paragraph("Document content is empty or could not be generated.")
-            buffer = io.BytesIO()
-            doc.save(buffer)
-            buffer.seek(0)
-            return buffer
-        
-        # Split content into paragraphs and add to document
-        paragraphs = content.split('\n\n')
-        for para in paragraphs:
-            if para.strip():
-                # Handle markdown formatting
-                if para.startswith('**') and para.endswith('**'):
-                    # Bold text
-                    p = doc.add_paragraph()
-                    p.add_run(para[2:-2]).bold = True
-                elif para.startswith('#'):
-                    # Heading
-                    level = len(para) - len(para.lstrip('#'))
-                    text = para.lstrip('#').strip()
-                    if level == 1:
-                        doc.add_heading(text, level=1)
-                    elif level == 2:
-                        doc.add_heading(text, level=2)
-                    else:
-                        doc.add_heading(text, level=3)
-                else:
-                    # Regular paragraph - handle inline markdown formatting
-                    text = para.strip()
-                    
-                    # Check if this is a numbered list item
-                    if re.match(r'^\d+\.\s', text):
-                        p = doc.add_paragraph()
-                        p.style = 'List Number'
-                        # Remove the number and dot from the text
-                        text = re.sub(r'^\d+\.\s', '', text)
-                    # Check if this is a bullet point
-                    elif text.startswith('* ') or text.startswith('- '):
-                        p = doc.add_paragraph()
-                        p.style = 'List Bullet'
-                        # Remove the bullet marker
-                        text = text[2:]
-                    else:
-                        p = doc.add_paragraph()
-                    
-                    # Process inline markdown formatting
-                    
-                    # First handle bold formatting
-                    bold_pattern = r'\*\*(.*?)\*\*'
-                    parts = re.split(bold_pattern, text)
-                    
-                    for i, part in enumerate(parts):
-                        if i % 2 == 0:  # Regular text - now check for italic
-                            if part:
-                                # Process italic formatting within regular text
-                                italic_pattern = r'\*(.*?)\*'
-                                italic_parts = re.split(italic_pattern, part)
-                                
-                                for j, italic_part in enumerate(italic_parts):
-                                    if j % 2 == 0:  # Regular text
-                                        if italic_part:
-                                            p.add_run(italic_part)
-                                    else:  # Italic text
-                                        if italic_part:
-                                            p.add_run(italic_part).italic = True
-                        else:  # Bold text (part is the text inside **)
-                            if part:
-                                # Check for italic within bold
-                                italic_pattern = r'\*(.*?)\*'
-                                italic_parts = re.split(italic_pattern, part)
-                                
-                                for j, italic_part in enumerate(italic_parts):
-                                    if j % 2 == 0:  # Bold text
-                                        if italic_part:
-                                            p.add_run(italic_part).bold = True
-                                    else:  # Bold and italic text
-                                        if italic_part:
-                                            run = p.add_run(italic_part)
-                                            run.bold = True
-                                            run.italic = True
-        
-        # Save to bytes buffer
-        buffer = io.BytesIO()
-        doc.save(buffer)
-        buffer.seek(0)
-        return buffer
-        
+        future = pool.submit(
+            prepare_pdf, upload.data, app.config['PDF_PAGE_BUDGET'], app.config['PDF_MIN_CHARS_PER_PAGE'],
+            max_pages=app.config['ANALYSIS_MAX_PAGES'] if chunked else None,
+            chunk_pages=app.config['ANALYSIS_CHUNK_PAGES'] if chunked else None
+        )
+        return future.result(timeout=app.config['PDF_PREPROCESS_TIMEOUT'])
+    except (TimeoutError, BrokenProcessPool) as e:
+        print(f"PDF pre-processing failed, restarting the PDF workers and sending the original file: {e!r}")
+        reset_pdf_pool(pool)
+        return None
+    except Exception as e:
+        print(f"PDF pre-processing failed, sending the original file: {e!r}")
+        return None
+
+def docx_text(upload):
+    """Paragraph text of an uploaded Word document"""
+    return "\n".join(p.text for p in Document(io.BytesIO(upload.data)).paragraphs)
+
+# document_parts' default for prepared: run preprocess_pdf itself
+PREPARE = object()
+
+def document_parts(upload, prepared=PREPARE):
+    """Gemini content parts for an uploaded document.
+
+    prepared is the preprocess_pdf result for PDFs when the caller already ran
+    it; None means it failed, so the original file is sent without retrying.
+    """
+    if upload.mime_type == DOCX_MIME_TYPE:
+        # Gemini doesn't take Word files inline, so send their text instead
+        return [docx_text(upload)]
+
+    if upload.mime_type == 'application/pdf' and app.config['PDF_TEXT_MODE'] == 'auto':
+        if prepared is PREPARE:
+            prepared = preprocess_pdf(upload)
+        if prepared and prepared['kind'] == 'text':
+            budget = app.config['PDF_PAGE_BUDGET']
+            note = ""
+            if min(prepared['pages_used'], budget) < prepared['page_count']:
+                note = f"[Showing the first {min(prepared['pages_used'], budget)} of {prepared['page_count']} pages]\n\n"
+            return [note + pages_as_text(prepared['pages'][:budget])]
+        if prepared and prepared['data']:
+            # Scanned PDF over the page budget: send only the first pages
+            note = f"[Showing the first {prepared['pages_used']} of {prepared['page_count']} pages]"
+            return [note, types.Part.from_bytes(data=prepared['data'], mime_type='application/pdf')]
+
+    return [types.Part.from_bytes(data=upload.data, mime_type=upload.mime_type)]
+
+def split_sections(text: str, max_chars: int):
+    """Split text into sections of at most max_chars, breaking between paragraphs where possible"""
+    sections, current = [], ""
+    for para in text.split("\n"):
+        while len(para) > max_chars:
+            if current:
+                sections.append(current)
+                current = ""
+            sections.append(para[:max_chars])
+            para = para[max_chars:]
+        if current and len(current) + len(para) + 1 > max_chars:
+            sections.append(current)
+            current = ""
+        current = f"{current}\n{para}" if current else para
+    if current.strip():
+        sections.append(current)
+    return sections
+
+def analysis_chunks(upload, prepared=None):
+    """Split a large upload into (label, content) chunks, or None if it fits in one request"""
+    if app.config['CHUNKED_ANALYSIS'] != 'on':
+        return None
+
+    if prepared and prepared['kind'] == 'text' and prepared['pages_used'] > app.config['PDF_PAGE_BUDGET']:
+        size = app.config['ANALYSIS_CHUNK_PAGES']
+        pages = prepared['pages']
+        return [(f"Pages {start + 1}-{min(start + size, len(pages))}", pages_as_text(pages[start:start + size], start + 1))
+                for start in range(0, len(pages), size)]
+
+    if prepared and prepared['kind'] == 'pdf' and prepared.get('chunks'):
+        size = app.config['ANALYSIS_CHUNK_PAGES']
+        return [(f"Pages {i * size + 1}-{min((i + 1) * size, prepared['pages_used'])}",
+                 types.Part.from_bytes(data=chunk, mime_type='application/pdf'))
+                for i, chunk in enumerate(prepared['chunks'])]
+
+    if upload.mime_type in (DOCX_MIME_TYPE, 'text/plain'):
+        max_chars = app.config['ANALYSIS_CHUNK_CHARS']
+        if len(upload) <= max_chars:  # bytes >= characters, so anything this small fits
+            return None
+        text = docx_text(upload) if upload.mime_type == DOCX_MIME_TYPE else upload.data.decode('utf-8', errors='replace')
+        if len(text) <= max_chars:
+            return None
+        sections = split_sections(text, max_chars)
+        return [(f"Section {i + 1} of {len(sections)}", section) for i, section in enumerate(sections)]
+
+    return None
+
+def analyze_chunk(label: str, content, chunk_count: int):
+    """Map step: summarize one chunk of a large document"""
+    prompt = (
+        f"You are a legal assistant. This is one part ({label}) of a document that was split into "
+        f"{chunk_count} parts because it is too long to read at once. Summarize what this part says in "
+        "2-4 sentences, focusing on anything legally significant: the kind of document, parties, "
+        "obligations, deadlines, amounts, and court or case details. If this part has no legal content, "
+        "say so in one sentence."
+    )
+    return generate_text('analyze_chunk', [content, prompt]).strip()
+
+def analyze_in_chunks(chunks: list, prompt: str, coverage: str = None):
+    """Map-reduce analysis of a large document.
+
+    Chunks are summarized concurrently on analysis_pool, then one more call
+    turns the summaries into the answer `prompt` asks for. A chunk that
+    fails or times out is left out of the reduce step instead of failing
+    the whole analysis; only if every chunk fails is an error raised.
+    coverage notes that the chunks are only part of the document; it is
+    passed to the reduce step and put at the top of the answer.
+    """
+    deadline = time.monotonic() + app.config['ANALYSIS_CHUNK_TIMEOUT']
+    futures = [analysis_pool.submit(in_context(analyze_chunk), label, content, len(chunks)) for label, content in chunks]
+    sections = []
+    for (label, _), future in zip(chunks, futures):
+        try:
+            summary = future.result(timeout=max(0, deadline - time.monotonic()))
+            sections.append({"label": label, "summary": summary or None})
+        except Exception as e:
+            future.cancel()
+            print(f"Analysis of {label} failed: {e!r}")
+            sections.append({"label": label, "summary": None})
+
+    summaries = [s for s in sections if s['summary']]
+    if not summaries:
+        raise RuntimeError("Could not analyze any part of the document")
+
+    missing = [s['label'] for s in sections if not s['summary']]
+    reduce_prompt = (
+        f"{prompt}\n\nThe document was too long to read at once, so each part was summarized separately. "
+        "Treat these summaries as the document:\n\n"
+        + "\n\n".join(f"{s['label']}: {s['summary']}" for s in summaries)
+    )
+    if missing:
+        reduce_prompt += f"\n\n(These parts could not be read: {', '.join(missing)}. Base the answer on the rest.)"
+    if coverage:
+        reduce_prompt += f"\n\n({coverage}; the rest of the document was not read. Say so in the answer.)"
+    try:
+        answer = generate_text('analyze_reduce', reduce_prompt)
+    except Exception as e:
+        # Keep the partial results rather than losing the whole analysis
+        print(f"Analysis reduce step failed: {e!r}")
+        answer = "\n\n".join(f"{s['label']}: {s['summary']}" for s in summaries)
+    if coverage:
+        answer = f"[{coverage}]\n\n{answer}"
+    return {"answer": answer, "sections": sections, "complete": not missing}
+
+def analyze_document(upload, prompt: str):
+    """Ask Gemini to analyze an uploaded document, reusing the answer for identical uploads.
+
+    Returns {"answer": ...}; documents too large for one request are
+    analyzed in chunks and also carry a per-section "sections" breakdown.
+    """
+    key = cache_key('analysis', ANALYSIS_PROMPT_VERSION, upload.sha256, prompt)
+    ttl = app.config['ANALYSIS_CACHE_TTL']
+    cached = analysis_cache.get(key, namespace='analyze_upload', ttl=ttl)
+    if cached is not None:
+        return cached
+
+    prepared = None
+    if upload.mime_type == 'application/pdf' and app.config['PDF_TEXT_MODE'] == 'auto':
+        prepared = preprocess_pdf(upload)
+    chunks = analysis_chunks(upload, prepared)
+    if chunks:
+        coverage = None
+        if prepared and prepared.get('truncated'):
+            coverage = f"Only the first {prepared['pages_used']} of {prepared['page_count']} pages were analyzed"
+        analysis = analyze_in_chunks(chunks, prompt, coverage)
+    else:
+        analysis = {"answer": generate_text('analyze_upload', [*document_parts(upload, prepared), prompt])}
+
+    # Partial chunked analyses aren't cached so a retry can fill the gaps
+    if analysis['answer'] and analysis.get('complete', True):
+        analysis_cache.set(key, analysis, ttl)
+    return analysis
+
+def create_docx(content, filename, target=None):
+    """Create a .docx file from content.
+
+    content may be a string or an iterable of text chunks. The document is
+    written to target (a path or binary file) when given, otherwise to a
+    new BytesIO which is returned.
+    """
+    buffer = target if target is not None else io.BytesIO()
+    try:
+        render_docx(content or '', buffer)
     except Exception as e:
         print(f"Error creating DOCX: {e}")
         # Create a fallback document
+        if hasattr(buffer, 'seek'):
+            buffer.seek(0)
+            buffer.truncate()
         doc = Document()
         doc.add_heading("Document Generation Error", level=1)
         doc.add_paragraph(f"An error occurred while generating the document: {str(e)}")
         doc.add_paragraph("Please try again or contact support if the issue persists.")
-        
-        buffer = io.BytesIO()
         doc.save(buffer)
+    if hasattr(buffer, 'seek'):
         buffer.seek(0)
-        return buffer
+    return buffer
+
+@app.before_request
+def start_request_trace():
+    g.trace, g.trace_token = start_trace(request.url_rule.rule if request.url_rule else 'unmatched')
+
+@app.after_request
+def add_server_timing(response):
+    trace = g.get('trace')
+    if trace is not None:
+        # Streamed responses get the stages finished before the body starts
+        response.headers['Server-Timing'] = trace.server_timing()
+        g.trace_status = response.status_code
+    return response
+
+@app.teardown_request
+def finish_request_trace(error=None):
+    trace = g.get('trace')
+    if trace is not None:
+        trace.finish(500 if error else g.get('trace_status', 500), app.config['TRACE_LOGS'] == 'on')
+        end_trace(g.trace_token)
 
 # Firebase is used for chat session storage
 from flask import request, jsonify
@@ -1007,193 +1555,391 @@ from google.genai import types
 
 # Assume `app`, `client`, `db`, `firestore`, and all handler functions are already defined
 
+def load_chat_session(chat_id: str):
+    """Return (history, flow_context) for a chat, empty for new chats or when the store is unavailable"""
+    if not chat_id:
+        return [], {}
+    try:
+        with span('session_load'):
+            history, flow_context = session_store.load(chat_id)
+        history_hints.remember(chat_id, history, flow_context)
+        return history, flow_context
+    except Exception as e:
+        print(f"Error loading chat session: {e}")
+        return [], {}
+
+def save_chat_session(chat_id: str, new_turns: list, flow_context=KEEP):
+    """Append this request's turns to a chat; flow_context None ends the active flow"""
+    try:
+        with span('session_save'):
+            session_store.append(chat_id, new_turns, flow_context)
+        history_hints.extend(chat_id, new_turns, flow_context)
+    except Exception as e:
+        print(f"Error saving chat session: {e}")
+
+def run_in_background():
+    """Whether this request's long work (drafting, upload analysis) should be queued as a job"""
+    mode = app.config['BACKGROUND_JOBS']
+    return mode == 'on' or (mode == 'request' and request.form.get('background') == 'true')
+
+def job_accepted(job: dict, chat_id: str = None):
+    """202 response pointing the client at a queued job"""
+    response_data = {
+        "job_id": job['id'],
+        "status": job['status'],
+        "status_url": f"/jobs/{job['id']}",
+        "events_url": f"/jobs/{job['id']}/events"
+    }
+    if chat_id:
+        response_data['chat_id'] = chat_id
+    return jsonify(response_data), 202
+
+def queue_turn_job(kind: str, turn, chat_id: str, new_turns: list, flow_context: dict):
+    """Queue a chat turn's long work as a job; turn() appends the reply and the final flow context.
+
+    The user's side of the turn is saved now, with a pending_job flow context
+    naming the job, so it isn't lost if the job fails or its process stops.
+    flow_context is the chat's flow context from before this turn changed
+    it; a job that fails, or can't be queued, puts the chat back to it.
+    """
+    previous = copy.deepcopy(flow_context) or None
+    job_id = uuid.uuid4().hex
+    save_chat_session(chat_id, new_turns, {'name': 'pending_job', 'job_id': job_id, 'kind': kind})
+
+    def run():
+        try:
+            return turn()
+        except Exception:
+            save_chat_session(chat_id, [], previous)
+            raise
+    try:
+        job = job_queue.submit(kind, run, meta={'chat_id': chat_id}, job_id=job_id)
+    except Exception:
+        save_chat_session(chat_id, [], previous)
+        raise
+    return job_accepted(job, chat_id)
+
+def sse_event(event: str, payload: dict):
+    """Format one Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+GOT_LETTER_START_TEXT = "I can help you with your OpenLaw case! To get started, could you please provide the reference number from your letter? You can find it in the URL, like this: https://olaw.io/YOUR_REFERENCE_NUMBER."
+DRAFT_START_TEXT = "I can help you draft a legal document! To create the most appropriate document for your needs, I'll need some details. What type of legal document are you looking to create? (e.g., contract, letter, notice, agreement, etc.)"
+DOCUMENT_READY_TEXT = "Perfect! I've drafted your document. You can download it below:"
+UPLOAD_ANALYSIS_PROMPT = (
+    "You are a legal assistant and are here to give legal advice. "
+    "Do not say you're an AI model. Read the document and determine:\n"
+    "- Is it a legal document (contract, notice, policy, court order, etc)? If yes, explain the document in 2–5 sentences."
+    "If it is clearly not a legal document, respond only with:\n"
+    "\"That does not look like a legal document, please upload a legal document.\""
+)
+
+def model_turn(text: str):
+    return {"role": "model", "parts": [{"text": text}]}
+
+def user_turn(text: str):
+    return {"role": "user", "parts": [{"text": text}]}
+
+def finish_got_letter_turn(flow_result: dict, history: list):
+    """Record a got-letter step's reply in history; returns (response_data, flow_context update)"""
+    response_text = flow_result['response']
+    should_end_flow = flow_result['should_end_flow']
+    completion_message = flow_result.get('completion_message', '')
+    response_data = {"answer": response_text}
+    history.append(model_turn(response_text))
+    if should_end_flow and completion_message:
+        history.append(model_turn(completion_message))
+        response_data["completion_message"] = completion_message
+    return response_data, None if should_end_flow else flow_result['flow_context']
+
+def finish_drafting_turn(flow_result: dict, history: list):
+    """Record a drafting step's reply in history; returns (response_data, flow_context update)"""
+    response_text = flow_result['response']
+    should_end_flow = flow_result['should_end_flow']
+    document_content = flow_result.get('document_content', '')
+    document_type = flow_result.get('document_type', 'legal_document')
+    response_data = {"answer": response_text}
+    history.append(model_turn(response_text))
+    if should_end_flow and document_content:
+        response_data.update({
+            "document_content": document_content,
+            "document_type": document_type,
+            "download_filename": f"{document_type.replace(' ', '_')}.docx",
+            "answer": DOCUMENT_READY_TEXT
+        })
+    if should_end_flow:
+        # A finished document stays editable; otherwise the flow just ends
+        return response_data, document_flow_context(document_type, document_content)
+    return response_data, flow_result['flow_context']
+
+def finish_document_edit_turn(flow_result: dict, history: list):
+    """Record a document edit's reply in history; returns (response_data, flow_context update)"""
+    response_text = flow_result['response']
+    response_data = {"answer": response_text}
+    history.append(model_turn(response_text))
+    if flow_result.get('document_content'):
+        document_type = flow_result['document_type']
+        response_data.update({
+            "document_content": flow_result['document_content'],
+            "document_type": document_type,
+            "download_filename": f"{document_type.replace(' ', '_')}.docx",
+            "sections_changed": flow_result['sections_changed']
+        })
+    return response_data, flow_result['flow_context']
+
+def intent_response(intent: str, parsed: dict):
+    """Canned reply for intents answered without matching (goodbye excluded), else None"""
+    intent_responses = {
+        "general_question": {
+            "answer": parsed.get("response"),
+            "message": "That sounds like a legal question. I can help you find a lawyer — Can you describe your case or what kind of lawyer you need and where."
+        },
+        "out-of-scope": {
+            "answer": parsed.get("witty_response", "I am having trouble understanding that, can you please rephrase? But I can help you with legal matters!")
+        },
+        "greeting": {
+            "answer": "Hi there! How can I help you?"
+        },
+        "out-of-area": {
+            "answer": "We're sorry, but we don't currently operate in your state. We're expanding and hope to be available in your area soon!",
+            "show_form": True
+        },
+        "document_help": {
+            "answer": "I understand you need help understanding a legal document. While I can provide general information and help you understand the document's content, it's important to note that for specific legal advice, you should consult with a qualified attorney who can review your unique situation.",
+            "disclaimer": "⚠️ **Important Disclaimer**: This AI assistance is for informational purposes only and should not be considered legal advice. For specific legal guidance, please consult with a qualified attorney.",
+            "encourage_upload": "To help you better, please upload your legal document using the file upload feature. I can then analyze the document and provide you with a general explanation of its contents, key terms, and what it might mean in plain language."
+        }
+    }
+    return intent_responses.get(intent)
+
+def match_lawyers(parsed: dict):
+    """Filters and top matches for a parsed query, widening to related specialties when nothing matches"""
+    filters = {k: v for k, v in parsed.items() if v}
+    top_matches = find_best_matches(filters)
+
+    if not top_matches and "specialties" in filters:
+        original_specialties = filters["specialties"]
+        if not isinstance(original_specialties, list):
+            original_specialties = [original_specialties]
+        fallback_specialties = [spec for s in original_specialties for spec in SPECIALTY_FALLBACK_MAP.get(s.lower(), [])]
+        if fallback_specialties:
+            fallback_filters = filters.copy()
+            fallback_filters["specialties"] = list(set(fallback_specialties))
+            top_matches = find_best_matches(fallback_filters)
+            if top_matches:
+                filters["fallback_applied"] = True
+                filters["original_specialties"] = original_specialties
+    return filters, top_matches
+
+def intent_tag(intent: str, parsed: dict):
+    """Intent label for request metrics, limited to the intents /search handles"""
+    if intent in ("got-letter", "draft_document", "near_me", "goodbye") or intent_response(intent, parsed) is not None:
+        return intent
+    return "error" if "error" in parsed else "search"
+
+def likely_needs_intent(flow_name, query: str):
+    """Whether a turn in this flow probably goes through the intent parse: no flow, or no edit of a drafted document"""
+    if flow_name == 'edit_document':
+        return not looks_like_edit(query)
+    return flow_name is None
+
+def likely_needs_analysis(flow_name):
+    """Whether an upload in this flow probably reaches the document analysis: the got-letter and drafting flows take it"""
+    return flow_name not in ('got-letter', 'draft_document')
+
+def start_search_turn(query: str, chat_id: str, upload):
+    """Start loading a chat's session and, speculatively, the work its turn most likely needs.
+
+    Returns (session future or None, Speculation or None). An upload is
+    analyzed while the session loads, when the chat's hinted flow won't take it. A text turn the local classifier
+    can't answer gets its Gemini intent parse started from the chat's
+    hinted history, so the parse no longer waits for the load. The caller
+    discards the speculation if the loaded flow_context routes the turn
+    into a flow, and the intent parse also if the loaded history differs
+    from the one it was computed from.
+    """
+    if app.config['SEARCH_PIPELINE'] != 'on' or not chat_id:
+        return None, None
+    session = search_pipeline.submit(load_chat_session, chat_id)
+    hint = history_hints.get(chat_id)
+    if upload is not None:
+        if hint is not None and likely_needs_analysis(hint[1]):
+            return session, search_pipeline.speculate('analysis', analyze_document, upload, UPLOAD_ANALYSIS_PROMPT)
+        return session, None
+    if query and hint is not None and likely_needs_intent(hint[1], query) and not intent_classifier.would_handle(query):
+        hinted_history, _ = hint
+        return session, search_pipeline.speculate(
+            'parse_query', parse_query_with_gemini, hinted_history + [user_turn(query)], basis=hinted_history
+        )
+    return session, None
+
+def parse_turn_intent(history: list, speculation=None):
+    """Gemini intent parse for the turn, reusing a speculative one computed from the same history"""
+    if speculation is not None:
+        if speculation.name == 'parse_query' and same_turns(speculation.basis, history[:-1]):
+            return speculation.take()
+        speculation.discard()
+    return parse_query_with_gemini(history)
+
 @app.route('/search', methods=['POST'])
-def search_users():
-    """Main search endpoint"""
+def search_users(loaded=None):
+    """Main search endpoint; loaded is the chat's (history, flow_context) when the caller already read it"""
     try:
         query = request.form.get('query')
         chat_id = request.form.get('chat_id')
         file = request.files.get('file')
-
-        # Initialize or get chat session from Firebase
-        history = []
-        flow_context = {}
-        if chat_id and db:
+        upload, upload_error = None, None
+        if file:
             try:
-                chat_ref = db.collection('chats').document(chat_id)
-                chat_doc = chat_ref.get()
-                if chat_doc.exists:
-                    chat_data = chat_doc.to_dict()
-                    history = chat_data.get('history', [])
-                    flow_context = chat_data.get('flow_context', {})
-            except Exception as e:
-                print(f"Error accessing Firebase: {e}")
+                upload = read_upload(file)
+            except UnsupportedUploadError as e:
+                upload_error = e
+
+        # Initialize or get chat session from the session store, overlapped with the likely next step
+        if loaded is not None:
+            session, speculation = None, None
+            history, flow_context = loaded
+        else:
+            session, speculation = start_search_turn(query, chat_id, upload)
+            history, flow_context = session.result() if session else load_chat_session(chat_id)
+        loaded_turns = len(history)
 
         # Handle active flow sessions
+        if speculation is not None and flow_context.get('name') in ('got-letter', 'draft_document'):
+            speculation.discard()
         if flow_context.get('name') == 'got-letter':
-            flow_result = handle_got_letter_flow(query, flow_context, history)
-            response_text = flow_result['response']
-            should_end_flow = flow_result['should_end_flow']
-            completion_message = flow_result.get('completion_message', '')
-            response_data = {"answer": response_text}
-
-            history.append({"role": "user", "parts": [{"text": query}]})
-            history.append({"role": "model", "parts": [{"text": response_text}]})
-            if should_end_flow and completion_message:
-                history.append({"role": "model", "parts": [{"text": completion_message}]})
-                response_data["completion_message"] = completion_message
-
-            if db:
-                try:
-                    db_update = {'history': history}
-                    db_update['flow_context'] = firestore.DELETE_FIELD if should_end_flow else flow_result['flow_context']
-                    db.collection('chats').document(chat_id).set(db_update, merge=True)
-                except Exception as e:
-                    print(f"Error saving to Firebase: {e}")
+            set_tag('intent', 'got-letter')
+            with span('flow'):
+                flow_result = handle_got_letter_flow(query, flow_context, history)
+            history.append(user_turn(query))
+            response_data, new_flow_context = finish_got_letter_turn(flow_result, history)
+            save_chat_session(chat_id, history[loaded_turns:], new_flow_context)
 
             response_data['chat_id'] = chat_id
             return jsonify(response_data)
 
         elif flow_context.get('name') == 'draft_document':
-            flow_result = handle_document_drafting_flow(query, flow_context, history)
-            response_text = flow_result['response']
-            should_end_flow = flow_result['should_end_flow']
-            document_content = flow_result.get('document_content', '')
-            document_type = flow_result.get('document_type', 'legal_document')
-
-            response_data = {"answer": response_text}
-            history.append({"role": "user", "parts": [{"text": query}]})
-            history.append({"role": "model", "parts": [{"text": response_text}]})
-
-            if should_end_flow and document_content:
-                response_data.update({
-                    "document_content": document_content,
-                    "document_type": document_type,
-                    "download_filename": f"{document_type.replace(' ', '_')}.docx",
-                    "answer": "Perfect! I've drafted your document. You can download it below:"
-                })
-
-            if db:
-                try:
-                    db_update = {'history': history}
-                    db_update['flow_context'] = firestore.DELETE_FIELD if should_end_flow else flow_result['flow_context']
-                    db.collection('chats').document(chat_id).set(db_update, merge=True)
-                except Exception as e:
-                    print(f"Error saving to Firebase: {e}")
+            set_tag('intent', 'draft_document')
+            # The flow handler updates flow_context in place; a failed drafting job restores this
+            previous_flow_context = copy.deepcopy(flow_context)
+            with span('flow'):
+                flow_result = handle_document_drafting_flow(query, flow_context, history,
+                                                            defer_generation=run_in_background())
+            history.append(user_turn(query))
+
+            def finish_turn(saved_turns: int):
+                response_data, new_flow_context = finish_drafting_turn(flow_result, history)
+                save_chat_session(chat_id, history[saved_turns:], new_flow_context)
+                response_data['chat_id'] = chat_id
+                return response_data
+
+            document_request = flow_result.get('document_request')
+            if document_request:
+                # The document is written by a job; its result is this turn's response
+                saved_turns = len(history)
+
+                def draft_turn():
+                    flow_result['document_content'] = generate_legal_document(document_request['data'],
+                                                                              document_request['history'])
+                    return finish_turn(saved_turns)
+                return queue_turn_job('draft_document', draft_turn, chat_id, history[loaded_turns:],
+                                      previous_flow_context)
+            return jsonify(finish_turn(loaded_turns))
+
+        elif flow_context.get('name') == 'edit_document' and query:
+            # Anything that isn't an edit of the drafted document is handled as a normal turn below
+            with span('flow'):
+                flow_result = handle_document_edit(query, flow_context, history)
+            if flow_result is not None:
+                if speculation is not None:
+                    speculation.discard()
+                set_tag('intent', 'edit_document')
+                history.append(user_turn(query))
+                response_data, new_flow_context = finish_document_edit_turn(flow_result, history)
+                save_chat_session(chat_id, history[loaded_turns:], new_flow_context)
 
-            response_data['chat_id'] = chat_id
-            return jsonify(response_data)
+                response_data['chat_id'] = chat_id
+                return jsonify(response_data)
 
         # Handle file-only uploads (document analysis)
         if query is None and file:
             query = "Please analyze this legal document"
 
         if file:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-                file.save(tmp.name)
-                tmp_path = tmp.name
+            if upload_error is not None:
+                return jsonify({"error": str(upload_error)}), 415
 
-            try:
-                prompt = (
-                    "You are a legal assistant and are here to give legal advice. "
-                    "Do not say you're an AI model. Read the document and determine:\n"
-                    "- Is it a legal document (contract, notice, policy, court order, etc)? If yes, explain the document in 2–5 sentences."
-                    "If it is clearly not a legal document, respond only with:\n"
-                    "\"That does not look like a legal document, please upload a legal document.\""
-                )
-
-                response = client.models.generate_content(
-                    model='gemini-2.5-flash',
-                    contents=[
-                        types.Part.from_bytes(
-                            data=open(tmp_path, "rb").read(),
-                            mime_type='application/pdf'
-                        ),
-                        prompt
-                    ]
-                )
-
-                analysis_result = response.text.strip().strip("`")
-                response_data = {"answer": analysis_result}
+            set_tag('intent', 'upload')
+            breakdown = request.form.get('breakdown') == 'true'
+            if not chat_id:
+                chat_id = str(uuid.uuid4())
 
-                if not chat_id:
-                    chat_id = str(uuid.uuid4())
-                response_data['chat_id'] = chat_id
+            history.append(user_turn(f"Uploaded document: {upload.filename}"))
 
-                history.append({"role": "user", "parts": [{"text": f"Uploaded document: {file.filename}"}]})
-                history.append({"role": "model", "parts": [{"text": analysis_result}]})
+            def analyze_upload_turn(saved_turns: int, new_flow_context=KEEP):
+                with span('analysis'):
+                    if speculation is not None:
+                        analysis = speculation.take()
+                    else:
+                        analysis = analyze_document(upload, UPLOAD_ANALYSIS_PROMPT)
+
+                analysis_result = analysis['answer'].strip().strip("`")
+                response_data = {"answer": analysis_result}
+                if analysis.get('sections') and breakdown:
+                    response_data['sections'] = analysis['sections']
+                response_data['chat_id'] = chat_id
 
-                if db:
-                    try:
-                        db.collection('chats').document(chat_id).set({'history': history}, merge=True)
-                    except Exception as e:
-                        print(f"Error saving to Firebase: {e}")
+                history.append(model_turn(analysis_result))
 
-                return jsonify(response_data)
+                save_chat_session(chat_id, history[saved_turns:], new_flow_context)
+                return response_data
 
+            if run_in_background():
+                saved_turns = len(history)
+                return queue_turn_job('analysis', lambda: analyze_upload_turn(saved_turns, flow_context or None), chat_id,
+                                      history[loaded_turns:], flow_context)
+            try:
+                return jsonify(analyze_upload_turn(loaded_turns))
             except Exception as e:
                 return jsonify({"error": f"Failed to analyze file: {str(e)}"}), 500
-            finally:
-                os.unlink(tmp_path)
 
         # Handle pure text-based queries (intent classification, matching, flows, etc.)
         if not query:
             return jsonify({"error": "No query or file provided"}), 400
 
-        user_message = {"role": "user", "parts": [{"text": query}]}
-        history.append(user_message)
+        history.append(user_turn(query))
 
-        parsed = parse_query_with_gemini(history)
+        with span('intent'):
+            parsed = intent_classifier.classify(query) or parse_turn_intent(history, speculation)
         intent = parsed.get("intent")
+        set_tag('intent', intent_tag(intent, parsed))
 
         # Handle flows from scratch
         if intent == "got-letter":
+            new_flow_context = {'name': 'got-letter', 'step': 1, 'data': {}}
             if any(word in query.lower() for word in ['ref', 'reference', 'olaw.io', 'https://']):
-                new_flow_context = {'name': 'got-letter', 'step': 1, 'data': {}}
-                flow_result = handle_got_letter_flow(query, new_flow_context, history)
-                response_text = flow_result['response']
-                should_end_flow = flow_result['should_end_flow']
-                completion_message = flow_result.get('completion_message', '')
+                with span('flow'):
+                    flow_result = handle_got_letter_flow(query, new_flow_context, history)
             else:
-                response_text = "I can help you with your OpenLaw case! To get started, could you please provide the reference number from your letter? You can find it in the URL, like this: https://olaw.io/YOUR_REFERENCE_NUMBER."
-                should_end_flow = False
-                completion_message = ""
-                new_flow_context = {'name': 'got-letter', 'step': 1, 'data': {}}
+                flow_result = {'response': GOT_LETTER_START_TEXT, 'should_end_flow': False, 'flow_context': new_flow_context}
 
-            response_data = {"answer": response_text}
             if not chat_id:
                 chat_id = str(uuid.uuid4())
-            history.append({"role": "model", "parts": [{"text": response_text}]})
-
-            if should_end_flow and completion_message:
-                history.append({"role": "model", "parts": [{"text": completion_message}]})
-                response_data["completion_message"] = completion_message
-
-            if db:
-                try:
-                    db_update = {'history': history}
-                    db_update['flow_context'] = firestore.DELETE_FIELD if should_end_flow else new_flow_context
-                    db.collection('chats').document(chat_id).set(db_update, merge=True)
-                except Exception as e:
-                    print(f"Error saving to Firebase: {e}")
+            response_data, new_flow_context = finish_got_letter_turn(flow_result, history)
+            save_chat_session(chat_id, history[loaded_turns:], new_flow_context)
 
             response_data['chat_id'] = chat_id
             return jsonify(response_data)
 
         elif intent == "draft_document":
-            response_text = "I can help you draft a legal document! To create the most appropriate document for your needs, I'll need some details. What type of legal document are you looking to create? (e.g., contract, letter, notice, agreement, etc.)"
-            response_data = {"answer": response_text}
+            response_data = {"answer": DRAFT_START_TEXT}
             if not chat_id:
                 chat_id = str(uuid.uuid4())
 
             new_flow_context = {'name': 'draft_document', 'step': 1, 'data': {}}
-            history.append({"role": "model", "parts": [{"text": response_text}]})
+            history.append(model_turn(DRAFT_START_TEXT))
 
-            if db:
-                try:
-                    db.collection('chats').document(chat_id).set({'history': history, 'flow_context': new_flow_context}, merge=True)
-                except Exception as e:
-                    print(f"Error saving to Firebase: {e}")
+            save_chat_session(chat_id, history[loaded_turns:], new_flow_context)
 
             response_data['chat_id'] = chat_id
             return jsonify(response_data)
@@ -1201,73 +1947,27 @@ def search_users():
         if intent == "near_me":
             return jsonify({"intent": "near_me"})
 
-        intent_responses = {
-            "general_question": {
-                "answer": parsed.get("response"),
-                "message": "That sounds like a legal question. I can help you find a lawyer — Can you describe your case or what kind of lawyer you need and where."
-            },
-            "out-of-scope": {
-                "answer": parsed.get("witty_response", "I am having trouble understanding that, can you please rephrase? But I can help you with legal matters!")
-            },
-            "greeting": {
-                "answer": "Hi there! How can I help you?"
-            },
-            "out-of-area": {
-                "answer": "We're sorry, but we don't currently operate in your state. We're expanding and hope to be available in your area soon!",
-                "show_form": True
-            },
-            "document_help": {
-                "answer": "I understand you need help understanding a legal document. While I can provide general information and help you understand the document's content, it's important to note that for specific legal advice, you should consult with a qualified attorney who can review your unique situation.",
-                "disclaimer": "⚠️ **Important Disclaimer**: This AI assistance is for informational purposes only and should not be considered legal advice. For specific legal guidance, please consult with a qualified attorney.",
-                "encourage_upload": "To help you better, please upload your legal document using the file upload feature. I can then analyze the document and provide you with a general explanation of its contents, key terms, and what it might mean in plain language."
-            },
-            "goodbye": {
-                "answer": "generate_goodbye_message"
-            }
-        }
-
-        if intent in intent_responses:
-            if intent == "goodbye":
-                # Generate dynamic goodbye message
-                goodbye_message = generate_goodbye_message(history)
-                response_data = {"query": query, "answer": goodbye_message}
-            else:
-                response_data = {"query": query, **intent_responses[intent]}
+        if intent == "goodbye":
+            # Generate dynamic goodbye message
+            response_data = {"query": query, "answer": generate_goodbye_message(history)}
+        elif intent_response(intent, parsed) is not None:
+            response_data = {"query": query, **intent_response(intent, parsed)}
         elif "error" in parsed:
             response_data = parsed
         else:
-            filters = {k: v for k, v in parsed.items() if v}
-            top_matches = find_best_matches(filters)
-
-            if not top_matches and "specialties" in filters:
-                original_specialties = filters["specialties"]
-                if not isinstance(original_specialties, list):
-                    original_specialties = [original_specialties]
-                fallback_specialties = [spec for s in original_specialties for spec in SPECIALTY_FALLBACK_MAP.get(s.lower(), [])]
-                if fallback_specialties:
-                    fallback_filters = filters.copy()
-                    fallback_filters["specialties"] = list(set(fallback_specialties))
-                    top_matches = find_best_matches(fallback_filters)
-                    if top_matches:
-                        filters["fallback_applied"] = True
-                        filters["original_specialties"] = original_specialties
-
+            with span('match'):
+                filters, top_matches = match_lawyers(parsed)
             if top_matches:
-                for lawyer in top_matches:
-                    lawyer['explanation'] = explain_top_match(query, lawyer, filters)
+                with span('explain'):
+                    explain_matches(query, top_matches, filters)
 
             response_data = {"query": query, "filters_applied": filters, "matches": top_matches}
 
-        ai_response_text = json.dumps(response_data)
-        history.append({"role": "model", "parts": [{"text": ai_response_text}]})
+        history.append(model_turn(json.dumps(response_data)))
 
         if not chat_id:
             chat_id = str(uuid.uuid4())
-        if db:
-            try:
-                db.collection('chats').document(chat_id).set({'history': history}, merge=True)
-            except Exception as e:
-                print(f"Error saving to Firebase: {e}")
+        save_chat_session(chat_id, history[loaded_turns:])
 
         response_data['chat_id'] = chat_id
         return jsonify(response_data)
@@ -1276,6 +1976,81 @@ def search_users():
         return jsonify({"error": f"Unexpected error: {str(e)}"}), 500
 
 
+@app.route('/search/stream', methods=['POST'])
+def search_users_stream():
+    """Streaming variant of /search for the drafting flow.
+
+    Drafting turns that produce a document are answered as Server-Sent
+    Events: a "message" event with the answer, "chunk" events carrying the
+    document text as Gemini generates it, then a "done" event with
+    document_type, download_filename and chat_id. Chat history is written
+    once, when the stream finishes. Every other turn is handled by /search
+    and delivered as a single "done" event.
+    """
+    query = request.form.get('query')
+    chat_id = request.form.get('chat_id')
+    history, flow_context = load_chat_session(chat_id)
+    loaded_turns = len(history)
+
+    if flow_context.get('name') != 'draft_document' or not query or request.files.get('file'):
+        result = search_users(loaded=(history, flow_context))
+        response, status = result if isinstance(result, tuple) else (result, result.status_code)
+        event = 'done' if status < 400 else 'error'
+        return Response(sse_event(event, response.get_json()), status=status, mimetype='text/event-stream')
+
+    try:
+        flow_result = handle_document_drafting_flow(query, flow_context, history, defer_generation=True)
+    except Exception as e:
+        return Response(sse_event('error', {"error": f"Unexpected error: {str(e)}"}), status=500, mimetype='text/event-stream')
+
+    response_text = flow_result['response']
+    should_end_flow = flow_result['should_end_flow']
+    document_request = flow_result.get('document_request')
+    document_content = flow_result.get('document_content')
+    document_type = flow_result.get('document_type', 'legal_document')
+    history.append({"role": "user", "parts": [{"text": query}]})
+
+    @stream_with_context
+    def generate():
+        if not (should_end_flow and (document_request or document_content)):
+            history.append({"role": "model", "parts": [{"text": response_text}]})
+            save_chat_session(chat_id, history[loaded_turns:], None if should_end_flow else flow_result['flow_context'])
+            yield sse_event('done', {"answer": response_text, "chat_id": chat_id})
+            return
+
+        answer = DOCUMENT_READY_TEXT
+        yield sse_event('message', {"answer": answer, "document_type": document_type})
+        chunks = []
+        try:
+            # Template drafts are already complete and go out as a single chunk
+            chunks_source = [document_content] if document_content else stream_legal_document(document_request['data'], document_request['history'])
+            for chunk in chunks_source:
+                chunks.append(chunk)
+                yield sse_event('chunk', {"text": chunk})
+        except Exception as e:
+            print(f"Error streaming document: {e}")
+            # Keep the request in the chat; the flow stays where it was, so resending it retries the document
+            save_chat_session(chat_id, history[loaded_turns:])
+            yield sse_event('error', {"error": f"Error generating document: {e}", "chat_id": chat_id})
+            return
+
+        content = "".join(chunks).strip()
+        history.append({"role": "model", "parts": [{"text": response_text}]})
+        save_chat_session(chat_id, history[loaded_turns:], document_flow_context(document_type, content))
+        yield sse_event('done', {
+            "answer": answer,
+            "document_content": content,
+            "document_type": document_type,
+            "download_filename": f"{document_type.replace(' ', '_')}.docx",
+            "chat_id": chat_id
+        })
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
 @app.route('/generate-document', methods=['POST'])
 def generate_document():
     """Generate and return a .docx document"""
@@ -1291,16 +2066,31 @@ def generate_document():
             print("Error: No document content provided")
             return jsonify({"error": "No document content provided"}), 400
         
-        # Create the document
-        buffer = create_docx(document_content, filename)
-        
-        print(f"Document created successfully, size: {buffer.getbuffer().nbytes} bytes")
+        # The ETag is a hash of the input (markdown and render version), not of the rendered bytes,
+        # which differ between renders of the same content (the .docx zip records timestamps)
+        etag = cache_key('docx', DOCX_RENDER_VERSION, document_content)
+        if etag in request.if_none_match:
+            print("Document unchanged, returning 304")
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
+
+        docx_bytes = docx_cache.get(etag)
+        if docx_bytes is None:
+            with span('docx_render'):
+                docx_bytes = create_docx(document_content, filename).getvalue()
+            docx_cache.set(etag, docx_bytes)
+            print(f"Document created successfully, size: {len(docx_bytes)} bytes")
+        else:
+            print(f"Document served from cache, size: {len(docx_bytes)} bytes")
         
         return send_file(
-            buffer,
+            io.BytesIO(docx_bytes),
             as_attachment=True,
             download_name=filename,
-            mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+            mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+            etag=etag,
+            max_age=0
         )
         
     except Exception as e:
@@ -1319,10 +2109,10 @@ def upload_file():
         if file.filename == '':
             return jsonify({"error": "No file selected"}), 400
 
-        # Save the uploaded file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-            file.save(tmp.name)
-            tmp_path = tmp.name
+        try:
+            upload = read_upload(file)
+        except UnsupportedUploadError as e:
+            return jsonify({"error": str(e)}), 415
 
         # Use Gemini to analyze the document
         prompt = f"""You are a legal assistant and are here to give legal advice. Dont ever say you are an AI Model or cant help with legal advice. Read the document and determine:
@@ -1331,21 +2121,19 @@ def upload_file():
 
                 If it is clearly not a legal document, respond only with:
                 "That does not look like a legal document, please upload a legal document."""
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=[
-                types.Part.from_bytes(
-                    data=open(tmp_path, "rb").read(),
-                    mime_type='application/pdf'
-                ),
-                prompt
-            ]
-        )
+        breakdown = request.form.get('breakdown') == 'true'
 
-        # Clean up temporary file
-        os.unlink(tmp_path)
+        def analyze():
+            with span('analysis'):
+                analysis = analyze_document(upload, prompt)
+            response_data = {"answer": analysis['answer'].strip().strip("`")}
+            if analysis.get('sections') and breakdown:
+                response_data['sections'] = analysis['sections']
+            return response_data
 
-        return jsonify({"answer": response.text.strip().strip("`")})
+        if run_in_background():
+            return job_accepted(job_queue.submit('analysis', analyze))
+        return jsonify(analyze())
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -1366,8 +2154,7 @@ Conversation:
 Generate only the title, nothing else:
 """
         
-        response = client.models.generate_content(model='gemini-2.5-flash', contents=prompt)
-        title = response.text.strip().strip('"').strip("'")
+        title = generate_text('generate_title', prompt).strip().strip('"').strip("'")
         
         # Ensure title is not too long
         if len(title) > 50:
@@ -1378,5 +2165,72 @@ Generate only the title, nothing else:
     except Exception as e:
         return jsonify({"error": f"Error generating title: {str(e)}"}), 500
 
+@app.route('/cache-stats', methods=['GET'])
+def cache_stats():
+    """Report hit/miss counts for the response caches"""
+    return jsonify({
+        "llm": llm_cache.stats(),
+        "intent_classifier": intent_classifier.stats(),
+        "history_compaction": history_compactor.stats(),
+        "docx": docx_cache.stats(),
+        "analysis": analysis_cache.stats(),
+        "sessions": session_store.stats(),
+        "search_pipeline": {**search_pipeline.stats(), "history_hints": len(history_hints)},
+        "got_letter_flow": got_letter_flow_engine.stats(),
+        "jobs": job_queue.stats()
+    })
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Status of a background job, with its result once done"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    """The response the request would have returned: 200 when done, 202 while pending, 500 if the job failed"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if job['status'] == 'done':
+        return jsonify(job['result'])
+    if job['status'] == 'failed':
+        return jsonify({"error": job['error']}), 500
+    return jsonify({"job_id": job_id, "status": job['status']}), 202
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Server-Sent Events for a job: "status" now, then "done" with the result or "error".
+
+    The stream holds its connection until the job finishes (at most
+    JOB_EVENTS_TIMEOUT), so on sync gunicorn workers clients should poll
+    /jobs/<id> instead.
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    def generate():
+        yield sse_event('status', {"job_id": job_id, "status": job['status']})
+        finished = job_queue.wait(job_id, app.config['JOB_EVENTS_TIMEOUT'])
+        if finished is None or finished['status'] not in ('done', 'failed'):
+            yield sse_event('status', {"job_id": job_id, "status": finished['status'] if finished else 'unknown'})
+        elif finished['status'] == 'done':
+            yield sse_event('done', {"job_id": job_id, **finished['result']})
+        else:
+            yield sse_event('error', {"job_id": job_id, "error": finished['error']})
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Request, stage and Gemini call latency histograms in Prometheus text format"""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=8000) 
\ No newline at end of file
@@ -0,0 +1,367 @@
+"""
+Async serving mode
+Same routes and JSON contracts as app.py, served by an ASGI server. /search awaits Gemini
+(client.aio) and Firestore (AsyncClient) on the event loop, so one process can hold hundreds
+of chats in flight; every other route is the Flask app running in worker threads.
+
+Run with: uvicorn asgi_app:app --host 0.0.0.0 --port 8080
+"""
+
+import asyncio
+import contextlib
+import json
+import time
+import uuid
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import UploadFile
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Mount, Route
+
+import app as sync_app
+from app import (
+    DRAFT_START_TEXT, EXPLANATION_FALLBACK, GOODBYE_FALLBACK, GOT_LETTER_START_TEXT, UPLOAD_ANALYSIS_PROMPT,
+    analyze_document, explain_match_prompt, explain_matches_batched_prompt, explanation_config,
+    finish_document_edit_turn, finish_drafting_turn, finish_got_letter_turn, goodbye_prompt,
+    handle_document_drafting_flow, handle_document_edit, handle_got_letter_flow, history_hints, intent_classifier,
+    intent_response, intent_tag, likely_needs_analysis, likely_needs_intent, llm_cache, llm_cache_key, match_lawyers,
+    model_turn, parse_batched_explanations, parse_intent_reply, parse_query_prompt, search_pipeline, user_turn
+)
+from request_pipeline import same_turns
+from tracing import ServerTimingMiddleware, record_llm_call, set_tag, span
+from session_store import KEEP, AsyncSegmentedFirestoreSessionStore, ThreadedAsyncSessionStore
+from uploads import UnsupportedUploadError, upload_from_bytes
+
+config = sync_app.app.config
+session_store = None
+
+
+def build_session_store():
+    """Native async store for the default segmented layout, else the sync store in threads.
+
+    The cached and write-behind stores keep state in this process, so when
+    either is on the ASGI app shares the Flask app's store instead of
+    opening a second view of the same chats.
+    """
+    if (config['SESSION_STORE'] == 'segmented' and sync_app.db
+            and config['SESSION_CACHE'] != 'on' and config['SESSION_WRITE_BEHIND'] != 'on'):
+        from firebase_admin import firestore_async
+
+        return AsyncSegmentedFirestoreSessionStore(
+            firestore_async.client(), 'chats',
+            segment_size=config['SESSION_SEGMENT_SIZE'],
+            tail_turns=config['SESSION_HISTORY_TAIL'],
+            blob_threshold=config['SESSION_BLOB_THRESHOLD']
+        )
+    return ThreadedAsyncSessionStore(sync_app.session_store)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(_app):
+    # The async Firestore client binds to the running event loop, so it's created here
+    global session_store
+    session_store = build_session_store()
+    yield
+
+
+async def load_chat_session(chat_id: str):
+    if not chat_id:
+        return [], {}
+    try:
+        with span('session_load'):
+            history, flow_context = await session_store.load(chat_id)
+        history_hints.remember(chat_id, history, flow_context)
+        return history, flow_context
+    except Exception as e:
+        print(f"Error loading chat session: {e}")
+        return [], {}
+
+
+async def save_chat_session(chat_id: str, new_turns: list, flow_context=KEEP):
+    try:
+        with span('session_save'):
+            await session_store.append(chat_id, new_turns, flow_context)
+        history_hints.extend(chat_id, new_turns, flow_context)
+    except Exception as e:
+        print(f"Error saving chat session: {e}")
+
+
+async def generate_text(call_site: str, contents, config=None, model: str = 'gemini-2.5-flash'):
+    """Async counterpart of app.generate_text, sharing its LLM cache"""
+    key, ttl = llm_cache_key(call_site, contents, config, model)
+    if key is not None:
+        cached = llm_cache.get(key, namespace=call_site, ttl=ttl)
+        if cached is not None:
+            return cached
+
+    started = time.perf_counter()
+    response = await sync_app.client.aio.models.generate_content(model=model, contents=contents, config=config)
+    record_llm_call(call_site, time.perf_counter() - started, response)
+    text = response.text
+    if key is not None and text:
+        llm_cache.set(key, text, ttl)
+    return text
+
+
+async def parse_query_with_gemini(history: list):
+    response_text = None
+    try:
+        response_text = await generate_text('parse_query', parse_query_prompt(history))
+        return parse_intent_reply(response_text)
+    except Exception as e:
+        return {"error": str(e), "raw_response": response_text if response_text is not None else "No response"}
+
+
+async def generate_goodbye_message(history: list):
+    try:
+        return (await generate_text('goodbye', goodbye_prompt(history))).strip()
+    except Exception:
+        return GOODBYE_FALLBACK
+
+
+async def explain_top_match(user_query: str, lawyer: dict, filters: dict):
+    try:
+        response_text = await generate_text('explain_match', explain_match_prompt(user_query, lawyer, filters),
+                                             config=explanation_config())
+        return response_text.strip().strip("`")
+    except Exception:
+        return EXPLANATION_FALLBACK
+
+
+async def explain_matches(user_query: str, lawyers: list, filters: dict):
+    """Async counterpart of app.explain_matches, with the same modes and shared deadline"""
+    explanations = [None] * len(lawyers)
+    if config['EXPLANATION_MODE'] == 'batched':
+        try:
+            response_text = await generate_text(
+                'explain_matches_batched',
+                explain_matches_batched_prompt(user_query, lawyers, filters),
+                config=explanation_config(response_mime_type='application/json')
+            )
+            parse_batched_explanations(response_text, explanations)
+        except Exception as e:
+            print(f"Batched explanation failed, falling back to per-lawyer calls: {e!r}")
+
+    missing = [i for i, explanation in enumerate(explanations) if explanation is None]
+    tasks = [asyncio.create_task(explain_top_match(user_query, lawyers[i], filters)) for i in missing]
+    if tasks:
+        done, pending = await asyncio.wait(tasks, timeout=config['EXPLANATION_TIMEOUT'])
+        for task in pending:
+            task.cancel()
+        for i, task in zip(missing, tasks):
+            if task not in done:
+                print(f"Explanation for {lawyers[i].get('name', 'N/A')} timed out")
+            explanations[i] = task.result() if task in done else EXPLANATION_FALLBACK
+
+    # The matches are the directory's own dicts, shared by concurrent requests: annotate copies
+    for i, explanation in enumerate(explanations):
+        lawyers[i] = {**lawyers[i], 'explanation': explanation}
+
+
+def start_search_turn(query: str, chat_id: str, upload):
+    """Async counterpart of app.start_search_turn, with tasks on the event loop"""
+    if config['SEARCH_PIPELINE'] != 'on' or not chat_id:
+        return None, None
+    session = asyncio.create_task(load_chat_session(chat_id))
+    hint = history_hints.get(chat_id)
+    if upload is not None:
+        if hint is not None and likely_needs_analysis(hint[1]):
+            return session, search_pipeline.track(
+                'analysis', asyncio.ensure_future(run_in_threadpool(analyze_document, upload, UPLOAD_ANALYSIS_PROMPT))
+            )
+        return session, None
+    if query and hint is not None and likely_needs_intent(hint[1], query) and not intent_classifier.would_handle(query):
+        hinted_history, _ = hint
+        task = asyncio.create_task(parse_query_with_gemini(hinted_history + [user_turn(query)]))
+        return session, search_pipeline.track('parse_query', task, basis=hinted_history)
+    return session, None
+
+
+async def parse_turn_intent(history: list, speculation=None):
+    if speculation is not None:
+        if speculation.name == 'parse_query' and same_turns(speculation.basis, history[:-1]):
+            return await speculation.keep()
+        speculation.discard()
+    return await parse_query_with_gemini(history)
+
+
+def respond(response_data: dict, chat_id: str):
+    response_data['chat_id'] = chat_id
+    return JSONResponse(response_data)
+
+
+async def read_form(request):
+    """The request's form, or None once the body passes MAX_CONTENT_LENGTH.
+
+    The limit is applied to the bytes actually received, since a chunked
+    upload has no Content-Length to check up front.
+    """
+    limit = config['MAX_CONTENT_LENGTH']
+    content_length = request.headers.get('content-length')
+    if content_length and content_length.isdigit() and int(content_length) > limit:
+        return None
+    chunks, size = [], 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > limit:
+            return None
+        chunks.append(chunk)
+    body = b''.join(chunks)
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    return await Request(request.scope, receive).form()
+
+
+async def search_users(request):
+    """/search on the event loop; mirrors app.search_users"""
+    try:
+        form = await read_form(request)
+        if form is None:
+            return JSONResponse({"error": "Request entity too large"}, status_code=413)
+        query = form.get('query')
+        chat_id = form.get('chat_id')
+        file = form.get('file')
+        if not isinstance(file, UploadFile) or not file.filename:
+            file = None
+        upload, upload_error = None, None
+        if file:
+            try:
+                upload = upload_from_bytes(file.filename, await file.read())
+            except UnsupportedUploadError as e:
+                upload_error = e
+
+        session, speculation = start_search_turn(query, chat_id, upload)
+        history, flow_context = await session if session else await load_chat_session(chat_id)
+        loaded_turns = len(history)
+
+        if speculation is not None and flow_context.get('name') in ('got-letter', 'draft_document'):
+            speculation.discard()
+        # Flow steps still use the synchronous handlers, in worker threads
+        if flow_context.get('name') == 'got-letter':
+            set_tag('intent', 'got-letter')
+            with span('flow'):
+                flow_result = await run_in_threadpool(handle_got_letter_flow, query, flow_context, history)
+            history.append(user_turn(query))
+            response_data, new_flow_context = finish_got_letter_turn(flow_result, history)
+            await save_chat_session(chat_id, history[loaded_turns:], new_flow_context)
+            return respond(response_data, chat_id)
+
+        elif flow_context.get('name') == 'draft_document':
+            set_tag('intent', 'draft_document')
+            with span('flow'):
+                flow_result = await run_in_threadpool(handle_document_drafting_flow, query, flow_context, history)
+            history.append(user_turn(query))
+            response_data, new_flow_context = finish_drafting_turn(flow_result, history)
+            await save_chat_session(chat_id, history[loaded_turns:], new_flow_context)
+            return respond(response_data, chat_id)
+
+        elif flow_context.get('name') == 'edit_document' and query:
+            with span('flow'):
+                flow_result = await run_in_threadpool(handle_document_edit, query, flow_context, history)
+            if flow_result is not None:
+                if speculation is not None:
+                    speculation.discard()
+                set_tag('intent', 'edit_document')
+                history.append(user_turn(query))
+                response_data, new_flow_context = finish_document_edit_turn(flow_result, history)
+                await save_chat_session(chat_id, history[loaded_turns:], new_flow_context)
+                return respond(response_data, chat_id)
+
+        if query is None and file:
+            query = "Please analyze this legal document"
+
+        if file:
+            if upload_error is not None:
+                return JSONResponse({"error": str(upload_error)}, status_code=415)
+
+            set_tag('intent', 'upload')
+            try:
+                with span('analysis'):
+                    if speculation is not None:
+                        analysis = await speculation.keep()
+                    else:
+                        analysis = await run_in_threadpool(analyze_document, upload, UPLOAD_ANALYSIS_PROMPT)
+                analysis_result = analysis['answer'].strip().strip("`")
+                response_data = {"answer": analysis_result}
+                if analysis.get('sections') and form.get('breakdown') == 'true':
+                    response_data['sections'] = analysis['sections']
+
+                chat_id = chat_id or str(uuid.uuid4())
+                history.append(user_turn(f"Uploaded document: {file.filename}"))
+                history.append(model_turn(analysis_result))
+                await save_chat_session(chat_id, history[loaded_turns:])
+                return respond(response_data, chat_id)
+            except Exception as e:
+                return JSONResponse({"error": f"Failed to analyze file: {str(e)}"}, status_code=500)
+
+        if not query:
+            return JSONResponse({"error": "No query or file provided"}, status_code=400)
+
+        history.append(user_turn(query))
+        with span('intent'):
+            parsed = intent_classifier.classify(query) or await parse_turn_intent(history, speculation)
+        intent = parsed.get("intent")
+        set_tag('intent', intent_tag(intent, parsed))
+
+        if intent == "got-letter":
+            new_flow_context = {'name': 'got-letter', 'step': 1, 'data': {}}
+            if any(word in query.lower() for word in ['ref', 'reference', 'olaw.io', 'https://']):
+                with span('flow'):
+                    flow_result = await run_in_threadpool(handle_got_letter_flow, query, new_flow_context, history)
+            else:
+                flow_result = {'response': GOT_LETTER_START_TEXT, 'should_end_flow': False, 'flow_context': new_flow_context}
+            chat_id = chat_id or str(uuid.uuid4())
+            response_data, new_flow_context = finish_got_letter_turn(flow_result, history)
+            await save_chat_session(chat_id, history[loaded_turns:], new_flow_context)
+            return respond(response_data, chat_id)
+
+        elif intent == "draft_document":
+            chat_id = chat_id or str(uuid.uuid4())
+            history.append(model_turn(DRAFT_START_TEXT))
+            await save_chat_session(chat_id, history[loaded_turns:], {'name': 'draft_document', 'step': 1, 'data': {}})
+            return respond({"answer": DRAFT_START_TEXT}, chat_id)
+
+        if intent == "near_me":
+            return JSONResponse({"intent": "near_me"})
+
+        if intent == "goodbye":
+            response_data = {"query": query, "answer": await generate_goodbye_message(history)}
+        elif intent_response(intent, parsed) is not None:
+            response_data = {"query": query, **intent_response(intent, parsed)}
+        elif "error" in parsed:
+            response_data = parsed
+        else:
+            with span('match'):
+                filters, top_matches = match_lawyers(parsed)
+            if top_matches:
+                with span('explain'):
+                    await explain_matches(query, top_matches, filters)
+            response_data = {"query": query, "filters_applied": filters, "matches": top_matches}
+
+        history.append(model_turn(json.dumps(response_data)))
+        chat_id = chat_id or str(uuid.uuid4())
+        await save_chat_session(chat_id, history[loaded_turns:])
+        return respond(response_data, chat_id)
+
+    except Exception as e:
+        return JSONResponse({"error": f"Unexpected error: {str(e)}"}, status_code=500)
+
+
+app = Starlette(
+    routes=[
+        Route('/search', search_users, methods=['POST', 'OPTIONS'], middleware=[
+            # Flask-CORS and the Flask tracing hooks cover the mounted routes; only the native route needs its own
+            Middleware(ServerTimingMiddleware, route='/search', log=config['TRACE_LOGS'] == 'on'),
+            Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])
+        ]),
+        Mount('/', app=WSGIMiddleware(sync_app.app)),
+    ],
+    lifespan=lifespan,
+)
@@ -0,0 +1,241 @@
+"""
+Attorney search index
+Built once from attorneys_data.json so /search never rescans the raw directory
+"""
+
+import re
+
+import numpy as np
+
+ADDRESS_PATTERN = re.compile(r"(?P<city>[\w\s.-]+?)\s*,\s*(?P<state>[a-z]{2})\b", re.IGNORECASE)
+
+
+def _as_list(value):
+    """Wrap a scalar filter value in a list"""
+    return value if isinstance(value, list) else [value]
+
+
+def _membership(value_sets: list):
+    """Build a vocabulary and a boolean attorney x value membership matrix"""
+    vocab = {}
+    for values in value_sets:
+        for value in values:
+            vocab.setdefault(value, len(vocab))
+    matrix = np.zeros((len(value_sets), len(vocab)), dtype=bool)
+    for i, values in enumerate(value_sets):
+        for value in values:
+            matrix[i, vocab[value]] = True
+    return vocab, matrix
+
+
+def _categorical(values: list):
+    """Encode strings as integer codes into a vocabulary list (-1 for None)"""
+    vocab = {}
+    codes = np.empty(len(values), dtype=np.int32)
+    for i, value in enumerate(values):
+        codes[i] = -1 if value is None else vocab.setdefault(value, len(vocab))
+    return list(vocab), codes
+
+
+def _contains(column: np.ndarray, needle: str):
+    """Substring test of needle against every string in an object column"""
+    return np.fromiter((needle in s for s in column), dtype=bool, count=len(column))
+
+
+class AttorneyIndex:
+    """Columnar index over the attorney directory.
+
+    Every field the filters and scorer look at is normalized once at load time:
+    multi-valued attributes become boolean membership matrices (one bitset
+    column per value), address city/state and firm become categorical codes,
+    and rating/calendar become numeric columns. A query is then a handful of
+    vectorized mask and score operations over the candidate rows.
+    """
+
+    def __init__(self, users: list, state_map: dict):
+        self.users = users
+        size = len(users)
+
+        licenses = [{str(s).lower() for s in u.get("licenseState", [])} for u in users]
+        self.license_vocab, self.license_matrix = _membership(licenses)
+        self.specialty_vocab, self.specialty_matrix = _membership(
+            [{s.lower() for s in u.get("specialties", [])} for u in users])
+        self.meeting_type_vocab, self.meeting_type_matrix = _membership(
+            [{m.lower() for m in u.get("meetingTypes", [])} for u in users])
+        self.language_vocab, self.language_matrix = _membership(
+            [{language.lower() for language in u.get("languages", [])} for u in users])
+
+        self.firm_vocab, self.firm_codes = _categorical([(u.get("firm") or "").lower() for u in users])
+        # Posting lists of firm codes per whitespace token of the firm name
+        firm_tokens = {}
+        for code, firm in enumerate(self.firm_vocab):
+            for token in firm.split():
+                firm_tokens.setdefault(token, []).append(code)
+        self.firm_token_postings = {t: np.array(c, dtype=np.int32) for t, c in firm_tokens.items()}
+
+        # Address is parsed once here instead of on every scored query
+        cities, states = [], []
+        self.addr_licensed = np.zeros(size, dtype=bool)
+        for i, user in enumerate(users):
+            match = ADDRESS_PATTERN.search((user.get("address") or "").lower())
+            if match:
+                city = match.group("city").strip()
+                state = state_map.get(match.group("state").strip(), "")
+                self.addr_licensed[i] = state in licenses[i]
+            else:
+                city = state = None
+            cities.append(city)
+            states.append(state)
+        self.city_vocab, self.city_codes = _categorical(cities)
+        self.state_vocab, self.state_codes = _categorical(states)
+
+        self.rating = np.full(size, np.nan)
+        self.rating_key = np.full(size, -np.inf)
+        for i, user in enumerate(users):
+            try:
+                self.rating[i] = self.rating_key[i] = float(user.get("rating", 0))
+            except (ValueError, TypeError):
+                pass
+        self.has_calendar = np.array([bool(u.get("hasCalendarConnected")) for u in users], dtype=bool)
+
+        self.names = np.array([(u.get("name") or "").lower() for u in users], dtype=object)
+        self.first_names = np.array([(u.get("firstName") or "").lower() for u in users], dtype=object)
+        self.last_names = np.array([(u.get("lastName") or "").lower() for u in users], dtype=object)
+        self.reviews = np.array([(u.get("reviewContent") or "").lower() for u in users], dtype=object)
+
+    def __len__(self):
+        return len(self.users)
+
+    @staticmethod
+    def _any_of(vocab: dict, matrix: np.ndarray, values: list, rows=slice(None)):
+        """Rows that have at least one of the given values"""
+        cols = [vocab[v] for v in values if v in vocab]
+        if not cols:
+            return np.zeros(matrix[rows].shape[0], dtype=bool)
+        return matrix[rows][:, cols].any(axis=1)
+
+    def _firm_mask(self, filter_firm: str):
+        """Rows whose firm contains filter_firm as a substring.
+
+        Each whitespace-free piece of the query must sit inside a single firm
+        token, so the token postings give a superset of firm codes; the
+        substring check on that small set keeps the original semantics.
+        """
+        pieces = filter_firm.split()
+        if pieces:
+            codes = None
+            for piece in pieces:
+                postings = [p for token, p in self.firm_token_postings.items() if piece in token]
+                piece_codes = np.unique(np.concatenate(postings)) if postings else np.empty(0, dtype=np.int32)
+                codes = piece_codes if codes is None else np.intersect1d(codes, piece_codes, assume_unique=True)
+        else:
+            codes = np.arange(len(self.firm_vocab))
+        matching = [c for c in codes if filter_firm in self.firm_vocab[c]]
+        return np.isin(self.firm_codes, matching)
+
+    def filter_ids(self, filters: dict):
+        """Apply non-negotiable filters and return the surviving row ids in directory order"""
+        mask = None
+
+        def narrow(rows):
+            nonlocal mask
+            mask = rows if mask is None else mask & rows
+
+        if filters.get("licenseState"):
+            narrow(self._any_of(self.license_vocab, self.license_matrix, [filters["licenseState"].lower()]))
+
+        if filters.get("specialties"):
+            filter_specs = [s.lower() for s in _as_list(filters["specialties"]) if s]
+            if filter_specs:
+                narrow(self._any_of(self.specialty_vocab, self.specialty_matrix, filter_specs))
+
+        if filters.get("hasCalendarConnected"):
+            narrow(self.has_calendar)
+
+        if filters.get("meetingTypes"):
+            filter_meeting_types = [m.lower() for m in _as_list(filters["meetingTypes"]) if m]
+            if filter_meeting_types:
+                narrow(self._any_of(self.meeting_type_vocab, self.meeting_type_matrix, filter_meeting_types))
+
+        if filters.get("firm"):
+            narrow(self._firm_mask(filters["firm"].lower()))
+
+        if filters.get("languages"):
+            filter_languages = [language.lower() for language in _as_list(filters["languages"]) if language]
+            if filter_languages:
+                narrow(self._any_of(self.language_vocab, self.language_matrix, filter_languages))
+
+        if mask is None:
+            return np.arange(len(self.users))
+        return np.flatnonzero(mask)
+
+    def score(self, ids: np.ndarray, filters: dict):
+        """Score the given rows in one vectorized pass using the weighted criteria"""
+        score = np.zeros(len(ids), dtype=np.int64)
+
+        if filters.get("location"):
+            location_input = filters["location"]
+            location_query = str(location_input[0]).lower() if isinstance(location_input, list) and location_input else str(location_input).lower()
+            if location_query:
+                city_hits = [c for c, city in enumerate(self.city_vocab) if location_query in city]
+                score += 3 * (self.addr_licensed[ids] & np.isin(self.city_codes[ids], city_hits))
+                if location_query in self.license_vocab:
+                    score += 2 * self.license_matrix[ids, self.license_vocab[location_query]]
+
+        if filters.get("name"):
+            score += 10 * (self.names[ids] == filters["name"].lower())
+        if filters.get("firstName"):
+            score += 5 * (self.first_names[ids] == filters["firstName"].lower())
+        if filters.get("lastName"):
+            score += 5 * (self.last_names[ids] == filters["lastName"].lower())
+
+        if filters.get("rating"):
+            try:
+                low = float(filters["rating"])
+                rating = self.rating[ids]
+                score += 2 * ((low <= rating) & (rating < low + 1))
+            except (ValueError, TypeError):
+                pass
+
+        if filters.get("hasCalendarConnected"):
+            score += 2 * self.has_calendar[ids]
+
+        if filters.get("meetingTypes"):
+            filter_types = [m.lower() for m in _as_list(filters["meetingTypes"])]
+            score += self._any_of(self.meeting_type_vocab, self.meeting_type_matrix, filter_types, ids)
+
+        if filters.get("firm"):
+            filter_firm = filters["firm"].lower()
+            firm_hits = [c for c, firm in enumerate(self.firm_vocab) if filter_firm in firm]
+            score += 5 * np.isin(self.firm_codes[ids], firm_hits)
+
+        if filters.get("languages"):
+            filter_langs = [language.lower() for language in _as_list(filters["languages"])]
+            score += 2 * self._any_of(self.language_vocab, self.language_matrix, filter_langs, ids)
+
+        if filters.get("review_keywords"):
+            reviews = self.reviews[ids]
+            for keyword in _as_list(filters["review_keywords"]):
+                score += 3 * _contains(reviews, keyword.lower())
+
+        return score
+
+    def top_matches(self, filters: dict, limit: int = 3):
+        """Filter, score and return the best `limit` attorneys.
+
+        Ranking is by score, then rating, then directory order, which is
+        exactly what the old stable full sort produced.
+        """
+        ids = self.filter_ids(filters)
+        scores = self.score(ids, filters)
+        if filters.get("location"):
+            keep = scores > 0
+            ids, scores = ids[keep], scores[keep]
+
+        # Only rows tied with or above the limit-th best score can make the cut
+        if len(ids) > limit:
+            kth = np.partition(scores, -limit)[-limit]
+            keep = scores >= kth
+            ids, scores = ids[keep], scores[keep]
+        order = np.lexsort((ids, -self.rating_key[ids], -scores))[:limit]
+        return [self.users[i] for i in ids[order]]
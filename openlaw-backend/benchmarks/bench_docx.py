@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+DOCX rendering benchmark
+Compares the original create_docx against the incremental DocxStreamRenderer on large generated documents
+
+Usage: python benchmarks/bench_docx.py [--pages 100 250] [--repeat 3]
+"""
+
+import argparse
+import io
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from docx import Document
+
+from docx_renderer import render_docx
+
+WORDS = ("agreement party tenant landlord premises term rent deposit notice breach remedy law "
+         "jurisdiction covenant obligation payment default termination assignment indemnify").split()
+
+
+def synthetic_document(pages: int, seed: int = 3):
+    """Markdown shaped like generate_legal_document output, ~350 words per page"""
+    rng = random.Random(seed)
+
+    def sentence():
+        words = rng.sample(WORDS, 12)
+        if rng.random() < 0.3:
+            words[2] = f"**{words[2]}**"
+        if rng.random() < 0.2:
+            words[6] = f"*{words[6]}*"
+        return " ".join(words).capitalize() + "."
+
+    blocks = ["# RESIDENTIAL LEASE AGREEMENT"]
+    for page in range(pages):
+        blocks.append(f"## Section {page + 1}")
+        blocks.append(" ".join(sentence() for _ in range(8)))
+        blocks.extend(f"{i}. " + sentence() for i in range(1, 5))
+        blocks.extend("* " + sentence() for _ in range(3))
+        blocks.append(" ".join(sentence() for _ in range(8)))
+        blocks.append("**IN WITNESS WHEREOF**")
+    return "\n\n".join(blocks)
+
+
+def chunked(text: str, size: int = 256):
+    """Simulate streamed model output"""
+    for start in range(0, len(text), size):
+        yield text[start:start + size]
+
+
+def baseline_create_docx(content, filename):
+    """The original whole-string create_docx, kept as the reference implementation"""
+    try:
+        doc = Document()
+        
+        # Clean and process the content
+        if not content or not content.strip():
+            # Add a default message if content is empty
+            doc.add_paragraph("Document content is empty or could not be generated.")
+            buffer = io.BytesIO()
+            doc.save(buffer)
+            buffer.seek(0)
+            return buffer
+        
+        # Split content into paragraphs and add to document
+        paragraphs = content.split('\n\n')
+        for para in paragraphs:
+            if para.strip():
+                # Handle markdown formatting
+                if para.startswith('**') and para.endswith('**'):
+                    # Bold text
+                    p = doc.add_paragraph()
+                    p.add_run(para[2:-2]).bold = True
+                elif para.startswith('#'):
+                    # Heading
+                    level = len(para) - len(para.lstrip('#'))
+                    text = para.lstrip('#').strip()
+                    if level == 1:
+                        doc.add_heading(text, level=1)
+                    elif level == 2:
+                        doc.add_heading(text, level=2)
+                    else:
+                        doc.add_heading(text, level=3)
+                else:
+                    # Regular paragraph - handle inline markdown formatting
+                    text = para.strip()
+                    
+                    # Check if this is a numbered list item
+                    if re.match(r'^\d+\.\s', text):
+                        p = doc.add_paragraph()
+                        p.style = 'List Number'
+                        # Remove the number and dot from the text
+                        text = re.sub(r'^\d+\.\s', '', text)
+                    # Check if this is a bullet point
+                    elif text.startswith('* ') or text.startswith('- '):
+                        p = doc.add_paragraph()
+                        p.style = 'List Bullet'
+                        # Remove the bullet marker
+                        text = text[2:]
+                    else:
+                        p = doc.add_paragraph()
+                    
+                    # Process inline markdown formatting
+                    
+                    # First handle bold formatting
+                    bold_pattern = r'\*\*(.*?)\*\*'
+                    parts = re.split(bold_pattern, text)
+                    
+                    for i, part in enumerate(parts):
+                        if i % 2 == 0:  # Regular text - now check for italic
+                            if part:
+                                # Process italic formatting within regular text
+                                italic_pattern = r'\*(.*?)\*'
+                                italic_parts = re.split(italic_pattern, part)
+                                
+                                for j, italic_part in enumerate(italic_parts):
+                                    if j % 2 == 0:  # Regular text
+                                        if italic_part:
+                                            p.add_run(italic_part)
+                                    else:  # Italic text
+                                        if italic_part:
+                                            p.add_run(italic_part).italic = True
+                        else:  # Bold text (part is the text inside **)
+                            if part:
+                                # Check for italic within bold
+                                italic_pattern = r'\*(.*?)\*'
+                                italic_parts = re.split(italic_pattern, part)
+                                
+                                for j, italic_part in enumerate(italic_parts):
+                                    if j % 2 == 0:  # Bold text
+                                        if italic_part:
+                                            p.add_run(italic_part).bold = True
+                                    else:  # Bold and italic text
+                                        if italic_part:
+                                            run = p.add_run(italic_part)
+                                            run.bold = True
+                                            run.italic = True
+        
+        # Save to bytes buffer
+        buffer = io.BytesIO()
+        doc.save(buffer)
+        buffer.seek(0)
+        return buffer
+        
+    except Exception as e:
+        print(f"Error creating DOCX: {e}")
+        # Create a fallback document
+        doc = Document()
+        doc.add_heading("Document Generation Error", level=1)
+        doc.add_paragraph(f"An error occurred while generating the document: {str(e)}")
+        doc.add_paragraph("Please try again or contact support if the issue persists.")
+        
+        buffer = io.BytesIO()
+        doc.save(buffer)
+        buffer.seek(0)
+        return buffer
+
+
+def measure(label: str, build, repeat: int):
+    best_time, peak = float("inf"), 0
+    for _ in range(repeat):
+        tracemalloc.start()
+        start = time.perf_counter()
+        size = build()
+        elapsed = time.perf_counter() - start
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        best_time = min(best_time, elapsed)
+    print(f"  {label:<34} {best_time:>7.2f}s  Python heap peak {peak / 1e6:>6.1f} MB  output {size / 1e3:>8.1f} KB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[100, 250])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    for pages in args.pages:
+        content = synthetic_document(pages)
+        print(f"{pages} pages ({len(content) / 1e3:.0f} KB of markdown)")
+
+        def baseline():
+            return baseline_create_docx(content, "document.docx").getbuffer().nbytes
+
+        def incremental_to_file():
+            with tempfile.TemporaryFile() as f:
+                render_docx(chunked(content), f)
+                return f.tell()
+
+        measure("baseline create_docx -> BytesIO", baseline, args.repeat)
+        measure("DocxStreamRenderer chunks -> file", incremental_to_file, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Intent pre-classifier replay benchmark
+Replays recorded user messages through IntentClassifier and reports how much intent LLM traffic it removes
+
+Usage: python benchmarks/bench_intent.py [trace.jsonl|trace.txt] [--threshold 0.8] [--model model.json]
+A trace is either one message per line or JSONL with a "query" field (and optionally the "intent" Gemini returned).
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from intent_classifier import BagOfWordsModel, IntentClassifier
+
+SAMPLE_TRACE = [
+    {"query": "hi", "intent": "greeting"},
+    {"query": "Hello!", "intent": "greeting"},
+    {"query": "hola", "intent": "greeting"},
+    {"query": "I need a divorce lawyer in Miami", "intent": None},
+    {"query": "Looking for a Spanish speaking immigration attorney in Texas", "intent": None},
+    {"query": "What happens if I miss a court date?", "intent": "general_question"},
+    {"query": "I got a letter from OpenLaw", "intent": "got-letter"},
+    {"query": "https://olaw.io/AYU166", "intent": "got-letter"},
+    {"query": "lawyer near me", "intent": "near_me"},
+    {"query": "Necesito un abogado cerca de mí", "intent": "near_me"},
+    {"query": "Draft a rental agreement with dummy data", "intent": "draft_document"},
+    {"query": "Redacta un contrato de arrendamiento", "intent": "draft_document"},
+    {"query": "thanks", "intent": "goodbye"},
+    {"query": "bye!", "intent": "goodbye"},
+    {"query": "adiós", "intent": "goodbye"},
+    {"query": "Can you explain what a lien is?", "intent": "general_question"},
+    {"query": "4.5 stars or above, virtual meetings", "intent": None},
+    {"query": "What's your name?", "intent": "out-of-scope"},
+]
+
+
+def load_trace(path: str):
+    with open(path, "r") as f:
+        lines = [line.strip() for line in f if line.strip()]
+    trace = []
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = {"query": line}
+        if isinstance(record, dict) and record.get("query"):
+            trace.append(record)
+    return trace
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("trace", nargs="?", help="recorded messages; defaults to a small built-in sample")
+    parser.add_argument("--threshold", type=float, default=0.8)
+    parser.add_argument("--model", help="optional bag-of-words model JSON")
+    args = parser.parse_args()
+
+    trace = load_trace(args.trace) if args.trace else SAMPLE_TRACE
+    model = BagOfWordsModel.load(args.model) if args.model else None
+    classifier = IntentClassifier(threshold=args.threshold, model=model)
+
+    local = Counter()
+    disagreements = []
+    start = time.perf_counter()
+    for record in trace:
+        parsed = classifier.classify(record["query"])
+        if parsed is None:
+            continue
+        local[parsed["intent"]] += 1
+        expected = record.get("intent", parsed["intent"])
+        if expected != parsed["intent"]:
+            disagreements.append((record["query"], expected, parsed["intent"]))
+    elapsed = time.perf_counter() - start
+
+    handled = sum(local.values())
+    print(f"Replayed {len(trace)} messages in {elapsed * 1000:.2f} ms ({elapsed / len(trace) * 1e6:.1f} µs/message)")
+    print(f"Resolved locally: {handled} ({handled / len(trace):.1%} of intent LLM calls avoided)")
+    for intent, count in local.most_common():
+        print(f"  {intent:<16} {count}")
+    print(f"Disagreements with recorded intent: {len(disagreements)}")
+    for query, expected, got in disagreements:
+        print(f"  {query!r}: recorded {expected}, local {got}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Offline endpoint benchmark
+Replays recorded conversations through /search, /generate-document and /upload with Gemini and
+Firestore replaced by local fakes, and reports throughput, latency percentiles and memory per endpoint
+
+Usage: python benchmarks/bench_offline.py [--conversations 60] [--concurrency 8] [--latency-scale 0.02]
+       python benchmarks/bench_offline.py --json results.json
+       python benchmarks/bench_offline.py --baseline results.json [--max-regression 0.25]
+
+Each conversation in --traces is a list of turns ({"endpoint", "form", "file"}). "{n}" in a text
+is replaced by the replay number so every replay sends new prompts and uploads (nothing is served
+from the response caches), /search turns carry the chat_id of the previous turn, and a form value
+"$field" is taken from the previous turn's JSON response. Fake Gemini delays are the medians in
+fakes.DEFAULT_LATENCY times --latency-scale, log-normally distributed.
+
+The load phase runs --concurrency workers, each replaying whole conversations through its own
+Flask test client. Memory is measured in a separate sequential pass with tracemalloc: the peak
+allocation above the baseline while each request is served. With --baseline the run exits with
+status 1 when an endpoint's p95 latency grew by more than --max-regression, for use in CI.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+# genai.Client() needs a key at import time; the fake replaces the client before any call
+os.environ.setdefault("GEMINI_API_KEY", "offline-benchmark")
+
+from fakes import FakeFirestore, FakeGemini, LatencyModel, install
+
+DEFAULT_TRACES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "traces", "conversations.json")
+
+
+def fill(value, n: int, previous: dict):
+    if isinstance(value, str):
+        if value.startswith("$"):
+            return previous.get(value[1:], "")
+        return value.replace("{n}", str(n))
+    return value
+
+
+def build_request(turn: dict, n: int, chat_id: str, previous: dict):
+    """Form data for the Flask test client, files included"""
+    data = {key: fill(value, n, previous) for key, value in turn.get("form", {}).items()}
+    if turn["endpoint"] == "/search" and chat_id:
+        data["chat_id"] = chat_id
+    if "file" in turn:
+        spec = turn["file"]
+        body = fill(spec["text"], n, previous) * spec.get("repeat", 1)
+        data["file"] = (io.BytesIO(body.encode("utf-8")), spec["name"])
+    return data
+
+
+def replay(http, conversation: dict, n: int, record):
+    """Send one conversation's turns in order, calling record(endpoint, seconds, ok) per turn"""
+    chat_id, previous = None, {}
+    for turn in conversation["turns"]:
+        data = build_request(turn, n, chat_id, previous)
+        started = time.perf_counter()
+        response = http.post(turn["endpoint"], data=data, content_type="multipart/form-data")
+        elapsed = time.perf_counter() - started
+        ok = response.status_code < 400
+        if response.is_json:
+            previous = response.get_json()
+            ok = ok and "error" not in previous
+            chat_id = previous.get("chat_id", chat_id)
+        record(turn["endpoint"], elapsed, ok)
+
+
+def run_load(app_module, conversations: list, total: int, concurrency: int):
+    """Replay `total` conversations round-robin on `concurrency` threads"""
+    results = {}
+    lock = threading.Lock()
+    counter = iter(range(total))
+
+    def record(endpoint, seconds, ok):
+        with lock:
+            stats = results.setdefault(endpoint, {"latencies": [], "errors": 0})
+            stats["latencies"].append(seconds)
+            stats["errors"] += 0 if ok else 1
+
+    def worker():
+        http = app_module.app.test_client()
+        while True:
+            with lock:
+                n = next(counter, None)
+            if n is None:
+                return
+            replay(http, conversations[n % len(conversations)], n, record)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - started
+
+
+def measure_memory(app_module, conversations: list, offset: int):
+    """Peak traced allocation (bytes) per request, by endpoint, over one sequential replay of each trace"""
+    peaks = {}
+    http = app_module.app.test_client()
+
+    def record(endpoint, seconds, ok):
+        current, peak = tracemalloc.get_traced_memory()
+        peaks.setdefault(endpoint, []).append(peak - state["baseline"])
+        tracemalloc.reset_peak()
+        state["baseline"] = current
+
+    tracemalloc.start()
+    state = {"baseline": tracemalloc.get_traced_memory()[0]}
+    try:
+        for i, conversation in enumerate(conversations):
+            replay(http, conversation, offset + i, record)
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def summarize(results: dict, elapsed: float, peaks: dict):
+    summary = {}
+    for endpoint, stats in sorted(results.items()):
+        latencies = stats["latencies"]
+        summary[endpoint] = {
+            "requests": len(latencies),
+            "errors": stats["errors"],
+            "throughput_rps": round(len(latencies) / elapsed, 2),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+            "mean_ms": round(statistics.mean(latencies) * 1000, 1),
+            "peak_kib": round(max(peaks.get(endpoint, [0])) / 1024, 1),
+            "mean_peak_kib": round(statistics.mean(peaks.get(endpoint, [0])) / 1024, 1),
+        }
+    return summary
+
+
+def report(summary: dict, elapsed: float):
+    print(f"{'endpoint':<20} {'reqs':>5} {'err':>4} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'peak KiB':>9} {'mean KiB':>9}")
+    for endpoint, row in summary.items():
+        print(f"{endpoint:<20} {row['requests']:>5} {row['errors']:>4} {row['throughput_rps']:>7.2f} "
+              f"{row['p50_ms']:>8.0f} {row['p95_ms']:>8.0f} {row['p99_ms']:>8.0f} "
+              f"{row['peak_kib']:>9.0f} {row['mean_peak_kib']:>9.0f}")
+    # ru_maxrss is KiB on Linux
+    print(f"load phase {elapsed:.1f} s, max RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MiB")
+
+
+def regressions(summary: dict, baseline: dict, max_regression: float):
+    """Endpoints whose p95 grew by more than max_regression, or that newly return errors"""
+    failures = []
+    for endpoint, row in summary.items():
+        before = baseline.get(endpoint)
+        if before is None:
+            continue
+        if row["p95_ms"] > before["p95_ms"] * (1 + max_regression):
+            failures.append(f"{endpoint}: p95 {before['p95_ms']:.0f} ms -> {row['p95_ms']:.0f} ms")
+        if row["errors"] > before["errors"]:
+            failures.append(f"{endpoint}: errors {before['errors']} -> {row['errors']}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--traces", default=DEFAULT_TRACES)
+    parser.add_argument("--conversations", type=int, default=60, help="conversations replayed in the load phase")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency-scale", type=float, default=0.02, help="multiplier on the fake Gemini medians")
+    parser.add_argument("--latency-sigma", type=float, default=0.35, help="log-normal spread of fake Gemini delays")
+    parser.add_argument("--firestore-latency", type=float, default=0.002, help="seconds per fake Firestore round trip")
+    parser.add_argument("--attorneys", type=int, default=10000)
+    parser.add_argument("--verbose", action="store_true", help="show the app's own log output")
+    parser.add_argument("--json", help="write the per-endpoint summary to this file")
+    parser.add_argument("--baseline", help="summary JSON from an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.25)
+    args = parser.parse_args()
+
+    with open(args.traces) as f:
+        conversations = json.load(f)
+
+    import app as app_module
+    from attorney_index import AttorneyIndex
+    from bench_search import synthetic_directory
+
+    gemini = FakeGemini(LatencyModel(sigma=args.latency_sigma, scale=args.latency_scale))
+    install(app_module, gemini, FakeFirestore(args.firestore_latency, args.firestore_latency))
+    directory = synthetic_directory(args.attorneys)
+    app_module.ATTORNEY_INDEX = AttorneyIndex(directory, app_module.STATE_MAP)
+    app_module.ALL_SPECIALTIES = app_module.get_all_specialties(directory)
+    app_module.app.config['TRACE_LOGS'] = 'off'
+
+    print(f"{args.conversations} conversations from {len(conversations)} traces, {args.concurrency} workers, "
+          f"Gemini latency x{args.latency_scale}")
+    with contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO()):
+        results, elapsed = run_load(app_module, conversations, args.conversations, args.concurrency)
+        peaks = measure_memory(app_module, conversations, args.conversations)
+    summary = summarize(results, elapsed, peaks)
+    report(summary, elapsed)
+    print(f"Gemini calls: {json.dumps(dict(sorted(gemini.calls.items())))}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            failures = regressions(summary, json.load(f), args.max_regression)
+        for failure in failures:
+            print(f"REGRESSION {failure}")
+        if failures:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
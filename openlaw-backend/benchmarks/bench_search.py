@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Attorney search benchmark
+Compares the original linear-scan matcher against AttorneyIndex on synthetic directories
+
+Usage: python benchmarks/bench_search.py [--sizes 10000 100000 1000000] [--queries 200]
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from attorney_index import AttorneyIndex
+
+SYNTHETIC_STATE_MAP = {"tx": "texas", "fl": "florida", "ca": "california", "az": "arizona"}
+STATES = {"Texas": "TX", "Florida": "FL", "California": "CA", "Arizona": "AZ"}
+CITIES = ["Austin", "Dallas", "Houston", "Miami", "Tampa", "Orlando", "Los Angeles", "San Diego", "Phoenix", "Tucson"]
+SPECIALTIES = ["Family Law", "Criminal Law", "Personal Injury", "Business Law", "Traffic Law",
+               "Immigration Law", "Estate Planning", "Civil Litigation", "Corporate Law", "Real Estate Law"]
+FIRM_WORDS = ["Smith", "Jones", "Garcia", "Lopez", "Miller", "Davis", "Legal", "Law", "Group", "Partners", "LLP"]
+REVIEW_WORDS = ["patient", "aggressive", "responsive", "kind", "thorough", "honest", "fast", "helpful"]
+
+
+def synthetic_directory(size: int, seed: int = 7):
+    """Generate a directory shaped like attorneys_data.json"""
+    rng = random.Random(seed)
+    users = []
+    for i in range(size):
+        first, last = f"First{rng.randrange(2000)}", f"Last{rng.randrange(5000)}"
+        users.append({
+            "name": f"{first} {last}",
+            "firstName": first,
+            "lastName": last,
+            "licenseState": rng.sample(list(STATES), rng.randint(1, 2)),
+            "specialties": rng.sample(SPECIALTIES, rng.randint(1, 3)),
+            "meetingTypes": rng.sample(["Virtual", "In-person"], rng.randint(1, 2)),
+            "languages": rng.sample(["English", "Spanish"], rng.randint(1, 2)),
+            "firm": " ".join(rng.sample(FIRM_WORDS, 3)),
+            "rating": round(rng.uniform(1, 5), 1),
+            "hasCalendarConnected": rng.random() < 0.5,
+            "reviewContent": " ".join(rng.sample(REVIEW_WORDS, 3)),
+            "address": f"{rng.randrange(9999)} Main St, {rng.choice(CITIES)}, {rng.choice(list(STATES.values()))} 7{rng.randrange(10000):04d}",
+        })
+    return users
+
+
+def synthetic_queries(count: int, seed: int = 11):
+    """Generate filter dicts like the ones parse_query_with_gemini returns"""
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        filters = {"specialties": [rng.choice(SPECIALTIES)], "languages": [rng.choice(["English", "Spanish"])]}
+        if rng.random() < 0.6:
+            filters["licenseState"] = rng.choice(list(STATES))
+        if rng.random() < 0.4:
+            filters["location"] = rng.choice(CITIES)
+        if rng.random() < 0.3:
+            filters["rating"] = rng.choice([4, 4.5])
+        if rng.random() < 0.3:
+            filters["meetingTypes"] = rng.choice(["Virtual", "In-person"])
+        if rng.random() < 0.2:
+            filters["firm"] = rng.choice(FIRM_WORDS)
+        if rng.random() < 0.3:
+            filters["review_keywords"] = rng.sample(REVIEW_WORDS, 2)
+        queries.append(filters)
+    return queries
+
+
+def baseline_find_best_matches(filters, users):
+    """The original linear-scan matcher, kept as the reference implementation"""
+    filtered_users = _apply_hard_filters(filters, users)
+    scored_users = [(user, _score_user(user, filters)) for user in filtered_users]
+    if filters.get("location"):
+        scored_users = [(user, score) for user, score in scored_users if score > 0]
+    sorted_users = sorted(scored_users, key=lambda x: (x[1], x[0].get("rating", 0)), reverse=True)
+    return [user for user, score in sorted_users[:3]]
+
+def _apply_hard_filters(filters, db):
+    """Apply non-negotiable filters to the user list"""
+    users = db
+    
+    if filters.get("licenseState"):
+        filter_state = filters["licenseState"].lower()
+        users = [u for u in users if filter_state in [str(s).lower() for s in u.get("licenseState", [])]]
+
+    if filters.get("specialties"):
+        filter_specs = filters["specialties"]
+        if not isinstance(filter_specs, list):
+            filter_specs = [filter_specs]
+        filter_specs = [s.lower() for s in filter_specs if s]
+        if filter_specs:
+            users = [u for u in users if any(spec in [s.lower() for s in u.get("specialties", [])] for spec in filter_specs)]
+
+    if filters.get("hasCalendarConnected"):
+        users = [u for u in users if u.get("hasCalendarConnected")]
+
+    if filters.get("meetingTypes"):
+        filter_meeting_types = filters["meetingTypes"]
+        if not isinstance(filter_meeting_types, list):
+            filter_meeting_types = [filter_meeting_types]
+        filter_meeting_types = [m.lower() for m in filter_meeting_types if m]
+        if filter_meeting_types:
+            users = [u for u in users if any(m_type in [m.lower() for m in u.get("meetingTypes", [])] for m_type in filter_meeting_types)]
+
+    if filters.get("firm"):
+        filter_firm = filters["firm"].lower()
+        users = [u for u in users if filter_firm in u.get("firm", "").lower()]
+
+    if filters.get("languages"):
+        filter_languages = filters["languages"]
+        if not isinstance(filter_languages, list):
+            filter_languages = [filter_languages]
+        filter_languages = [language.lower() for language in filter_languages if language]
+        if filter_languages:
+            users = [u for u in users if any(language in [user_language.lower() for user_language in u.get("languages", [])] for language in filter_languages)]
+
+    return users
+
+def _score_user(user, filters):
+    """Score a single user based on weighted criteria"""
+    score = 0
+    
+    if filters.get("location"):
+        location_input = filters["location"]
+        location_query = str(location_input[0]).lower() if isinstance(location_input, list) and location_input else str(location_input).lower()
+        if location_query:
+            address = user.get("address", "").lower()
+            user_licenses = [str(s).lower() for s in user.get("licenseState", [])]
+            match = re.search(r"(?P<city>[\w\s.-]+?)\s*,\s*(?P<state>[a-z]{2})\b", address, re.IGNORECASE)
+            if match:
+                address_parts = {k: v.strip() for k, v in match.groupdict().items()}
+                addr_city, addr_state_abbr = address_parts.get("city", ""), address_parts.get("state", "")
+                addr_state_full = SYNTHETIC_STATE_MAP.get(addr_state_abbr, "")
+                if location_query in addr_city and addr_state_full in user_licenses:
+                    score += 3
+            if location_query in user_licenses:
+                score += 2
+    
+    if filters.get("name") and user.get("name", "").lower() == filters["name"].lower():
+        score += 10
+    if filters.get("firstName") and user.get("firstName", "").lower() == filters["firstName"].lower():
+        score += 5
+    if filters.get("lastName") and user.get("lastName", "").lower() == filters["lastName"].lower():
+        score += 5
+    
+    if filters.get("rating"):
+        try:
+            if float(filters["rating"]) <= float(user.get("rating", 0)) < float(filters["rating"]) + 1:
+                score += 2
+        except (ValueError, TypeError):
+            pass
+
+    if filters.get("hasCalendarConnected") and user.get("hasCalendarConnected"):
+        score += 2
+    
+    if filters.get("meetingTypes"):
+        filter_types = filters["meetingTypes"]
+        if not isinstance(filter_types, list):
+            filter_types = [filter_types]
+        if any(m.lower() in [t.lower() for t in user.get("meetingTypes", [])] for m in filter_types):
+            score += 1
+    
+    if filters.get("firm") and filters["firm"].lower() in user.get("firm", "").lower():
+        score += 5
+
+    if filters.get("languages"):
+        filter_langs = filters["languages"]
+        if not isinstance(filter_langs, list):
+            filter_langs = [filter_langs]
+        if any(language.lower() in [ul.lower() for ul in user.get("languages", [])] for language in filter_langs):
+            score += 2
+
+    if filters.get("review_keywords"):
+        keywords = filters["review_keywords"]
+        if not isinstance(keywords, list):
+            keywords = [keywords]
+        review_content = user.get("reviewContent", "").lower()
+        for keyword in keywords:
+            if keyword.lower() in review_content:
+                score += 3
+            
+    return score
+
+
+def run(label: str, matcher, queries: list, budget: float):
+    """Run queries until done or the time budget is spent; return (qps, results)"""
+    results = []
+    start = time.perf_counter()
+    for filters in queries:
+        results.append(matcher(filters))
+        if time.perf_counter() - start > budget:
+            break
+    elapsed = time.perf_counter() - start
+    qps = len(results) / elapsed if elapsed else float("inf")
+    print(f"  {label:<22} {len(results):>5} queries  {qps:>10.1f} q/s  {1000 / qps if qps else 0:>9.2f} ms/q")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--budget", type=float, default=30.0, help="seconds per engine per size")
+    args = parser.parse_args()
+
+    queries = synthetic_queries(args.queries)
+    for size in args.sizes:
+        print(f"Directory of {size:,} attorneys")
+        users = synthetic_directory(size)
+
+        start = time.perf_counter()
+        index = AttorneyIndex(users, SYNTHETIC_STATE_MAP)
+        print(f"  index build            {time.perf_counter() - start:.2f}s")
+
+        baseline = run("baseline linear scan", lambda f: baseline_find_best_matches(f, users), queries, args.budget)
+        indexed = run("AttorneyIndex", lambda f: index.top_matches(f, limit=3), queries, args.budget)
+
+        mismatches = sum(1 for a, b in zip(baseline, indexed) if [id(u) for u in a] != [id(u) for u in b])
+        print(f"  ranking mismatches     {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Serving mode load test
+Drives concurrent /search turns at the sync Flask app and the async ASGI app and compares throughput and latency
+
+Usage: python benchmarks/bench_serving.py [--requests 60] [--concurrency 30] [--llm-latency 0.25]
+       python benchmarks/bench_serving.py --url http://localhost:8080 [--requests ...]
+
+Without --url both apps run in this process on a synthetic attorney directory, with Gemini
+replaced by canned replies after --llm-latency seconds. The sync app is served by one
+non-threaded WSGI server, like the Dockerfile's single gunicorn sync worker; the async app by
+uvicorn. With --url the load is sent to a running deployment instead.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+
+QUERIES = [
+    "I need a divorce lawyer in Miami",
+    "Looking for a Spanish speaking immigration attorney in Texas",
+    "personal injury lawyer in Phoenix with 4.5 stars",
+    "criminal defense attorney in Los Angeles, virtual meetings",
+]
+
+
+class CannedReply:
+    def __init__(self, text):
+        self.text = text
+
+
+def canned_reply(contents):
+    if isinstance(contents, str) and "extracting filters" in contents:
+        return CannedReply(json.dumps({"specialties": ["family law"], "licenseState": "Florida"}))
+    return CannedReply("This lawyer focuses on exactly this kind of case.")
+
+
+def patch_gemini(app_module, latency: float):
+    """Replace both Gemini clients with canned replies after a fixed delay"""
+    def generate_content(model, contents, config=None):
+        time.sleep(latency)
+        return canned_reply(contents)
+
+    async def generate_content_async(model, contents, config=None):
+        await asyncio.sleep(latency)
+        return canned_reply(contents)
+
+    app_module.client.models.generate_content = generate_content
+    app_module.client.aio.models.generate_content = generate_content_async
+    # Every turn should pay for its LLM calls
+    app_module.app.config['LLM_CACHE_TTLS'] = {}
+
+
+def start_sync_server(flask_app, port: int):
+    import logging
+    from werkzeug.serving import make_server
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", port, flask_app, threaded=False)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_async_server(asgi_app, port: int):
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(asgi_app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+async def run_load(url: str, requests: int, concurrency: int):
+    """Send `requests` new-chat /search turns with at most `concurrency` in flight"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async with httpx.AsyncClient(timeout=None, limits=httpx.Limits(max_connections=concurrency)) as http:
+        async def one(i):
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    response = await http.post(f"{url}/search", data={"query": f"{QUERIES[i % len(QUERIES)]} (case {i})"})
+                    if response.status_code != 200 or "error" in response.json():
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        elapsed = time.perf_counter() - started
+    return latencies, errors, elapsed
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def report(name, latencies, errors, elapsed):
+    print(f"{name:>8}: {len(latencies) / elapsed:7.2f} req/s  "
+          f"p50 {percentile(latencies, 50) * 1000:7.0f} ms  p95 {percentile(latencies, 95) * 1000:7.0f} ms  "
+          f"p99 {percentile(latencies, 99) * 1000:7.0f} ms  mean {statistics.mean(latencies) * 1000:7.0f} ms  "
+          f"errors {errors}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="load-test a running deployment instead of the in-process apps")
+    parser.add_argument("--requests", type=int, default=60)
+    parser.add_argument("--concurrency", type=int, default=30)
+    parser.add_argument("--llm-latency", type=float, default=0.25, help="simulated seconds per Gemini call")
+    parser.add_argument("--attorneys", type=int, default=10000)
+    args = parser.parse_args()
+
+    if args.url:
+        report("target", *asyncio.run(run_load(args.url.rstrip("/"), args.requests, args.concurrency)))
+        return
+
+    import app as app_module
+    from attorney_index import AttorneyIndex
+    from bench_search import synthetic_directory
+
+    patch_gemini(app_module, args.llm_latency)
+    app_module.ATTORNEY_INDEX = AttorneyIndex(synthetic_directory(args.attorneys), app_module.STATE_MAP)
+    import asgi_app
+
+    print(f"{args.requests} /search turns, {args.concurrency} concurrent clients, "
+          f"{args.llm_latency * 1000:.0f} ms per Gemini call")
+    sync_server = start_sync_server(app_module.app, 8701)
+    report("sync", *asyncio.run(run_load("http://127.0.0.1:8701", args.requests, args.concurrency)))
+    sync_server.shutdown()
+
+    async_server = start_async_server(asgi_app.app, 8702)
+    report("async", *asyncio.run(run_load("http://127.0.0.1:8702", args.requests, args.concurrency)))
+    async_server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,386 @@
+"""
+Local stand-ins for Gemini and Firestore
+Used by the offline benchmarks so the backend can be measured without Google credentials or network access
+
+FakeGemini answers each prompt type with a canned reply (JSON where the app expects JSON) after a
+delay drawn from a per-prompt-type latency distribution. FakeFirestore keeps documents in memory
+and implements the subset of the client API the session stores use.
+"""
+
+import asyncio
+import contextlib
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+
+# (prompt type, marker) in match order; the first marker found in the prompt names its type.
+# Markers are phrases from the prompts in app.py, so they change when a prompt is rewritten.
+PROMPT_TYPES = [
+    ("parse_query", "You are extracting filters from a legal query"),
+    ("explain_matches_batched", "Respond with ONLY a JSON array, one object per lawyer"),
+    ("explain_match", "You matched this lawyer"),
+    ("goodbye", "The user is saying goodbye"),
+    ("got_letter_flow", "legal case intake flow"),
+    ("drafting_flow", "You are helping gather information for a legal document"),
+    ("document_requirements", "determine what information is needed"),
+    ("generate_document", "You are a legal document drafting expert"),
+    ("customize_template", "built from a standard template"),
+    ("select_sections", "You are routing an edit request"),
+    ("edit_section", "You are revising one section"),
+    ("generate_title", "generate a short, descriptive title"),
+    ("analyze_chunk", "because it is too long to read at once"),
+    ("analyze_reduce", "each part was summarized separately"),
+    ("analyze_upload", "Read the document and determine"),
+]
+
+# Median seconds per prompt type, roughly what gemini-2.5-flash takes for these prompts
+DEFAULT_LATENCY = {
+    "parse_query": 0.6,
+    "explain_matches_batched": 1.2,
+    "explain_match": 0.7,
+    "goodbye": 0.5,
+    "got_letter_flow": 0.9,
+    "drafting_flow": 0.9,
+    "document_requirements": 0.9,
+    "generate_document": 6.0,
+    "customize_template": 1.5,
+    "select_sections": 0.6,
+    "edit_section": 1.5,
+    "generate_title": 0.4,
+    "analyze_chunk": 2.0,
+    "analyze_reduce": 2.5,
+    "analyze_upload": 3.0,
+    "other": 0.8,
+}
+
+SPECIALTY_KEYWORDS = {
+    "divorce": "Family Law", "custody": "Family Law", "dui": "Criminal Law", "criminal": "Criminal Law",
+    "injury": "Personal Injury", "accident": "Personal Injury", "visa": "Immigration Law",
+    "immigration": "Immigration Law", "will": "Estate Planning", "business": "Business Law",
+    "landlord": "Real Estate Law", "eviction": "Real Estate Law", "ticket": "Traffic Law",
+}
+STATES = ["Texas", "Florida", "California", "Arizona"]
+DOCUMENT_TYPES = {"nda": "non-disclosure agreement", "non-disclosure": "non-disclosure agreement",
+                  "lease": "rental agreement", "rental": "rental agreement", "demand": "demand letter",
+                  "cease": "cease and desist letter"}
+
+
+class LatencyModel:
+    """Log-normal delays around a median, scaled down so a benchmark run stays short"""
+
+    def __init__(self, medians: dict = None, sigma: float = 0.35, scale: float = 1.0, seed: int = 3):
+        self.medians = {**DEFAULT_LATENCY, **(medians or {})}
+        self.sigma = sigma
+        self.scale = scale
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self, prompt_type: str):
+        median = self.medians.get(prompt_type, self.medians["other"]) * self.scale
+        if median <= 0:
+            return 0.0
+        with self._lock:
+            return self._rng.lognormvariate(math.log(median), self.sigma)
+
+
+class FakeUsage:
+    def __init__(self, prompt: str, reply: str):
+        # About four characters per token, like Gemini's tokenizer on English text
+        self.prompt_token_count = len(prompt) // 4
+        self.candidates_token_count = len(reply) // 4
+
+
+class FakeResponse:
+    def __init__(self, text: str, usage: FakeUsage = None):
+        self.text = text
+        self.usage_metadata = usage
+
+
+def prompt_text(contents):
+    """The text parts of generate_content contents, joined"""
+    if isinstance(contents, str):
+        return contents
+    return "\n".join(part for part in contents if isinstance(part, str))
+
+
+def prompt_type(text: str):
+    for name, marker in PROMPT_TYPES:
+        if marker in text:
+            return name
+    return "other"
+
+
+def parse_query_reply(text: str):
+    match = re.search(r'Query: "(.*)"', text, re.S)
+    query = (match.group(1) if match else text).lower()
+    if "letter" in query:
+        return {"intent": "got-letter"}
+    if any(word in query for word in ("draft", "create a", "write a")):
+        return {"intent": "draft_document"}
+    if "bye" in query:
+        return {"intent": "goodbye"}
+    if "?" in query and "lawyer" not in query:
+        return {"intent": "general_question", "response": "In most cases you have 30 days to respond."}
+    filters = {"specialties": sorted({specialty for word, specialty in SPECIALTY_KEYWORDS.items() if word in query})
+               or ["Family Law"]}
+    for state in STATES:
+        if state.lower() in query:
+            filters["licenseState"] = state
+    if "spanish" in query:
+        filters["languages"] = ["Spanish"]
+    return filters
+
+
+def got_letter_reply(text: str):
+    match = re.search(r"Current step: (\d+)", text)
+    step = int(match.group(1)) if match else 1
+    done = step >= 6
+    return {
+        "response": "Thanks, your case is all set." if done else f"Got it. Next, step {step + 1}.",
+        "next_step": step + 1,
+        "extracted_data": {f"step_{step}": "answered"},
+        "should_end_flow": done,
+        "completion_message": "Your case has been created. A lawyer will contact you shortly." if done else "",
+    }
+
+
+def document_type(text: str):
+    lowered = text.lower()
+    return next((name for word, name in DOCUMENT_TYPES.items() if word in lowered), "legal document")
+
+
+def canned_document(text: str):
+    """A few pages of document text, unique per prompt so the DOCX cache sees new content"""
+    title = document_type(text).title()
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+    sections = [f"# {title}", f"Reference: {digest}", "This Agreement is made between Party A and Party B."]
+    for n in range(1, 13):
+        sections.append(f"## {n}. Section {n}")
+        sections.append(" ".join(["Each party shall perform its obligations under this section in good faith."] * 6))
+        sections.append(f"- Obligation {n}.1 applies from the effective date.\n- Obligation {n}.2 survives termination.")
+    sections.append("**Signed:** ____________________")
+    return "\n\n".join(sections)
+
+
+def canned_reply(kind: str, text: str):
+    """Reply text for a prompt of the given type"""
+    if kind == "parse_query":
+        return json.dumps(parse_query_reply(text))
+    if kind == "explain_matches_batched":
+        count = len(re.findall(r"^- id: \d+", text, re.M))
+        return json.dumps([{"id": i, "explanation": "Their practice focuses on cases like yours."} for i in range(count)])
+    if kind == "explain_match":
+        return "You'll be in good hands: their practice focuses on cases just like yours."
+    if kind == "goodbye":
+        return "Thanks for stopping by OpenLaw. We're here whenever you need us. Take care!"
+    if kind == "got_letter_flow":
+        return json.dumps(got_letter_reply(text))
+    if kind == "drafting_flow":
+        return json.dumps({"extracted_data": {"details": "provided"}, "next_question": "Anything else to include?",
+                           "has_sufficient_info": True, "missing_info": []})
+    if kind == "document_requirements":
+        return json.dumps({"document_type": document_type(text), "required_info": ["parties", "effective date"],
+                           "next_question": "Who are the parties, and when should it take effect?",
+                           "extracted_data": {}, "confidence": "high", "has_sufficient_info": False})
+    if kind == "generate_document":
+        return canned_document(text)
+    if kind == "customize_template":
+        return "1. The parties agree to the additional terms discussed, which form part of this agreement."
+    if kind == "select_sections":
+        return json.dumps({"is_edit": True, "sections": [1], "new_section": None})
+    if kind == "edit_section":
+        match = re.search(r"section(?: to write \(currently empty\))?:\n(.*?)\n\nRequested change", text, re.S)
+        return (match.group(1) if match else "") + "\n\nThis section was revised as requested."
+    if kind == "generate_title":
+        return "Legal help request"
+    if kind == "analyze_chunk":
+        return "This part sets out the parties' obligations and a 30 day deadline to respond."
+    return ("This is a legal notice. It requires the recipient to respond within 30 days, "
+            "and explains what happens if they don't.")
+
+
+class FakeModels:
+    def __init__(self, gemini):
+        self._gemini = gemini
+
+    def generate_content(self, model, contents, config=None):
+        text = prompt_text(contents)
+        kind = prompt_type(text)
+        self._gemini.record(kind)
+        time.sleep(self._gemini.latency.sample(kind))
+        reply = canned_reply(kind, text)
+        return FakeResponse(reply, FakeUsage(text, reply))
+
+    def generate_content_stream(self, model, contents, config=None):
+        text = prompt_text(contents)
+        kind = prompt_type(text)
+        self._gemini.record(kind)
+        reply = canned_reply(kind, text)
+        pieces = [reply[i:i + 400] for i in range(0, len(reply), 400)] or [""]
+        delay = self._gemini.latency.sample(kind) / len(pieces)
+        for i, piece in enumerate(pieces):
+            time.sleep(delay)
+            yield FakeResponse(piece, FakeUsage(text, reply) if i == len(pieces) - 1 else None)
+
+
+class FakeAsyncModels:
+    def __init__(self, gemini):
+        self._gemini = gemini
+
+    async def generate_content(self, model, contents, config=None):
+        text = prompt_text(contents)
+        kind = prompt_type(text)
+        self._gemini.record(kind)
+        await asyncio.sleep(self._gemini.latency.sample(kind))
+        reply = canned_reply(kind, text)
+        return FakeResponse(reply, FakeUsage(text, reply))
+
+
+class FakeAio:
+    def __init__(self, gemini):
+        self.models = FakeAsyncModels(gemini)
+
+
+class FakeGemini:
+    """Drop-in for genai.Client: client.models, client.aio.models, with call counts per prompt type"""
+
+    def __init__(self, latency: LatencyModel = None):
+        self.latency = latency or LatencyModel()
+        self.models = FakeModels(self)
+        self.aio = FakeAio(self)
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def record(self, kind: str):
+        with self._lock:
+            self.calls[kind] = self.calls.get(kind, 0) + 1
+
+
+class FakeSnapshot:
+    def __init__(self, doc_id: str, data: dict = None):
+        self.id = doc_id
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        if self._data is None:
+            return None
+        return {key: list(value) if isinstance(value, list) else value for key, value in self._data.items()}
+
+
+class FakeDocument:
+    def __init__(self, db, path: str):
+        self._db = db
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    def collection(self, name: str):
+        return FakeCollection(self._db, f"{self.path}/{name}")
+
+    def get(self, transaction=None):
+        self._db.wait("read")
+        with self._db.lock:
+            self._db.reads += 1
+            return FakeSnapshot(self.id, self._db.docs.get(self.path))
+
+    def set(self, update: dict, merge: bool = False):
+        self._db.wait("write")
+        self._db.apply(self.path, update, merge)
+
+
+class FakeCollection:
+    def __init__(self, db, path: str):
+        self._db = db
+        self.path = path
+
+    def document(self, doc_id: str):
+        return FakeDocument(self._db, f"{self.path}/{doc_id}")
+
+
+class FakeTransaction:
+    """Applies writes immediately; the benchmarks never write one chat from two threads"""
+
+    def set(self, ref, update: dict, merge: bool = False):
+        ref.set(update, merge)
+
+
+class FakeFirestore:
+    """In-memory Firestore client with a fixed round-trip delay per read or write batch"""
+
+    def __init__(self, read_latency: float = 0.0, write_latency: float = 0.0):
+        self.docs = {}
+        self.reads = 0
+        self.writes = 0
+        self.latency = {"read": read_latency, "write": write_latency}
+        self.lock = threading.Lock()
+
+    def wait(self, kind: str):
+        if self.latency[kind]:
+            time.sleep(self.latency[kind])
+
+    def collection(self, name: str):
+        return FakeCollection(self, name)
+
+    def get_all(self, refs):
+        self.wait("read")
+        with self.lock:
+            self.reads += len(refs)
+            return [FakeSnapshot(ref.id, self.docs.get(ref.path)) for ref in refs]
+
+    def transaction(self):
+        return FakeTransaction()
+
+    def apply(self, path: str, update: dict, merge: bool):
+        from firebase_admin import firestore
+
+        with self.lock:
+            doc = dict(self.docs.get(path) or {}) if merge else {}
+            for key, value in update.items():
+                if isinstance(value, firestore.ArrayUnion):
+                    existing = doc.get(key, [])
+                    doc[key] = list(existing) + [item for item in value.values if item not in existing]
+                elif value is firestore.DELETE_FIELD:
+                    doc.pop(key, None)
+                else:
+                    doc[key] = value
+            self.docs[path] = doc
+            self.writes += 1
+
+
+class FakeFirestoreModule:
+    """Stands in for firebase_admin.firestore inside the session stores"""
+
+    def __init__(self):
+        from firebase_admin import firestore
+
+        self.ArrayUnion = firestore.ArrayUnion
+        self.DELETE_FIELD = firestore.DELETE_FIELD
+
+    @staticmethod
+    def transactional(fn):
+        return fn
+
+
+@contextlib.contextmanager
+def fake_firestore_module():
+    """Make `from firebase_admin import firestore` return FakeFirestoreModule while stores are built"""
+    import firebase_admin
+
+    real = firebase_admin.firestore
+    firebase_admin.firestore = FakeFirestoreModule()
+    try:
+        yield
+    finally:
+        firebase_admin.firestore = real
+
+
+def install(app_module, gemini: FakeGemini, db: FakeFirestore):
+    """Point an imported app module at the fakes, rebuilding its session store on db"""
+    app_module.client = gemini
+    app_module.db = db
+    with fake_firestore_module():
+        app_module.session_store = app_module.build_session_store(db)
@@ -0,0 +1,353 @@
+"""
+Response caching
+In-process LRU with per-entry TTL, plus optional on-disk or Redis-compatible backing tiers
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+
+
+def cache_key(*parts):
+    """Stable SHA-256 key over the given parts"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class TTLCache:
+    """Thread-safe LRU cache where every entry carries its own expiry"""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float):
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DiskCacheTier:
+    """One JSON file per key under a directory; survives restarts and is shared between workers"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        try:
+            with open(self._path(key), "r") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry["expires_at"] < time.time():
+            self.delete(key)
+            return None
+        return entry["value"]
+
+    def set(self, key, value, ttl: float):
+        # Write then rename so concurrent readers never see a partial file
+        tmp_path = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"value": value, "expires_at": time.time() + ttl}, f)
+        os.replace(tmp_path, self._path(key))
+
+    def delete(self, key):
+        try:
+            os.unlink(self._path(key))
+        except OSError:
+            pass
+
+
+class RedisCacheTier:
+    """Backing tier for any Redis-compatible server (Redis, Valkey, Memorystore)"""
+
+    def __init__(self, url: str, prefix: str = "openlaw:cache:"):
+        import redis  # optional dependency, only needed when a Redis URL is configured
+
+        self.redis = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.redis.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl: float):
+        self.redis.set(self.prefix + key, json.dumps(value), ex=max(1, int(ttl)))
+
+    def delete(self, key):
+        self.redis.delete(self.prefix + key)
+
+
+class SQLiteCacheTier:
+    """Backing tier in a local SQLite file, capped at max_rows (oldest expiry evicted first)"""
+
+    def __init__(self, path: str, max_rows: int = 10000):
+        import sqlite3
+
+        self.path = path
+        self.max_rows = max_rows
+        self._local = threading.local()
+        self._sqlite3 = sqlite3
+        with self._connection() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_expires_at ON cache (expires_at)")
+
+    def _connection(self):
+        # sqlite3 connections can't be shared across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._sqlite3.connect(self.path, timeout=5)
+        return conn
+
+    def get(self, key):
+        row = self._connection().execute(
+            "SELECT value FROM cache WHERE key = ? AND expires_at >= ?", (key, time.time())).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value, ttl: float):
+        with self._connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?)", (key, json.dumps(value), time.time() + ttl))
+            conn.execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),))
+            conn.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_rows,))
+
+    def delete(self, key):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+
+class FirestoreCacheTier:
+    """Backing tier in a Firestore collection, shared by every instance of the service"""
+
+    def __init__(self, db, collection: str):
+        self.collection = db.collection(collection)
+
+    def get(self, key):
+        doc = self.collection.document(key).get()
+        if not doc.exists:
+            return None
+        entry = doc.to_dict()
+        if entry.get("expires_at", 0) < time.time():
+            return None
+        return entry.get("value")
+
+    def set(self, key, value, ttl: float):
+        self.collection.document(key).set({"value": value, "expires_at": time.time() + ttl})
+
+    def delete(self, key):
+        self.collection.document(key).delete()
+
+
+class TieredCache:
+    """Memory tier in front of an optional shared tier, with hit/miss counters per namespace.
+
+    Backing tier errors are logged and treated as misses so a flaky cache
+    server never fails a request.
+    """
+
+    def __init__(self, max_entries: int = 1024, backing=None):
+        self.memory = TTLCache(max_entries)
+        self.backing = backing
+        self.memory_hits = Counter()
+        self.backing_hits = Counter()
+        self.misses = Counter()
+
+    def get(self, key, namespace: str = "default", ttl: float = 60):
+        value = self.memory.get(key)
+        if value is not None:
+            self.memory_hits[namespace] += 1
+            return value
+        if self.backing is not None:
+            try:
+                value = self.backing.get(key)
+            except Exception as e:
+                print(f"Cache backing tier read failed: {e}")
+                value = None
+            if value is not None:
+                self.backing_hits[namespace] += 1
+                self.memory.set(key, value, ttl)
+                return value
+        self.misses[namespace] += 1
+        return None
+
+    def set(self, key, value, ttl: float):
+        self.memory.set(key, value, ttl)
+        if self.backing is not None:
+            try:
+                self.backing.set(key, value, ttl)
+            except Exception as e:
+                print(f"Cache backing tier write failed: {e}")
+
+    def delete(self, key):
+        self.memory.delete(key)
+        if self.backing is not None:
+            try:
+                self.backing.delete(key)
+            except Exception as e:
+                print(f"Cache backing tier delete failed: {e}")
+
+    def stats(self):
+        """Hit/miss counts per namespace"""
+        namespaces = set(self.memory_hits) | set(self.backing_hits) | set(self.misses)
+        stats = {"entries": len(self.memory), "namespaces": {}}
+        for namespace in sorted(namespaces):
+            hits = self.memory_hits[namespace] + self.backing_hits[namespace]
+            lookups = hits + self.misses[namespace]
+            stats["namespaces"][namespace] = {
+                "memory_hits": self.memory_hits[namespace],
+                "backing_hits": self.backing_hits[namespace],
+                "misses": self.misses[namespace],
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            }
+        return stats
+
+
+def backing_tier_from_config(directory: str = None, redis_url: str = None, prefix: str = "openlaw:cache:"):
+    """Build the optional shared tier; Redis wins when both are configured"""
+    if redis_url:
+        return RedisCacheTier(redis_url, prefix)
+    if directory:
+        return DiskCacheTier(directory)
+    return None
+
+
+class BlobCache:
+    """Content-addressed byte cache bounded by total size.
+
+    Entries live in an in-memory LRU up to max_memory_bytes; entries evicted
+    from memory spill to spill_dir (when configured), which is itself pruned
+    oldest-first beyond max_spill_bytes.
+    """
+
+    def __init__(self, max_memory_bytes: int, spill_dir: str = None, max_spill_bytes: int = 0):
+        self.max_memory_bytes = max_memory_bytes
+        self.spill_dir = spill_dir
+        self.max_spill_bytes = max_spill_bytes
+        self.memory_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.spill_hits = 0
+        self.misses = 0
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def _spill_path(self, key):
+        return os.path.join(self.spill_dir, f"{key}.bin")
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return data
+        if self.spill_dir:
+            try:
+                with open(self._spill_path(key), "rb") as f:
+                    data = f.read()
+                os.utime(self._spill_path(key))
+            except OSError:
+                data = None
+            if data is not None:
+                with self._lock:
+                    self.spill_hits += 1
+                self._remember(key, data)
+                return data
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, data: bytes):
+        self._remember(key, data)
+
+    def _remember(self, key, data: bytes):
+        evicted = []
+        with self._lock:
+            if key in self._entries:
+                self.memory_bytes -= len(self._entries.pop(key))
+            if len(data) > self.max_memory_bytes:
+                evicted.append((key, data))
+            else:
+                self._entries[key] = data
+                self.memory_bytes += len(data)
+                while self.memory_bytes > self.max_memory_bytes:
+                    old_key, old_data = self._entries.popitem(last=False)
+                    self.memory_bytes -= len(old_data)
+                    evicted.append((old_key, old_data))
+        for old_key, old_data in evicted:
+            self._spill(old_key, old_data)
+
+    def _spill(self, key, data: bytes):
+        if not self.spill_dir or len(data) > self.max_spill_bytes:
+            return
+        path = self._spill_path(key)
+        try:
+            if not os.path.exists(path):
+                tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            self._prune_spill()
+        except OSError as e:
+            print(f"Could not spill cache entry to disk: {e}")
+
+    def _prune_spill(self):
+        files = []
+        for entry in os.scandir(self.spill_dir):
+            if entry.name.endswith(".bin"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_spill_bytes:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+            except OSError:
+                pass
+
+    def stats(self):
+        lookups = self.memory_hits + self.spill_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "memory_bytes": self.memory_bytes,
+            "memory_hits": self.memory_hits,
+            "spill_hits": self.spill_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.spill_hits) / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,126 @@
+"""
+Drafted documents as sections
+Splits generated markdown at its headings so an edit can regenerate and splice back only the sections it touches
+"""
+
+import re
+
+PARAGRAPH_BREAK = '\n\n'
+# A paragraph that is only a heading: markdown, bold (except a letter's "Re:" line), or an all-caps line like "3. TERMINATION"
+HEADING = re.compile(
+    r"^(?:#{1,4}\s+(?P<markdown>[^\n]+)"
+    r"|\*\*(?!Re:)(?P<bold>[^*\n]{1,100})\*\*:?"
+    r"|(?P<caps>(?:(?:\d+\.)+|ARTICLE [IVXLC\d]+[.:]?|SECTION \d+[.:]?)?\s*[A-Z][A-Z0-9 ,;&'/()-]{2,80}:?))$"
+)
+NUMBER = re.compile(r"^(?:article|section|clause)?\s*(\d+)[.:)]", re.I)
+SECTION_REFERENCE = re.compile(r"\b(?:section|clause|paragraph|article)\s+(\d+)\b", re.I)
+EDIT_REQUEST = re.compile(
+    r"\b(?:change|modify|update|replace|revise|rewrite|reword|edit|amend|adjust|add|insert|include|remove|delete|drop|"
+    r"increase|decrease|raise|lower|reduce|extend|shorten|lengthen|make it|make the|set the|switch|instead of|"
+    r"should (?:be|say|read))\b",
+    re.I,
+)
+# Words that tie an instruction to the drafted document rather than to the user's own situation
+DOCUMENT_REFERENCE = re.compile(
+    r"\b(?:document|draft|agreement|contract|lease|letter|nda|section|clause|paragraph|article|heading|title|"
+    r"wording|signature)s?\b|\b(?:make|change|update|revise|rewrite|reword|edit|shorten|lengthen) it\b",
+    re.I,
+)
+STOP_WORDS = {"and", "the", "of", "for", "to", "a", "an", "in", "on", "or", "with", "by", "this", "that", "agreement"}
+
+
+def heading_text(paragraph: str):
+    """The heading a paragraph consists of, or None if it is body text"""
+    paragraph = paragraph.strip()
+    if '\n' in paragraph:
+        return None
+    match = HEADING.match(paragraph)
+    if not match:
+        return None
+    return (match.group('markdown') or match.group('bold') or match.group('caps')).strip().rstrip(':')
+
+
+def split_document(markdown: str):
+    """[{"heading", "text"}] in document order; text includes the heading line.
+
+    Whatever precedes the first heading (usually the title) is a section with
+    heading "". A document without headings, such as a letter, is split into
+    its paragraphs so edits still touch only part of it.
+    """
+    paragraphs = [p.strip('\n') for p in markdown.strip().split(PARAGRAPH_BREAK) if p.strip()]
+    headings = [heading_text(p) for p in paragraphs]
+    # The title is the first heading; a document whose only heading is its title has no sections
+    if not any(headings[1:]):
+        return [{"heading": "", "text": p} for p in paragraphs]
+
+    sections = []
+    for paragraph, heading in zip(paragraphs, headings):
+        if heading is not None and (sections or not paragraph.startswith('# ')):
+            sections.append({"heading": heading, "text": paragraph})
+        elif sections:
+            sections[-1]["text"] += PARAGRAPH_BREAK + paragraph
+        else:
+            sections.append({"heading": "", "text": paragraph})
+    return sections
+
+
+def join_document(sections: list):
+    return PARAGRAPH_BREAK.join(section["text"].strip() for section in sections)
+
+
+def keywords(text: str):
+    words = re.findall(r"[a-z]+", NUMBER.sub("", text.lower()))
+    return [word for word in words if word not in STOP_WORDS and len(word) > 2]
+
+
+def looks_like_edit(instruction: str):
+    """Whether an instruction uses edit wording; cheap, for guessing before the document is loaded"""
+    return bool(EDIT_REQUEST.search(instruction or ""))
+
+
+def is_edit_request(instruction: str, sections: list):
+    """Edit wording that refers to the document or names one of its sections.
+
+    Edit verbs alone are common in ordinary questions, so they only count
+    next to such a reference; a single shared heading word is not one.
+
+    >>> sections = split_document("# Lease\\n\\n## 1. Rent\\n\\nRent is $900.\\n\\n## 2. Governing Law\\n\\nFlorida.")
+    >>> is_edit_request("can you find me a lawyer to help reduce my fine", sections)
+    False
+    >>> is_edit_request("I want to change lawyers", sections)
+    False
+    >>> is_edit_request("change the rent to $950", sections)
+    True
+    """
+    if not looks_like_edit(instruction):
+        return False
+    return bool(DOCUMENT_REFERENCE.search(instruction) or named_sections(sections, instruction))
+
+
+def named_sections(sections: list, instruction: str):
+    """Indices of the sections an instruction names by number ("section 3") or by full heading; [] if none"""
+    text = instruction.lower()
+    numbers = {int(n) for n in SECTION_REFERENCE.findall(instruction)}
+    if numbers:
+        found = [i for i, section in enumerate(sections)
+                 if (match := NUMBER.match(section["heading"])) and int(match.group(1)) in numbers]
+        if found:
+            return found
+    return [i for i, section in enumerate(sections)
+            if (words := keywords(section["heading"])) and re.search(r"\b" + r"\W+".join(words) + r"\b", text)]
+
+
+def match_sections(sections: list, instruction: str):
+    """Indices of the sections an edit instruction names, found without an LLM; [] if unclear.
+
+    "section 3" style references win; otherwise a section whose full heading
+    appears in the instruction; otherwise the single section sharing a whole
+    heading keyword with it. Several partial matches are ambiguous.
+    """
+    named = named_sections(sections, instruction)
+    if named:
+        return named
+    text = instruction.lower()
+    partial = [i for i, section in enumerate(sections)
+               if any(re.search(rf"\b{re.escape(word)}\b", text) for word in keywords(section["heading"]))]
+    return partial if len(partial) == 1 else []
@@ -0,0 +1,291 @@
+"""
+Legal document templates
+Common document types rendered locally from the drafting flow's collected data, with placeholder values for the rest
+"""
+
+import datetime
+import math
+import re
+
+DISCLAIMER = ("*This document was generated from a standard template for informational purposes only and is not "
+              "legal advice. Have a licensed attorney review it before you sign or send it.*")
+# Drafting-flow bookkeeping, never document content
+IGNORED_KEYS = {"document_type", "use_dummy_data"}
+
+
+def normalize_key(key: str):
+    return re.sub(r"[^a-z0-9]+", "_", str(key).lower()).strip("_")
+
+
+def today():
+    return datetime.date.today().strftime("%B %d, %Y")
+
+
+def money(value: str):
+    """'1500' -> '$1,500'; anything that isn't a bare finite number is kept as given"""
+    try:
+        amount = float(str(value).replace(",", "").lstrip("$"))
+    except ValueError:
+        return value
+    if not math.isfinite(amount):
+        return value
+    return f"${amount:,.0f}" if amount == int(amount) else f"${amount:,.2f}"
+
+
+class Field:
+    """A template placeholder: the data keys that can fill it and its value when none do"""
+
+    def __init__(self, name: str, placeholder, aliases: tuple = (), is_money: bool = False):
+        self.name = name
+        self.placeholder = placeholder  # a string, or a callable for values like today's date
+        self.keys = {normalize_key(key) for key in (name,) + aliases}
+        self.is_money = is_money
+
+    def value(self, data: dict):
+        for key, value in data.items():
+            if normalize_key(key) in self.keys and value not in (None, "", [], {}):
+                value = ", ".join(map(str, value)) if isinstance(value, list) else str(value).strip()
+                return money(value) if self.is_money else value
+        return self.placeholder() if callable(self.placeholder) else self.placeholder
+
+
+class Section:
+    def __init__(self, heading: str, body: str, numbered: bool = True):
+        self.heading = heading
+        self.body = body  # markdown with {field} placeholders
+        self.numbered = numbered
+
+
+class DocumentTemplate:
+    """A document type's boilerplate: matching pattern, fields and sections in order.
+
+    The last section is the signature block; clauses the template has no
+    field for go in an "Additional Terms" section just before it. Letters
+    set headings=False and render their sections as plain paragraphs.
+    """
+
+    def __init__(self, name: str, title: str, pattern: str, fields: list, sections: list, headings: bool = True):
+        self.name = name
+        self.title = title
+        self.pattern = re.compile(pattern, re.I)
+        self.fields = fields
+        self.sections = sections
+        self.headings = headings
+
+    def values(self, data: dict):
+        return {field.name: field.value(data) for field in self.fields}
+
+    def extra_data(self, data: dict):
+        """Collected values no field of the template uses"""
+        known = set().union(*(field.keys for field in self.fields))
+        return {key: value for key, value in data.items()
+                if normalize_key(key) not in known and key not in IGNORED_KEYS and value not in (None, "", [], {})}
+
+    def render(self, data: dict, additional_terms: str = None):
+        """Markdown document, in the format docx_renderer expects"""
+        values = self.values(data)
+        sections = list(self.sections)
+        if additional_terms:
+            sections.insert(len(sections) - 1, Section("Additional Terms", additional_terms))
+        parts = [f"# {self.title}"]
+        number = 0
+        for section in sections:
+            if self.headings and section.numbered:
+                number += 1
+                parts.append(f"## {number}. {section.heading}")
+            elif self.headings:
+                parts.append(f"## {section.heading}")
+            parts.append(section.body.format(**values).strip())
+        parts.append(DISCLAIMER)
+        return "\n\n".join(parts)
+
+
+def default_additional_terms(extra: dict):
+    """Additional Terms listing the extra values as given, for when they cannot be drafted into clauses"""
+    return "\n\n".join(f"{i}. {key.replace('_', ' ').capitalize()}: {value}"
+                       for i, (key, value) in enumerate(extra.items(), 1))
+
+
+def signature_block(*roles):
+    return "\n\n".join(f"**{role}:** {{{field}}}\n\nSignature: ______________________   Date: ______________"
+                       for role, field in roles)
+
+
+RENTAL_AGREEMENT = DocumentTemplate(
+    "rental agreement", "Residential Rental Agreement",
+    r"\brent(?:al)?\s+(?:agreement|contract)\b|\blease\b|\btenancy agreement\b",
+    fields=[
+        Field("landlord", "Jordan Smith", ("landlord_name", "lessor", "owner", "property_owner")),
+        Field("tenant", "Taylor Brown", ("tenant_name", "tenants", "lessee", "renter")),
+        Field("property_address", "123 Main Street, Apt 4B, Austin, TX 78701",
+              ("address", "property", "premises", "rental_address", "rental_property")),
+        Field("start_date", today, ("lease_start", "lease_start_date", "commencement_date", "effective_date", "move_in_date")),
+        Field("lease_term", "twelve (12) months", ("term", "duration", "lease_duration", "lease_length")),
+        Field("monthly_rent", "$1,500", ("rent", "rent_amount", "monthly_rent_amount"), is_money=True),
+        Field("rent_due_day", "the first (1st) day of each month", ("due_date", "rent_due_date", "payment_date")),
+        Field("late_fee", "$50", ("late_charge", "late_payment_fee"), is_money=True),
+        Field("security_deposit", "$1,500", ("deposit", "security_deposit_amount"), is_money=True),
+        Field("utilities", "electricity, gas, internet and water", ("utilities_paid_by_tenant",)),
+        Field("governing_law", "the State of Texas", ("state", "jurisdiction", "governing_state")),
+    ],
+    sections=[
+        Section("Parties", "This Residential Rental Agreement (the \"Agreement\") is entered into on {start_date} between "
+                           "**{landlord}** (the \"Landlord\") and **{tenant}** (the \"Tenant\")."),
+        Section("Property", "The Landlord agrees to rent to the Tenant the residential property located at "
+                            "{property_address} (the \"Premises\"), for use as a private residence only."),
+        Section("Term", "The tenancy begins on {start_date} and continues for {lease_term}. Unless either party gives "
+                        "written notice at least thirty (30) days before the end of the term, the tenancy continues "
+                        "month to month on the same terms."),
+        Section("Rent", "1. The Tenant shall pay monthly rent of {monthly_rent}, due on {rent_due_day}.\n\n"
+                        "2. Rent not received within five (5) days of its due date incurs a late fee of {late_fee}.\n\n"
+                        "3. Rent shall be paid by check, bank transfer or any other method the Landlord approves in "
+                        "writing."),
+        Section("Security Deposit", "The Tenant shall pay a security deposit of {security_deposit} on signing this "
+                                    "Agreement. The Landlord shall return the deposit, less itemized deductions for "
+                                    "unpaid rent and damage beyond normal wear and tear, within the period required by "
+                                    "the laws of {governing_law}."),
+        Section("Utilities", "The Tenant is responsible for {utilities}, unless otherwise agreed in writing."),
+        Section("Maintenance and Repairs", "The Tenant shall keep the Premises clean and in good condition and promptly "
+                                           "report any needed repairs. The Landlord shall make repairs necessary to keep "
+                                           "the Premises habitable, except for damage caused by the Tenant or the "
+                                           "Tenant's guests."),
+        Section("Use and Occupancy", "The Tenant shall not sublet the Premises, assign this Agreement or make "
+                                     "alterations without the Landlord's prior written consent, and shall comply with "
+                                     "all applicable laws and building rules."),
+        Section("Entry", "The Landlord may enter the Premises for inspection, repairs or showings after giving at least "
+                         "twenty-four (24) hours' notice, except in an emergency."),
+        Section("Termination and Default", "If the Tenant fails to pay rent or breaches this Agreement, the Landlord may "
+                                           "terminate the tenancy as permitted by the laws of {governing_law}. At the end "
+                                           "of the tenancy the Tenant shall return the Premises and all keys in the "
+                                           "condition received, normal wear and tear excepted."),
+        Section("Governing Law", "This Agreement is governed by the laws of {governing_law}. It is the entire agreement "
+                                 "between the parties and may be amended only in writing signed by both parties."),
+        Section("Signatures", signature_block(("Landlord", "landlord"), ("Tenant", "tenant")), numbered=False),
+    ],
+)
+
+NDA = DocumentTemplate(
+    "nda", "Non-Disclosure Agreement",
+    r"\bnda\b|\bnon[- ]?disclosure\b|\bconfidentiality agreement\b",
+    fields=[
+        Field("disclosing_party", "Acme Corporation", ("discloser", "company", "party_a", "first_party", "owner")),
+        Field("receiving_party", "Jordan Smith", ("recipient", "receiver", "party_b", "second_party", "contractor",
+                                                  "employee")),
+        Field("effective_date", today, ("date", "start_date")),
+        Field("purpose", "evaluating a potential business relationship between the parties",
+              ("business_purpose", "reason")),
+        Field("term", "two (2) years", ("duration", "confidentiality_period", "nda_term", "length")),
+        Field("governing_law", "the State of Delaware", ("state", "jurisdiction", "governing_state")),
+    ],
+    sections=[
+        Section("Parties", "This Non-Disclosure Agreement (the \"Agreement\") is entered into as of {effective_date} "
+                           "between **{disclosing_party}** (the \"Disclosing Party\") and **{receiving_party}** "
+                           "(the \"Receiving Party\")."),
+        Section("Purpose", "The Receiving Party will receive Confidential Information for the purpose of {purpose} "
+                           "(the \"Purpose\") and shall use it for no other purpose."),
+        Section("Confidential Information", "\"Confidential Information\" means all non-public business, technical, "
+                                            "financial and personal information disclosed by the Disclosing Party, in "
+                                            "any form, that is marked confidential or that a reasonable person would "
+                                            "understand to be confidential."),
+        Section("Exclusions", "Confidential Information does not include information that:\n\n"
+                              "1. is or becomes publicly available through no fault of the Receiving Party;\n\n"
+                              "2. was lawfully known to the Receiving Party before disclosure;\n\n"
+                              "3. is lawfully received from a third party without a duty of confidentiality; or\n\n"
+                              "4. is independently developed without use of the Confidential Information."),
+        Section("Obligations", "The Receiving Party shall hold the Confidential Information in strict confidence, "
+                               "protect it with at least reasonable care, and disclose it only to employees and advisers "
+                               "who need it for the Purpose and are bound by confidentiality duties at least as "
+                               "protective as this Agreement. Disclosure required by law is permitted after prompt "
+                               "written notice to the Disclosing Party, where lawful."),
+        Section("Term", "This Agreement remains in effect for {term} from the Effective Date. The Receiving Party's "
+                        "obligations survive for the same period after the Agreement ends, and indefinitely for trade "
+                        "secrets."),
+        Section("Return of Information", "On request or when the Purpose ends, the Receiving Party shall promptly "
+                                         "return or destroy all Confidential Information and confirm this in writing."),
+        Section("Remedies", "Unauthorized disclosure may cause irreparable harm, and the Disclosing Party is entitled to "
+                            "seek injunctive relief in addition to any other remedies available at law."),
+        Section("General", "This Agreement is governed by the laws of {governing_law}. It does not grant any license or "
+                           "ownership rights, is the entire agreement between the parties on its subject, and may be "
+                           "amended only in writing signed by both parties."),
+        Section("Signatures", signature_block(("Disclosing Party", "disclosing_party"),
+                                              ("Receiving Party", "receiving_party")), numbered=False),
+    ],
+)
+
+DEMAND_LETTER = DocumentTemplate(
+    "demand letter", "Demand Letter",
+    r"\bdemand letter\b|\bletter of demand\b|\bdemand for payment\b|\bpayment demand\b",
+    fields=[
+        Field("sender", "Jordan Smith", ("sender_name", "from", "creditor", "claimant", "your_name")),
+        Field("sender_address", "456 Oak Avenue, Austin, TX 78702", ("your_address", "from_address")),
+        Field("recipient", "Taylor Brown", ("recipient_name", "to", "debtor", "respondent")),
+        Field("recipient_address", "789 Pine Road, Austin, TX 78703", ("to_address", "debtor_address")),
+        Field("date", today, ("letter_date",)),
+        Field("amount", "$2,500", ("amount_owed", "amount_due", "sum", "debt"), is_money=True),
+        Field("reason", "unpaid invoices for services provided under our agreement",
+              ("basis", "claim", "description", "dispute", "issue")),
+        Field("deadline", "fourteen (14) days from the date of this letter", ("due_date", "response_deadline",
+                                                                               "payment_deadline")),
+    ],
+    sections=[
+        Section("Letter", "{date}\n\n{sender}\n{sender_address}\n\n{recipient}\n{recipient_address}\n\n"
+                          "**Re: Demand for Payment of {amount}**\n\nDear {recipient},", numbered=False),
+        Section("Amount Owed", "I am writing to formally demand payment of {amount}, which you owe me for {reason}. "
+                               "Despite previous requests, this amount remains unpaid."),
+        Section("Demand", "I request that you pay the full amount of {amount} within {deadline}. Please contact me at "
+                          "the address above to arrange payment or to discuss this matter."),
+        Section("Consequences of Non-Payment", "If I do not receive payment by that date, I intend to pursue all legal "
+                                               "remedies available to me, which may include filing a claim in court to "
+                                               "recover the amount owed, interest and costs, without further notice."),
+        Section("Signature", "This letter is sent in an effort to resolve this matter without litigation and is "
+                             "written without prejudice to my rights and remedies, all of which are reserved.\n\n"
+                             "Sincerely,\n\n______________________\n\n{sender}", numbered=False),
+    ],
+    headings=False,
+)
+
+CEASE_AND_DESIST = DocumentTemplate(
+    "cease and desist", "Cease and Desist Letter",
+    r"\bcease[- ]and[- ]desist\b|\bc&d\b",
+    fields=[
+        Field("sender", "Jordan Smith", ("sender_name", "from", "complainant", "your_name", "owner")),
+        Field("sender_address", "456 Oak Avenue, Austin, TX 78702", ("your_address", "from_address")),
+        Field("recipient", "Taylor Brown", ("recipient_name", "to", "infringer", "respondent")),
+        Field("recipient_address", "789 Pine Road, Austin, TX 78703", ("to_address",)),
+        Field("date", today, ("letter_date",)),
+        Field("activity", "using my copyrighted photographs on your website without permission",
+              ("conduct", "behavior", "behaviour", "infringement", "issue", "description", "violation")),
+        Field("rights", "my copyright and other intellectual property rights", ("legal_basis", "right", "basis")),
+        Field("deadline", "ten (10) days from the date of this letter", ("due_date", "response_deadline")),
+    ],
+    sections=[
+        Section("Letter", "{date}\n\n{sender}\n{sender_address}\n\n{recipient}\n{recipient_address}\n\n"
+                          "**Re: Demand to Cease and Desist**\n\nDear {recipient},", numbered=False),
+        Section("Unlawful Activity", "It has come to my attention that you have been {activity}. This conduct "
+                                     "violates {rights} and is causing me harm."),
+        Section("Demand", "I demand that you immediately cease and desist from this activity and, within {deadline}:\n\n"
+                          "1. stop all conduct described above;\n\n"
+                          "2. remove or destroy any materials connected with it; and\n\n"
+                          "3. confirm in writing that you have complied with this letter."),
+        Section("Consequences", "If you do not comply by that date, I am prepared to take legal action to protect my "
+                                "rights, which may include seeking an injunction, damages, and the costs of bringing "
+                                "the action, without further notice."),
+        Section("Signature", "Nothing in this letter waives any of my rights or remedies, all of which are expressly "
+                             "reserved.\n\nSincerely,\n\n______________________\n\n{sender}", numbered=False),
+    ],
+    headings=False,
+)
+
+# Checked in order; the first template whose pattern matches wins
+TEMPLATES = [CEASE_AND_DESIST, DEMAND_LETTER, NDA, RENTAL_AGREEMENT]
+
+
+def find_template(*texts):
+    """Template for the first text that names a known document type, or None"""
+    for text in texts:
+        if not text:
+            continue
+        for template in TEMPLATES:
+            if template.pattern.search(str(text)):
+                return template
+    return None
@@ -0,0 +1,121 @@
+"""
+Incremental markdown to DOCX rendering
+Renders generated documents paragraph by paragraph as text arrives
+"""
+
+import re
+
+from docx import Document
+
+NUMBERED_ITEM = re.compile(r'^\d+\.\s')
+# One pass over the text: bold-italic, then bold, then italic, leftmost match wins
+INLINE_MARKUP = re.compile(r'\*\*\*(.+?)\*\*\*|\*\*(.+?)\*\*|\*(.+?)\*', re.DOTALL)
+PARAGRAPH_BREAK = '\n\n'
+
+
+def inline_runs(text: str):
+    """Split text into (text, bold, italic) runs"""
+    position = 0
+    for match in INLINE_MARKUP.finditer(text):
+        if match.start() > position:
+            yield text[position:match.start()], False, False
+        bold_italic, bold, italic = match.groups()
+        if bold_italic is not None:
+            yield bold_italic, True, True
+        elif bold is not None:
+            # Italic spans nested inside bold
+            for run_text, _, run_italic in inline_runs(bold):
+                yield run_text, True, run_italic
+        else:
+            yield italic, False, True
+        position = match.end()
+    if position < len(text):
+        yield text[position:], False, False
+
+
+class DocxStreamRenderer:
+    """Builds a python-docx Document from markdown fed in arbitrary chunks.
+
+    Text is buffered only until the next blank line, so the full document
+    string never has to exist in memory; each completed paragraph is added
+    to the Document as soon as it is seen.
+    """
+
+    def __init__(self):
+        self.document = Document()
+        self.paragraphs = 0
+        self._pending = ''
+        self._style_ids = {}
+
+    def feed(self, chunk: str):
+        self._pending += chunk
+        *complete, self._pending = self._pending.split(PARAGRAPH_BREAK)
+        for para in complete:
+            self._render_paragraph(para)
+
+    def close(self):
+        if self._pending:
+            self._render_paragraph(self._pending)
+            self._pending = ''
+        if not self.paragraphs:
+            self.document.add_paragraph("Document content is empty or could not be generated.")
+        return self.document
+
+    def save(self, target):
+        """Write the finished document to a path or binary file-like object"""
+        self.close()
+        self.document.save(target)
+
+    def _add_paragraph(self, style_name: str = None):
+        """Add a paragraph, setting its style id directly.
+
+        Assigning paragraph.style by name makes python-docx rescan the whole
+        styles part on every call, which dominated build time on long
+        documents; the ids are resolved once per renderer instead.
+        """
+        p = self.document.add_paragraph()
+        if style_name:
+            if style_name not in self._style_ids:
+                self._style_ids[style_name] = self.document.styles[style_name].style_id
+            p._p.style = self._style_ids[style_name]
+        return p
+
+    def _render_paragraph(self, para: str):
+        if not para.strip():
+            return
+        self.paragraphs += 1
+
+        if para.startswith('**') and para.endswith('**') and len(para) >= 4:
+            self._add_paragraph().add_run(para[2:-2]).bold = True
+            return
+        if para.startswith('#'):
+            level = len(para) - len(para.lstrip('#'))
+            self._add_paragraph(f"Heading {min(level, 3)}").add_run(para.lstrip('#').strip())
+            return
+
+        text = para.strip()
+        if NUMBERED_ITEM.match(text):
+            p = self._add_paragraph('List Number')
+            text = NUMBERED_ITEM.sub('', text, count=1)
+        elif text.startswith('* ') or text.startswith('- '):
+            p = self._add_paragraph('List Bullet')
+            text = text[2:]
+        else:
+            p = self._add_paragraph()
+
+        for run_text, bold, italic in inline_runs(text):
+            if run_text:
+                run = p.add_run(run_text)
+                if bold:
+                    run.bold = True
+                if italic:
+                    run.italic = True
+
+
+def render_docx(chunks, target):
+    """Render an iterable of markdown chunks (or one string) into target"""
+    renderer = DocxStreamRenderer()
+    for chunk in ([chunks] if isinstance(chunks, str) else chunks):
+        renderer.feed(chunk)
+    renderer.save(target)
+    return renderer
@@ -0,0 +1,115 @@
+"""
+Conversation history compaction
+Bounds how much chat history is replayed into LLM prompts
+"""
+
+import json
+import threading
+
+CHARS_PER_TOKEN = 4
+# JSON framing per message when history was replayed as json.dumps(history, indent=2)
+MESSAGE_OVERHEAD_TOKENS = 25
+
+
+def estimate_tokens(text: str):
+    """Cheap token estimate (~4 characters per token for English prose)"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def message_text(message: dict):
+    """Text of a stored history message"""
+    parts = message.get("parts") or [{}]
+    return parts[0].get("text", "")
+
+
+def summarize_matches(payload: dict):
+    """One-line summary of a serialized search response"""
+    names = []
+    for lawyer in payload.get("matches") or []:
+        specialties = lawyer.get("specialties") or []
+        if isinstance(specialties, list):
+            specialties = ", ".join(specialties[:2])
+        names.append(f"{lawyer.get('name', 'N/A')} ({specialties})")
+    filters = {k: v for k, v in (payload.get("filters_applied") or {}).items() if k in (
+        "specialties", "licenseState", "location", "languages", "meetingTypes", "rating", "firm")}
+    summary = f"[Showed {len(names)} lawyer matches: {'; '.join(names) or 'none'}"
+    if filters:
+        summary += f" for filters {json.dumps(filters)}"
+    return summary + "]"
+
+
+def compact_text(text: str, max_chars: int):
+    """Replace match payloads with a summary and truncate anything else that is long"""
+    stripped = text.strip()
+    if stripped.startswith("{") and '"matches"' in stripped:
+        try:
+            return summarize_matches(json.loads(stripped))
+        except (ValueError, AttributeError):
+            pass
+    if len(text) > max_chars:
+        return text[:max_chars].rstrip() + " [...]"
+    return text
+
+
+class HistoryCompactor:
+    """Renders history for prompts within a token budget.
+
+    The last `keep_turns` messages are kept verbatim apart from match
+    payloads, which are always summarized; older messages are shortened to
+    `summary_chars`. If the result is still over `token_budget`, the oldest
+    lines are dropped (the latest message is always kept). Every call is
+    reported to the registered hooks as (call_site, original_tokens,
+    sent_tokens) so the savings can be measured.
+    """
+
+    def __init__(self, keep_turns: int = 6, token_budget: int = 2000, summary_chars: int = 200):
+        self.keep_turns = keep_turns
+        self.token_budget = token_budget
+        self.summary_chars = summary_chars
+        self.hooks = []
+        self.original_tokens = 0
+        self.sent_tokens = 0
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def compact(self, history: list, call_site: str = "default"):
+        """Return the compacted history as 'role: text' lines"""
+        recent_start = max(0, len(history) - self.keep_turns)
+        lines = []
+        for i, message in enumerate(history):
+            text = message_text(message)
+            max_chars = len(text) if i >= recent_start else self.summary_chars
+            lines.append(f"{message.get('role', 'user')}: {compact_text(text, max_chars)}")
+
+        # Drop the oldest lines by index, tracking the joined length instead of re-joining each time
+        start, chars = 0, sum(len(line) for line in lines) + len(lines) - 1
+        budget_chars = self.token_budget * CHARS_PER_TOKEN
+        while start < len(lines) - 1 and chars > budget_chars:
+            chars -= len(lines[start]) + 1
+            start += 1
+        rendered = "\n".join(lines[start:])
+
+        # What replaying the raw history would have cost, estimated per message without serializing it
+        original = sum(estimate_tokens(message_text(message)) + MESSAGE_OVERHEAD_TOKENS for message in history)
+        sent = estimate_tokens(rendered)
+        with self._lock:
+            self.calls += 1
+            self.original_tokens += original
+            self.sent_tokens += sent
+        for hook in self.hooks:
+            try:
+                hook(call_site, original, sent)
+            except Exception as e:
+                print(f"History compaction hook failed: {e}")
+        return rendered
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "original_tokens": self.original_tokens,
+            "sent_tokens": self.sent_tokens,
+            "tokens_saved": self.original_tokens - self.sent_tokens,
+        }
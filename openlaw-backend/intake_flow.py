@@ -0,0 +1,264 @@
+"""
+Got-letter intake flow engine
+Declarative steps with local extractors; a step is resolved without Gemini whenever its answer can be parsed
+"""
+
+import re
+import threading
+
+from tracing import Counter, register
+
+FLOW_STEPS = register(Counter(
+    "openlaw_flow_steps_total", "Intake flow turns by step and what resolved them", ("flow", "step", "resolved_by")
+))
+
+REFERENCE = re.compile(r"\b[A-Z]{2,4}\d{3,6}\b")
+REFERENCE_URL = re.compile(r"olaw\.io/([A-Za-z0-9]+)", re.I)
+EMAIL = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+PHONE = re.compile(r"(?<![\w(])\+?\(?\d[\d\s().-]{8,}\d(?!\w)")
+OTP = re.compile(r"(?<!\d)\d{4,6}(?!\d)")
+EXIT_PHRASES = r"(?:exit|stop|cancel|quit|no thanks|not now|salir|cancelar)"
+# Only a message that is nothing but an exit phrase ends the flow locally; "stop" inside a longer answer is left to Gemini
+EXIT = re.compile(rf"^\s*{EXIT_PHRASES}\W*$", re.I)
+MENTIONS_EXIT = re.compile(rf"\b{EXIT_PHRASES}\b", re.I)
+
+OUTCOMES = [
+    ("dismissal", re.compile(r"\bdismiss(?:al|ed)?\b|\bdrop(?:ped)?\b|\bthrown out\b|\bdesestim", re.I)),
+    ("settlement", re.compile(r"\bsettle(?:ment|d)?\b|\bacuerdo\b", re.I)),
+    ("win", re.compile(r"\bwin\b|\bwinning\b|\bganar\b", re.I)),
+    ("withdrawal", re.compile(r"\bwithdraw(?:n|al)?\b", re.I)),
+    ("reduced penalty", re.compile(r"\breduc(?:e|ed|tion)\b.*\b(?:fine|penalty|charge|sentence)s?\b", re.I)),
+]
+# Checked in order, so negations come before the words they contain
+URGENCY = [
+    ("low", re.compile(r"\bnot (?:very |that |too )?urgent\b|\bno rush\b|\blow\b|\bwhenever\b|\bbaja\b", re.I)),
+    ("high", re.compile(r"\bhigh\b|\burgent\b|\basap\b|\bemergency\b|\bimmediately\b|\btomorrow\b|\balta\b|\burgente\b", re.I)),
+    ("medium", re.compile(r"\bmedium\b|\bmoderate\b|\bsoon\b|\bnext (?:week|month)\b|\bmedia\b", re.I)),
+]
+LANGUAGES = [
+    ("Spanish", re.compile(r"\bspanish\b|\bespa[nñ]ol\b", re.I)),
+    ("English", re.compile(r"\benglish\b|\bingl[eé]s\b", re.I)),
+]
+# "I'm"/"I am"/"soy" open too many other answers ("I'm not sure") to introduce a name
+NAME_PREFIX = re.compile(r"\b(?:my name is|my name's|name:|me llamo)\s*", re.I)
+CONTACT_WORDS = re.compile(r"\b(?:email|e-mail|phone|number|mobile|cell|and|is|at|you|can|reach|call|text|me|my)\b", re.I)
+# Where a name ends: punctuation, or a full stop that doesn't follow an initial like "M."
+NAME_BREAK = re.compile(r"[,;!?\n]|(?<!\b\w)\.(?:\s|$)")
+SENTENCE_BREAK = re.compile(r"[!?]|(?<!\b\w)\.\s")
+# Words of conversational answers that are never part of a name
+COMMON_WORDS = {
+    "i", "i'm", "im", "am", "a", "an", "the", "in", "on", "of", "for", "to", "with", "not", "no", "yes", "ok", "okay",
+    "sure", "please", "thanks", "thank", "hi", "hello", "hurry", "busy", "here", "it", "this", "that", "just", "now",
+    "need", "want", "help", "know", "don't", "dont", "lawyer", "spanish", "english", "soy", "estoy", "por", "favor",
+}
+
+
+def first_match(patterns: list, text: str):
+    return next((value for value, pattern in patterns if pattern.search(text)), None)
+
+
+def extract_reference(text: str, data: dict):
+    url = REFERENCE_URL.search(text)
+    if url:
+        return {"reference_number": url.group(1).upper()}
+    match = REFERENCE.search(text.upper())
+    return {"reference_number": match.group()} if match else None
+
+
+def extract_outcome(text: str, data: dict):
+    outcome = first_match(OUTCOMES, text)
+    return {"outcome": outcome} if outcome else None
+
+
+def extract_urgency(text: str, data: dict):
+    urgency = first_match(URGENCY, text)
+    return {"urgency": urgency} if urgency else None
+
+
+def extract_language(text: str, data: dict):
+    language = first_match(LANGUAGES, text)
+    return {"language": language} if language else None
+
+
+def extract_name(text: str):
+    """A 2-4 word name, or None.
+
+    After "my name is" the name is the words up to the next break. Without
+    it, the message must be a single sentence holding nothing but the name
+    and contact details, like "Ana Lopez, ana@example.com", with the name
+    capitalized. Anything else is left to Gemini.
+    """
+    prefix = NAME_PREFIX.search(text)
+    if prefix:
+        rest = NAME_BREAK.split(PHONE.sub(",", EMAIL.sub(",", text[prefix.end():])))[0]
+    else:
+        rest = PHONE.sub(",", EMAIL.sub(",", text.strip()))
+        if SENTENCE_BREAK.search(rest):
+            return None
+        parts = [part for part in NAME_BREAK.split(rest) if CONTACT_WORDS.sub(" ", part).strip(" .:")]
+        if len(parts) != 1:
+            return None
+        rest = parts[0]
+    words = [word.strip(".") for word in re.split(r"[\s:]+", CONTACT_WORDS.sub(" ", rest)) if word.strip(".")]
+    if not prefix and not all(word[0].isupper() for word in words):
+        return None
+    if any(word.lower() in COMMON_WORDS for word in words):
+        return None
+    if 2 <= len(words) <= 4 and all(re.fullmatch(r"[A-Za-zÀ-ÿ'.-]+", word) for word in words):
+        return " ".join(word.capitalize() if word.islower() else word for word in words)
+    return None
+
+
+def extract_contact(text: str, data: dict):
+    found = {}
+    email = EMAIL.search(text)
+    if email:
+        found["email"] = email.group()
+    phone = PHONE.search(text)
+    if phone:
+        found["phone"] = re.sub(r"[^\d+]", "", phone.group())
+    name = extract_name(text)
+    # A bare pair of words is only taken as a name next to contact details or after "my name is"
+    if name and (found or "email" in data or "phone" in data or NAME_PREFIX.search(text)):
+        found["name"] = name
+    return found or None
+
+
+def extract_otp(text: str, data: dict):
+    match = OTP.search(PHONE.sub(" ", text))
+    return {"otp": match.group()} if match else None
+
+
+class Step:
+    """One question of a flow: the fields it fills, how to ask for them and how to parse the answer"""
+
+    def __init__(self, name: str, fields: tuple, question: str, extract, missing_question: dict = None,
+                 chained: bool = True):
+        self.name = name
+        self.fields = fields
+        self.question = question
+        self.extract = extract
+        self.missing_question = missing_question or {}
+        self.chained = chained  # False when the answer cannot be in the previous step's message
+
+    def missing(self, data: dict):
+        return [field for field in self.fields if not data.get(field)]
+
+
+class FlowEngine:
+    """Runs a flow's steps deterministically, deferring to an LLM only when extraction fails.
+
+    advance() returns the same result shape as the LLM handler, or None when
+    the turn needs the LLM (free text or off-topic). A resolved answer also
+    runs the following steps' extractors on the same message, so a user who
+    gives several answers at once skips those questions. Step numbers are
+    1-based positions in `steps`; one past the last step is completion.
+    """
+
+    def __init__(self, name: str, steps: list, completion_response: str, completion_message: str, exit_response: str):
+        self.name = name
+        self.steps = steps
+        self.completion_response = completion_response
+        self.completion_message = completion_message
+        self.exit_response = exit_response
+        self.local = {step.name: 0 for step in steps}
+        self.llm = {step.name: 0 for step in steps}
+        self._lock = threading.Lock()
+
+    def _count(self, step: Step, resolved_by: str):
+        with self._lock:
+            (self.local if resolved_by == "local" else self.llm)[step.name] += 1
+        FLOW_STEPS.inc(1, self.name, step.name, resolved_by)
+
+    @staticmethod
+    def _question(step: Step, data: dict):
+        missing = step.missing(data)
+        if 0 < len(missing) < len(step.fields):
+            return step.missing_question.get(missing[0], step.question)
+        return step.question
+
+    def advance(self, user_query: str, flow_context: dict):
+        """Apply one user turn to flow_context (in place); the step result, or None to use the LLM"""
+        number = flow_context.get('step', 1)
+        if not 1 <= number <= len(self.steps):
+            return None
+        step = self.steps[number - 1]
+        data = flow_context.setdefault('data', {})
+        text = user_query or ""
+
+        if EXIT.match(text):
+            self._count(step, "local")
+            return {'response': self.exit_response, 'should_end_flow': True, 'flow_context': flow_context}
+        if MENTIONS_EXIT.search(text):
+            self._count(step, "llm")
+            return None
+
+        extracted = step.extract(text, data)
+        if not extracted:
+            self._count(step, "llm")
+            return None
+        self._count(step, "local")
+        data.update(extracted)
+        if step.missing(data):
+            # Partly answered: ask only for what is still missing
+            return {'response': self._question(step, data), 'should_end_flow': False, 'flow_context': flow_context}
+
+        while number < len(self.steps):
+            number += 1
+            next_step = self.steps[number - 1]
+            more = next_step.chained and next_step.extract(text, data)
+            if not more:
+                break
+            data.update(more)
+            if next_step.missing(data):
+                break
+        else:
+            number = len(self.steps) + 1
+        flow_context['step'] = number
+
+        if number > len(self.steps):
+            return {'response': self.completion_response, 'should_end_flow': True,
+                    'completion_message': self.completion_message, 'flow_context': flow_context}
+        return {'response': self._question(self.steps[number - 1], data), 'should_end_flow': False,
+                'flow_context': flow_context}
+
+    def stats(self):
+        with self._lock:
+            return {
+                "llm_calls_avoided": sum(self.local.values()),
+                "steps": {step.name: {"local": self.local[step.name], "llm": self.llm[step.name]} for step in self.steps},
+            }
+
+
+GOT_LETTER_STEPS = [
+    Step("reference", ("reference_number",),
+         "Could you please provide the reference number from your OpenLaw letter? It's the code at the end of "
+         "the link, like https://olaw.io/YOUR_REFERENCE_NUMBER.",
+         extract_reference),
+    Step("outcome", ("outcome",), "Got it. What's the ideal outcome you want to achieve for your case?",
+         extract_outcome),
+    Step("urgency", ("urgency",), "How urgent is your case: high, medium or low?", extract_urgency),
+    Step("language", ("language",), "Which language do you prefer, English or Spanish?", extract_language),
+    Step("contact", ("name", "email", "phone"),
+         "Please share your full name, email and phone number so we can reach you.",
+         extract_contact,
+         missing_question={
+             "name": "Thanks! And what's your full name?",
+             "email": "Thanks! What email address should we use?",
+             "phone": "Thanks! What's the best phone number to reach you?",
+         }),
+    Step("otp", ("otp",), "We've sent a verification code to your phone. Please enter the 4-6 digit code.",
+         extract_otp, chained=False),
+]
+
+
+def got_letter_engine():
+    return FlowEngine(
+        "got-letter", GOT_LETTER_STEPS,
+        completion_response="Perfect! Your case has been successfully registered. Click here to check your newly created profile.",
+        completion_message="🎉 Welcome to OpenLaw! Your case profile has been created successfully. Our team will review "
+                           "your information and get back to you within 24 hours. You can track your case status in "
+                           "your new profile dashboard.",
+        exit_response="No problem! You can always come back to complete your case setup later. Is there anything else "
+                      "I can help you with regarding legal matters?",
+    )
@@ -0,0 +1,176 @@
+"""
+Local intent pre-classifier
+Answers high-confidence intents (English and Spanish) before paying for a Gemini call
+"""
+
+import json
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter
+
+LAWYER = r"(?:lawyer|attorney|abogad[oa]|licenciad[oa])s?"
+
+# (intent, confidence, pattern) - patterns run against normalize() output
+RULES = [
+    ("greeting", 0.97, re.compile(
+        r"^(?:hi+|hey+|hello+|hiya|howdy|yo|greetings|good (?:morning|afternoon|evening)|"
+        r"hola|buen(?:os|as)? (?:dias|tardes|noches)|saludos|que tal)"
+        r"(?: there| ola| everyone| amig[oa])?$")),
+    ("goodbye", 0.97, re.compile(
+        r"^(?:(?:ok(?:ay)? |thanks? |thank you )?(?:bye+|bye bye|goodbye|good bye|see you(?: later| soon)?|"
+        r"take care|have a (?:good|nice|great) (?:day|one|night)|later|cya|farewell)|"
+        r"(?:gracias )?(?:adios|hasta luego|hasta pronto|hasta manana|nos vemos|chao|chau|cuidate))"
+        r"(?: thanks?| thank you| gracias)?$")),
+    # A bare "thanks" often acknowledges an answer mid-conversation, so it scores below the default threshold
+    ("goodbye", 0.6, re.compile(
+        r"^(?:thanks?|thank you|thanks a lot|thank you so much|thx|ty|muchas gracias|gracias)$")),
+    # Falls through when a place follows ("lawyers nearby in Miami"), which Gemini turns into a location filter
+    ("near_me", 0.95, re.compile(
+        rf"\b{LAWYER}\b.*\b(?:near me|nearby|close to me|around me|near my location|"
+        rf"cerca de mi|cercan[oa]s?|por aqui)\b(?!.*\b(?:in|en)\b \w)")),
+    ("got-letter", 0.95, re.compile(r"\bolaw io\b")),
+    ("got-letter", 0.95, re.compile(
+        r"\b(?:got|get|received|receive|have|recibi|recibimos|tengo)\b.*\b(?:letter|notice|mail|carta|aviso)\b"
+        r".*\b(?:openlaw|open law)\b")),
+    ("draft_document", 0.92, re.compile(
+        r"^(?:please )?(?:can you |could you |would you |help me |i need to |i want to |i would like to |i d like to )?"
+        r"(?:draft|write|create|prepare|generate|make)(?: me| up)? (?:a |an |the |my )?"
+        r"(?:(?:simple|basic|legal|formal|new|written|rental|lease|residential|commercial|employment|service|sales|"
+        r"purchase|partnership|confidentiality|non disclosure|nondisclosure|demand|cease and desist|eviction) )*"
+        r"(?:agreement|contract|lease|letter|notice|nda|last will|will and testament|document|template|"
+        r"power of attorney|waiver|affidavit)s?\b")),
+    ("draft_document", 0.92, re.compile(
+        r"^(?:por favor )?(?:puedes |podrias |ayudame a |necesito |quiero )?"
+        r"(?:redactar|redacta|redactame|crear|crea|escribir|escribe|preparar|prepara|hacer|haz)(?:me)? (?:un |una |el |la |mi )?"
+        r"(?:contrato|acuerdo|carta|documento|testamento|poder|aviso|plantilla)s?\b")),
+]
+
+LOCAL_INTENTS = {intent for intent, _, _ in RULES}
+
+
+def normalize(text: str):
+    """Lowercase, strip accents and punctuation, collapse whitespace"""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+def tokenize(text: str):
+    return normalize(text).split()
+
+
+class BagOfWordsModel:
+    """Multinomial naive Bayes over unigrams, trained offline and loaded from JSON"""
+
+    def __init__(self, classes: list, log_priors: dict, log_likelihoods: dict, unseen_log_likelihood: dict):
+        self.classes = classes
+        self.log_priors = log_priors
+        self.log_likelihoods = log_likelihoods
+        self.unseen_log_likelihood = unseen_log_likelihood
+
+    @classmethod
+    def train(cls, examples: list, alpha: float = 1.0):
+        """Train from (text, intent) pairs; use intent "other" for queries Gemini should handle"""
+        class_counts = Counter(intent for _, intent in examples)
+        token_counts = {intent: Counter() for intent in class_counts}
+        for text, intent in examples:
+            token_counts[intent].update(tokenize(text))
+        vocab = set().union(*token_counts.values()) if token_counts else set()
+
+        log_priors, log_likelihoods, unseen = {}, {}, {}
+        for intent, count in class_counts.items():
+            log_priors[intent] = math.log(count / len(examples))
+            total = sum(token_counts[intent].values()) + alpha * (len(vocab) + 1)
+            log_likelihoods[intent] = {t: math.log((token_counts[intent][t] + alpha) / total) for t in vocab}
+            unseen[intent] = math.log(alpha / total)
+        return cls(sorted(class_counts), log_priors, log_likelihoods, unseen)
+
+    @classmethod
+    def load(cls, path: str):
+        with open(path, "r") as f:
+            return cls(**json.load(f))
+
+    def save(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.__dict__, f)
+
+    def predict(self, text: str):
+        """Return (intent, probability) for the most likely class"""
+        tokens = tokenize(text)
+        scores = {}
+        for intent in self.classes:
+            likelihoods = self.log_likelihoods[intent]
+            unseen = self.unseen_log_likelihood[intent]
+            scores[intent] = self.log_priors[intent] + sum(likelihoods.get(t, unseen) for t in tokens)
+        best = max(scores, key=scores.get)
+        norm = sum(math.exp(s - scores[best]) for s in scores.values())
+        return best, 1.0 / norm
+
+
+class IntentClassifier:
+    """Deterministic rules first, then the optional bag-of-words model.
+
+    classify() returns a parsed-intent dict shaped like parse_query_with_gemini
+    output when confidence clears the threshold, otherwise None so the caller
+    falls through to Gemini.
+    """
+
+    def __init__(self, threshold: float = 0.8, model: BagOfWordsModel = None, max_words: int = 40):
+        self.threshold = threshold
+        self.model = model
+        self.max_words = max_words
+        self.hits = Counter()
+        self.fallthroughs = 0
+        self._lock = threading.Lock()
+
+    def predict(self, query: str):
+        """Return (intent, confidence) or (None, 0.0)"""
+        text = normalize(query or "")
+        if not text or len(text.split()) > self.max_words:
+            return None, 0.0
+        for intent, confidence, pattern in RULES:
+            if pattern.search(text):
+                return intent, confidence
+        if self.model is not None:
+            intent, confidence = self.model.predict(text)
+            if intent in LOCAL_INTENTS:
+                return intent, confidence
+        return None, 0.0
+
+    def would_handle(self, query: str):
+        """Whether classify() would answer query locally, without counting it in the stats"""
+        intent, confidence = self.predict(query)
+        return intent is not None and confidence >= self.threshold
+
+    def classify(self, query: str):
+        intent, confidence = self.predict(query)
+        with self._lock:
+            if intent is None or confidence < self.threshold:
+                self.fallthroughs += 1
+                return None
+            self.hits[intent] += 1
+        return {"intent": intent, "confidence": confidence, "source": "local"}
+
+    def stats(self):
+        handled = sum(self.hits.values())
+        total = handled + self.fallthroughs
+        return {
+            "local_hits": dict(self.hits),
+            "fallthroughs": self.fallthroughs,
+            "local_rate": round(handled / total, 4) if total else 0.0,
+        }
+
+
+if __name__ == "__main__":
+    # Offline training: python intent_classifier.py labeled.jsonl model.json
+    # Each line is {"query": ..., "intent": ...}; label anything Gemini should handle as "other".
+    import sys
+
+    with open(sys.argv[1], "r") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    examples = [(r["query"], r.get("intent") if r.get("intent") in LOCAL_INTENTS else "other") for r in records]
+    BagOfWordsModel.train(examples).save(sys.argv[2])
+    print(f"Trained on {len(examples)} examples, saved to {sys.argv[2]}")
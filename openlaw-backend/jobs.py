@@ -0,0 +1,229 @@
+"""
+Background jobs
+Long document drafting and analysis run on an in-process worker pool, with status and results in a job table
+"""
+
+import copy
+import json
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from tracing import end_trace, start_trace
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+FINISHED = (DONE, FAILED)
+
+
+class InMemoryJobStore:
+    """Job table in this process only; status requests must reach the process that ran the job"""
+
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def create(self, job: dict):
+        with self._lock:
+            self._jobs[job["id"]] = copy.deepcopy(job)
+
+    def update(self, job_id: str, fields: dict):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(copy.deepcopy(fields))
+
+    def get(self, job_id: str):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return copy.deepcopy(job) if job else None
+
+    def delete_before(self, cutoff: float):
+        with self._lock:
+            for job_id in [job_id for job_id, job in self._jobs.items() if job["created_at"] < cutoff]:
+                del self._jobs[job_id]
+
+
+class SQLiteJobStore:
+    """Job table in a local SQLite file, shared by the worker processes of one host"""
+
+    COLUMNS = ("id", "kind", "status", "meta", "result", "error", "created_at", "started_at", "finished_at", "updated_at")
+    JSON_COLUMNS = ("meta", "result")
+
+    def __init__(self, path: str):
+        import sqlite3
+
+        self.path = path
+        self._local = threading.local()
+        self._sqlite3 = sqlite3
+        with self._connection() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, kind TEXT, status TEXT, meta TEXT, "
+                         "result TEXT, error TEXT, created_at REAL, started_at REAL, finished_at REAL, updated_at REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_created_at ON jobs (created_at)")
+
+    def _connection(self):
+        # sqlite3 connections can't be shared across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._sqlite3.connect(self.path, timeout=5)
+        return conn
+
+    def _encode(self, column: str, value):
+        return json.dumps(value) if column in self.JSON_COLUMNS and value is not None else value
+
+    def create(self, job: dict):
+        with self._connection() as conn:
+            conn.execute(f"INSERT INTO jobs VALUES ({', '.join('?' * len(self.COLUMNS))})",
+                         tuple(self._encode(column, job.get(column)) for column in self.COLUMNS))
+
+    def update(self, job_id: str, fields: dict):
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        with self._connection() as conn:
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?",
+                         tuple(self._encode(column, value) for column, value in fields.items()) + (job_id,))
+
+    def get(self, job_id: str):
+        row = self._connection().execute(
+            f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(self.COLUMNS, row))
+        for column in self.JSON_COLUMNS:
+            if job[column] is not None:
+                job[column] = json.loads(job[column])
+        return job
+
+    def delete_before(self, cutoff: float):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM jobs WHERE created_at < ?", (cutoff,))
+
+
+class FirestoreJobStore:
+    """Job table in a Firestore collection, visible to every instance of the service"""
+
+    def __init__(self, db, collection: str = "jobs"):
+        self.collection = db.collection(collection)
+
+    def create(self, job: dict):
+        self.collection.document(job["id"]).set(job)
+
+    def update(self, job_id: str, fields: dict):
+        self.collection.document(job_id).update(fields)
+
+    def get(self, job_id: str):
+        doc = self.collection.document(job_id).get()
+        return doc.to_dict() if doc.exists else None
+
+    def delete_before(self, cutoff: float):
+        # Left to a Firestore TTL policy on created_at; deleting here would need a query per submit
+        pass
+
+
+class JobQueue:
+    """Runs jobs on a bounded thread pool and records their progress in a job table.
+
+    A job is a callable returning a JSON-serializable result, so it cannot
+    move between processes: if its process stops first, the job stays
+    queued or running in the table and reads as failed once it has not
+    been updated for stale_after seconds.
+    """
+
+    def __init__(self, store, max_workers: int = 4, stale_after: float = 900, ttl: float = 24 * 3600,
+                 log: bool = True):
+        self.store = store
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self.stale_after = stale_after
+        self.ttl = ttl
+        self.log = log
+        self.outcomes = Counter()
+        self._events = {}  # job id -> threading.Event, for jobs of this process still in flight
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, fn, *args, meta: dict = None, job_id: str = None):
+        """Queue fn(*args) and return the new job's public view; job_id lets a caller record the id first"""
+        now = time.time()
+        job = {"id": job_id or uuid.uuid4().hex, "kind": kind, "status": QUEUED, "meta": meta or {}, "result": None,
+               "error": None, "created_at": now, "started_at": None, "finished_at": None, "updated_at": now}
+        try:
+            self.store.delete_before(now - self.ttl)
+        except Exception as e:
+            print(f"Error pruning jobs: {e}")
+        self.store.create(job)
+        with self._lock:
+            self._events[job["id"]] = threading.Event()
+            self.outcomes["submitted"] += 1
+        self.pool.submit(self._run, job["id"], kind, fn, args)
+        return self.public(job)
+
+    def _run(self, job_id: str, kind: str, fn, args):
+        try:
+            self._execute(job_id, kind, fn, args)
+        finally:
+            with self._lock:
+                event = self._events.pop(job_id, None)
+            if event is not None:
+                event.set()
+
+    def _execute(self, job_id: str, kind: str, fn, args):
+        started = time.time()
+        self.store.update(job_id, {"status": RUNNING, "started_at": started, "updated_at": started})
+        # Each job is traced like a request, so its stages show up in the logs and stage histograms
+        trace, token = start_trace(f"job:{kind}")
+        status = 500
+        try:
+            result = fn(*args)
+            status = 200
+            fields = {"status": DONE, "result": result}
+        except Exception as e:
+            print(f"Job {job_id} ({kind}) failed: {e!r}")
+            fields = {"status": FAILED, "error": str(e)}
+        finally:
+            trace.finish(status, self.log)
+            end_trace(token)
+        finished = time.time()
+        try:
+            self.store.update(job_id, {**fields, "finished_at": finished, "updated_at": finished})
+        except Exception as e:
+            # e.g. a result the table can't serialize; record the failure instead
+            print(f"Error recording result of job {job_id}: {e}")
+            fields = {"status": FAILED, "error": f"Could not store result: {e}"}
+            self.store.update(job_id, {**fields, "finished_at": finished, "updated_at": finished})
+        with self._lock:
+            self.outcomes[fields["status"]] += 1
+
+    def get(self, job_id: str):
+        """Public view of a job, or None if it doesn't exist (or has expired)"""
+        job = self.store.get(job_id)
+        return self.public(job) if job else None
+
+    def wait(self, job_id: str, timeout: float, poll_interval: float = 1.0):
+        """Block until the job finishes or timeout passes; its public view, or None if it doesn't exist"""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            event = self._events.get(job_id)
+        if event is not None:
+            event.wait(timeout)
+            return self.get(job_id)
+        # A job of another process: poll the table
+        while True:
+            job = self.get(job_id)
+            remaining = deadline - time.monotonic()
+            if job is None or job["status"] in FINISHED or remaining <= 0:
+                return job
+            time.sleep(min(poll_interval, remaining))
+
+    def public(self, job: dict):
+        view = {key: job.get(key) for key in ("id", "kind", "status", "created_at", "started_at", "finished_at")}
+        if job["status"] not in FINISHED and time.time() - (job.get("updated_at") or job["created_at"]) > self.stale_after:
+            view["status"] = FAILED
+            view["error"] = "The job was interrupted before it finished"
+        elif job["status"] == DONE:
+            view["result"] = job.get("result")
+        elif job["status"] == FAILED:
+            view["error"] = job.get("error")
+        return view
+
+    def stats(self):
+        with self._lock:
+            return {**{outcome: self.outcomes[outcome] for outcome in ("submitted", DONE, FAILED)},
+                    "in_flight": len(self._events)}
@@ -0,0 +1,71 @@
+"""
+Local PDF pre-processing
+Extracts text with PyPDF2 so text-based PDFs can be sent to Gemini as plain text
+"""
+
+import io
+
+from PyPDF2 import PdfReader, PdfWriter
+
+
+def prepare_pdf(data: bytes, page_budget: int = 50, min_chars_per_page: int = 200,
+                max_pages: int = None, chunk_pages: int = None):
+    """Decide how a PDF should be sent to Gemini.
+
+    Runs in a worker process, so it only takes and returns picklable values.
+    page_budget is how much of the document fits in a single request;
+    max_pages (defaulting to page_budget) is how much is read at all, so
+    callers that analyze in chunks can see past the single-request budget.
+    Returns a dict with:
+      kind        "text" when the PDF has a usable text layer, else "pdf" (scanned)
+      page_count  total pages in the document
+      pages_used  pages included after applying max_pages
+      truncated   whether pages_used is less than page_count
+      pages       extracted text per included page (text PDFs only)
+      data        first page_budget pages as a new PDF (scanned PDFs over budget only)
+      chunks      the included pages as PDFs of chunk_pages pages each (scanned PDFs
+                  over budget, when chunk_pages is given)
+    """
+    reader = PdfReader(io.BytesIO(data))
+    page_count = len(reader.pages)
+    pages_used = min(page_count, max_pages or page_budget)
+
+    pages = []
+    for page in reader.pages[:pages_used]:
+        try:
+            pages.append((page.extract_text() or "").strip())
+        except Exception:
+            pages.append("")
+
+    # Scanned PDFs have little or no text layer; sample the pages we read
+    extracted_chars = sum(len(text) for text in pages)
+    if pages_used and extracted_chars / pages_used >= min_chars_per_page:
+        return {"kind": "text", "page_count": page_count, "pages_used": pages_used, "pages": pages,
+                "truncated": pages_used < page_count}
+
+    truncated = None
+    chunks = None
+    if page_count > page_budget:
+        if chunk_pages:
+            chunks = [page_range(reader, start, min(start + chunk_pages, pages_used))
+                      for start in range(0, pages_used, chunk_pages)]
+        else:
+            truncated = page_range(reader, 0, page_budget)
+            pages_used = page_budget
+    return {"kind": "pdf", "page_count": page_count, "pages_used": pages_used, "data": truncated, "chunks": chunks,
+            "truncated": pages_used < page_count}
+
+
+def page_range(reader, start: int, stop: int):
+    """Pages [start, stop) of an open PdfReader as a new PDF"""
+    writer = PdfWriter()
+    for page in reader.pages[start:stop]:
+        writer.add_page(page)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def pages_as_text(pages: list, first_page: int = 1):
+    """Join extracted pages with page markers the model can cite"""
+    return "\n\n".join(f"--- Page {first_page + i} ---\n{text}" for i, text in enumerate(pages))
@@ -0,0 +1,122 @@
+"""
+Speculative request pipeline
+Starts a turn's session load and the work that probably follows it at the same time
+"""
+
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from session_store import KEEP
+from tracing import in_context
+
+
+def same_turns(a: list, b: list):
+    """True if two histories have the same roles and texts, i.e. render to the same prompts"""
+    if len(a) != len(b):
+        return False
+    return all(x.get("role") == y.get("role") and x.get("parts") == y.get("parts") for x, y in zip(a, b))
+
+
+class HistoryHints:
+    """Last known history tail of recently active chats in this process.
+
+    Only a prediction of what the next session load returns: speculative
+    work built from a hint is kept only if the authoritative load turns
+    out to match it exactly, so a stale hint (another instance wrote the
+    chat) costs a discarded call but never changes a reply.
+    """
+
+    def __init__(self, max_entries: int = 256, tail_turns: int = None):
+        self.max_entries = max_entries
+        self.tail_turns = tail_turns
+        self._entries = OrderedDict()  # chat_id -> (history, flow name)
+        self._lock = threading.Lock()
+
+    def _store(self, chat_id: str, history: list, flow_name):
+        if self.tail_turns:
+            history = history[-self.tail_turns:]
+        self._entries[chat_id] = (history, flow_name)
+        self._entries.move_to_end(chat_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, chat_id: str):
+        """(history, flow name) as last seen, or None"""
+        with self._lock:
+            entry = self._entries.get(chat_id)
+            return (list(entry[0]), entry[1]) if entry else None
+
+    def remember(self, chat_id: str, history: list, flow_context: dict):
+        """Record the result of a session load"""
+        with self._lock:
+            self._store(chat_id, list(history), (flow_context or {}).get("name"))
+
+    def extend(self, chat_id: str, turns: list, flow_context=KEEP):
+        """Record an append; a chat seen for the first time starts from an empty history"""
+        with self._lock:
+            history, flow_name = self._entries.get(chat_id, ([], None))
+            if flow_context is not KEEP:
+                flow_name = (flow_context or {}).get("name")
+            self._store(chat_id, history + list(turns), flow_name)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class Speculation:
+    """Work started before it is known to be needed; take() its result or discard() it"""
+
+    def __init__(self, pipeline, name: str, future, basis=None):
+        self.pipeline = pipeline
+        self.name = name
+        self.future = future
+        self.basis = basis  # what the work was computed from, for the caller to validate
+        self.done = False
+
+    def keep(self):
+        """Count the speculation as used and return its future (or asyncio task)"""
+        self.done = True
+        self.pipeline.count(self.name, "kept")
+        return self.future
+
+    def take(self, timeout: float = None):
+        return self.keep().result(timeout=timeout)
+
+    def discard(self):
+        if not self.done:
+            self.done = True
+            # Pool work that already started finishes in the background and is dropped;
+            # asyncio tasks are cancelled
+            self.future.cancel()
+            self.pipeline.count(self.name, "discarded")
+
+
+class RequestPipeline:
+    """Worker pool for a request's concurrent stages, with counts of speculation outcomes"""
+
+    def __init__(self, max_workers: int = 8):
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='pipeline')
+        self.outcomes = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args):
+        return self.pool.submit(in_context(fn), *args)
+
+    def speculate(self, name: str, fn, *args, basis=None):
+        return self.track(name, self.submit(fn, *args), basis)
+
+    def track(self, name: str, future, basis=None):
+        """Speculation for work already started elsewhere, e.g. an asyncio task"""
+        self.count(name, "started")
+        return Speculation(self, name, future, basis)
+
+    def count(self, name: str, outcome: str):
+        with self._lock:
+            counts = self.outcomes.setdefault(name, {"started": 0, "kept": 0, "discarded": 0})
+            counts[outcome] += 1
+
+    def stats(self):
+        with self._lock:
+            return {name: dict(counts) for name, counts in self.outcomes.items()}
+
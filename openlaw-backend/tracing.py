@@ -0,0 +1,238 @@
+"""
+Request tracing and metrics
+Per-request stage spans (Server-Timing header, one structured log line) and Prometheus-style histograms
+"""
+
+import bisect
+import contextlib
+import contextvars
+import json
+import threading
+import time
+from collections import defaultdict
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_current_trace = contextvars.ContextVar("trace", default=None)
+
+
+def _label_text(labels: tuple):
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return ",".join(f'{key}="{escape(value)}"' for key, value in labels)
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by label values, rendered in Prometheus text format"""
+
+    def __init__(self, name: str, help_text: str, label_names: tuple, buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}  # label values -> [count per bucket..., count over the last bound, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 3)
+            series[bisect.bisect_left(self.buckets, value)] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        for label_values, values in sorted(series.items()):
+            labels = tuple(zip(self.label_names, label_values))
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{_label_text(labels + (("le", bound),))}}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{_label_text(labels + (("le", "+Inf"),))}}} {values[-1]}')
+            lines.append(f"{self.name}_sum{{{_label_text(labels)}}} {values[-2]:.6f}")
+            lines.append(f"{self.name}_count{{{_label_text(labels)}}} {values[-1]}")
+        return "\n".join(lines)
+
+
+class Counter:
+    """Monotonic counter keyed by label values"""
+
+    def __init__(self, name: str, help_text: str, label_names: tuple):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float, *label_values):
+        with self._lock:
+            self._values[label_values] += amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for label_values, value in sorted(values.items()):
+            lines.append(f"{self.name}{{{_label_text(tuple(zip(self.label_names, label_values)))}}} {value:g}")
+        return "\n".join(lines)
+
+
+STAGE_SECONDS = Histogram("openlaw_stage_seconds", "Time spent in each request stage", ("stage",))
+REQUEST_SECONDS = Histogram("openlaw_request_seconds", "Request latency by route and intent", ("route", "intent"))
+LLM_CALL_SECONDS = Histogram("openlaw_llm_call_seconds", "Gemini call latency by call site", ("call_site",))
+LLM_TOKENS = Counter("openlaw_llm_tokens_total", "Gemini tokens by call site and direction", ("call_site", "kind"))
+METRICS = [STAGE_SECONDS, REQUEST_SECONDS, LLM_CALL_SECONDS, LLM_TOKENS]
+
+
+def register(metric):
+    """Add a metric defined elsewhere to the /metrics output"""
+    METRICS.append(metric)
+    return metric
+
+
+class Trace:
+    """Stage timings, tags and token counts collected while serving one request.
+
+    Stages are summed per name, so concurrent calls (e.g. the per-lawyer
+    explanations) can add up to more than the wall time of their parent stage.
+    """
+
+    def __init__(self, route: str):
+        self.route = route
+        self.started = time.perf_counter()
+        self.stages = defaultdict(float)
+        self.tags = {}
+        self.tokens = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def add_stage(self, name: str, seconds: float):
+        with self._lock:
+            self.stages[name] += seconds
+
+    def add_tokens(self, prompt: int, response: int):
+        with self._lock:
+            self.tokens["prompt"] += prompt
+            self.tokens["response"] += response
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self):
+        """Server-Timing header value: one metric per stage plus the total, in milliseconds"""
+        with self._lock:
+            stages = dict(self.stages)
+        entries = [f"{name.replace(':', '-')};dur={seconds * 1000:.1f}" for name, seconds in stages.items()]
+        entries.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(entries)
+
+    def finish(self, status: int, log: bool = True):
+        """Record the request histogram and print one structured log line"""
+        elapsed = self.elapsed()
+        REQUEST_SECONDS.observe(elapsed, self.route, self.tags.get("intent", "none"))
+        if log:
+            print(json.dumps({
+                "event": "request",
+                "route": self.route,
+                "status": status,
+                "duration_ms": round(elapsed * 1000, 1),
+                **self.tags,
+                "stages_ms": {name: round(seconds * 1000, 1) for name, seconds in self.stages.items()},
+                "llm_tokens": dict(self.tokens),
+            }))
+
+
+def start_trace(route: str):
+    trace = Trace(route)
+    return trace, _current_trace.set(trace)
+
+
+def end_trace(token=None):
+    try:
+        _current_trace.reset(token)
+    except (TypeError, ValueError):
+        # Token from another context (e.g. a streamed response finishing later)
+        _current_trace.set(None)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def set_tag(key: str, value):
+    """Attach a tag (e.g. the intent) to the current request's trace"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.tags[key] = value
+
+
+@contextlib.contextmanager
+def span(stage: str):
+    """Time a stage into the stage histogram and the current request's trace"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add_stage(stage, elapsed)
+
+
+def record_llm_call(call_site: str, seconds: float, response=None):
+    """Record a Gemini call's latency and token usage (from response.usage_metadata)"""
+    LLM_CALL_SECONDS.observe(seconds, call_site)
+    usage = getattr(response, "usage_metadata", None)
+    prompt_tokens = getattr(usage, "prompt_token_count", None) or 0
+    response_tokens = getattr(usage, "candidates_token_count", None) or 0
+    LLM_TOKENS.inc(prompt_tokens, call_site, "prompt")
+    LLM_TOKENS.inc(response_tokens, call_site, "response")
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_stage(f"llm:{call_site}", seconds)
+        trace.add_tokens(prompt_tokens, response_tokens)
+
+
+def render_metrics():
+    """All metrics in Prometheus text exposition format"""
+    return "\n".join(metric.render() for metric in METRICS) + "\n"
+
+
+def in_context(fn):
+    """Wrap fn to run in a copy of the caller's context, so worker threads report into its trace"""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+class ServerTimingMiddleware:
+    """ASGI middleware that traces each request like the Flask hooks in app.py"""
+
+    def __init__(self, app, route: str = None, log: bool = True):
+        self.app = app
+        self.route = route
+        self.log = log
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        trace, token = start_trace(self.route or scope["path"])
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"server-timing", trace.server_timing().encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            trace.finish(status, self.log)
+            end_trace(token)